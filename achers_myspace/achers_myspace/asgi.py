@@ -0,0 +1,18 @@
+"""
+ASGI config for achers_myspace project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Served by gunicorn with uvicorn workers when ``ACHERS_ASGI`` is set, see
+``gunicorn.conf.py``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "achers_myspace.settings.dev")
+
+application = get_asgi_application()
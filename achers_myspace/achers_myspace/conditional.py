@@ -0,0 +1,64 @@
+"""Conditional GET for Wagtail pages.
+
+Pages using ``ConditionalGetMixin`` send an ``ETag`` and ``Last-Modified``
+with their responses, and answer a request whose ``If-None-Match`` or
+``If-Modified-Since`` still matches with a 304 before ``get_context`` runs
+or the template renders. Pages build their validators from what they can
+get without queries, see ``get_etag()`` and ``get_last_modified()``.
+
+Cached responses keep their headers, ``ConditionalGetMiddleware`` answers
+conditional requests for page cache hits and for the other views.
+"""
+import hashlib
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts) -> str:
+    """Returns a strong ETag value for the given parts.
+
+    The hash of the static files manifest is mixed in, so pages refer to
+    the assets of the current deploy.
+    """
+    version = getattr(staticfiles_storage, "manifest_hash", "")
+    digest = hashlib.sha256(repr((version, *parts)).encode())
+    return quote_etag(digest.hexdigest()[:32])
+
+
+class ConditionalGetMixin:
+    """Serves a Wagtail page with validators, see the module docstring."""
+
+    def get_etag(self, request) -> str | None:
+        """Returns the quoted ETag of the response, see ``make_etag()``."""
+        return None
+
+    def get_last_modified(self, request):
+        """Returns when the content of the response last changed."""
+        return None
+
+    def serve(self, request, *args, **kwargs):
+        user = getattr(request, "user", None)
+        if request.method not in ("GET", "HEAD") or (
+            user is not None and user.is_authenticated
+        ):
+            # Editors get the userbar, their responses aren't the same
+            return super().serve(request, *args, **kwargs)
+
+        etag = self.get_etag(request)
+        last_modified = self.get_last_modified(request)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = super().serve(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+        if etag and not response.has_header("ETag"):
+            response["ETag"] = etag
+        if timestamp and not response.has_header("Last-Modified"):
+            response["Last-Modified"] = http_date(timestamp)
+        return response
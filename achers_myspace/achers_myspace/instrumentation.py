@@ -0,0 +1,400 @@
+"""Per-request cost accounting: SQL queries, template rendering and caches.
+
+``InstrumentationMiddleware`` counts the queries and database time of each
+request, times the template render and collects the cache hits and misses
+reported through ``cache_hit()``/``cache_miss()``. Requests are labelled
+with the Wagtail page type (``set_page()``) or the view name. The numbers go
+out as a ``Server-Timing`` header (when ``SERVER_TIMING`` is on) and a JSON
+log line on the ``achers_myspace.requests`` logger, are added to the
+``http_request_*``, ``db_*`` and ``cache_*`` metrics, and are kept on the
+response as ``response.request_stats`` for tests. Requests made inside
+``not_recorded()``, like the renders of a static export, are left out of
+the metrics.
+
+Pages and views declare how many queries a render may cost with a
+``query_budget`` attribute. Going over it logs a warning, and
+``achers_myspace.testing.QueryBudgetMixin`` turns it into a test failure.
+
+The stats of the psycopg connection pools, when production uses them, are
+recorded into the ``db_pool_*`` metrics after each request.
+"""
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger("achers_myspace.requests")
+
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Connections held by the pool, all of them (open) or the idle ones.",
+    ["alias", "state"],
+    multiprocess_mode="liveall",
+)
+DB_POOL_MAX_CONNECTIONS = Gauge(
+    "db_pool_max_connections", "Size limit of the pool.", ["alias"],
+    multiprocess_mode="liveall",
+)
+DB_POOL_WAITING = Gauge(
+    "db_pool_waiting_requests", "Requests waiting for a connection.",
+    ["alias"], multiprocess_mode="liveall",
+)
+DB_POOL_REQUESTS = Counter(
+    "db_pool_requests_total", "Connections asked of the pool.", ["alias"]
+)
+DB_POOL_QUEUED = Counter(
+    "db_pool_queued_requests_total",
+    "Requests that had to wait for a connection.",
+    ["alias"],
+)
+DB_POOL_WAIT = Counter(
+    "db_pool_wait_seconds_total",
+    "Time requests spent waiting for a connection.",
+    ["alias"],
+)
+DB_POOL_ERRORS = Counter(
+    "db_pool_errors_total",
+    "Requests that got no connection, mostly timeouts.",
+    ["alias"],
+)
+DB_POOL_CONNECTS = Counter(
+    "db_pool_connects_total", "Connections opened by the pool.", ["alias"]
+)
+DB_POOL_CONNECT_TIME = Counter(
+    "db_pool_connect_seconds_total",
+    "Time spent opening connections.",
+    ["alias"],
+)
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time to handle a request, by Wagtail page type or view.",
+    ["label", "method", "status"],
+)
+REQUEST_QUERIES = Counter(
+    "db_queries_total", "SQL queries run by requests.", ["label"]
+)
+REQUEST_DB_TIME = Counter(
+    "db_query_seconds_total", "Time requests spent in SQL queries.", ["label"]
+)
+REQUEST_RENDER_TIME = Counter(
+    "template_render_seconds_total",
+    "Time requests spent rendering templates.",
+    ["label"],
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total",
+    "Lookups of the page cache, the wall index, the home page sidebar "
+    "and search results.",
+    ["cache", "outcome"],
+)
+# Other methods are counted together, so a scan can't add label values
+METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+# Queries kept of a request whose SQL is recorded, see RequestStats.sql
+MAX_RECORDED_QUERIES = 1000
+
+_current = ContextVar("request_stats", default=None)
+_recorded = ContextVar("record_metrics", default=True)
+
+
+class RequestStats:
+    """What one request cost."""
+
+    def __init__(self):
+        self.label = "other"
+        self.query_budget = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.duration = 0.0
+        # A list of (seconds, sql) to record the queries in, see profiling
+        self.sql = None
+        self._render_started = None
+
+    @property
+    def over_budget(self) -> bool:
+        budget = self.query_budget
+        return budget is not None and self.queries > budget
+
+    def as_dict(self) -> dict:
+        return {
+            "label": self.label,
+            "queries": self.queries,
+            "query_budget": self.query_budget,
+            "db_ms": round(self.db_time * 1000, 2),
+            "render_ms": round(self.render_time * 1000, 2),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "total_ms": round(self.duration * 1000, 2),
+        }
+
+    def server_timing(self) -> str:
+        """Returns the value of the ``Server-Timing`` header."""
+        return ", ".join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f"render;dur={self.render_time * 1000:.1f}",
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+            f"total;dur={self.duration * 1000:.1f}",
+        ])
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.db_time += elapsed
+            self.queries += 1
+            if self.sql is not None and len(self.sql) < MAX_RECORDED_QUERIES:
+                self.sql.append((elapsed, sql))
+
+
+def current() -> RequestStats | None:
+    """Returns the stats of the request being handled, if any."""
+    return _current.get()
+
+
+@contextmanager
+def not_accounted():
+    """Leaves the queries of the block out of the current request's stats."""
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def not_recorded():
+    """Leaves the requests of the block out of the metrics, they aren't
+    served to visitors."""
+    token = _recorded.set(False)
+    try:
+        yield
+    finally:
+        _recorded.reset(token)
+
+
+def cache_hit(cache: str) -> None:
+    if _recorded.get():
+        CACHE_LOOKUPS.labels(cache=cache, outcome="hit").inc()
+    stats = _current.get()
+    if stats is not None:
+        stats.cache_hits += 1
+
+
+def cache_miss(cache: str) -> None:
+    if _recorded.get():
+        CACHE_LOOKUPS.labels(cache=cache, outcome="miss").inc()
+    stats = _current.get()
+    if stats is not None:
+        stats.cache_misses += 1
+
+
+def set_page(request, page) -> None:
+    """Labels the request with a Wagtail page type and takes its budget."""
+    stats = getattr(request, "request_stats", None)
+    if stats is not None:
+        stats.label = type(page).__name__
+        stats.query_budget = getattr(page, "query_budget", None)
+
+
+def _account_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats.execute_wrapper(execute, sql, params, many, context)
+
+
+def install_query_wrapper(connection, **kwargs) -> None:
+    """Counts the queries of ``connection`` towards the current request.
+
+    Connections belong to a thread, and under ASGI the sync parts of a
+    request run in another thread than the middleware. The wrapper stays on
+    the connection and finds the request through the context variable,
+    which asgiref carries over to those threads.
+    """
+    if _account_query not in connection.execute_wrappers:
+        # First, as connection.execute_wrapper() pops the last one on exit
+        connection.execute_wrappers.insert(0, _account_query)
+
+
+class InstrumentationMiddleware:
+    """Records the cost of each request, see the module docstring.
+
+    Should come first, so page cache hits are counted too. Runs in both
+    WSGI and ASGI deployments.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        # New connections get the wrapper from the connection_created signal
+        for connection in connections.all(initialized_only=True):
+            install_query_wrapper(connection)
+        connection_created.connect(
+            install_query_wrapper, dispatch_uid="instrumentation"
+        )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = request.request_stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stats.duration = time.perf_counter() - started
+            _current.reset(token)
+        return self.finish(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = request.request_stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stats.duration = time.perf_counter() - started
+            _current.reset(token)
+        return self.finish(request, response, stats)
+
+    def finish(self, request, response, stats):
+        if response.get("X-Page-Cache") == "HIT":
+            stats.label = "cached"
+        response.request_stats = stats
+        if settings.SERVER_TIMING:
+            response["Server-Timing"] = stats.server_timing()
+        self.log(request, response, stats)
+        record_metrics(request, response, stats)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.request_stats.label = getattr(
+            view_func, "__name__", type(view_func).__name__
+        )
+        request.request_stats.query_budget = getattr(
+            view_func, "query_budget", None
+        )
+
+    def process_template_response(self, request, response):
+        # Django renders the response right after this hook returns
+        stats = request.request_stats
+        stats._render_started = time.perf_counter()
+        response.add_post_render_callback(
+            lambda rendered: _render_finished(stats)
+        )
+        return response
+
+    def log(self, request, response, stats):
+        message = (
+            f"{request.method} {request.path} {response.status_code} "
+            f"{stats.label} {stats.duration * 1000:.1f}ms "
+            f"{stats.queries} queries"
+        )
+        extra = {"request_stats": stats.as_dict()}
+        if stats.over_budget:
+            logger.warning(
+                f"{message} (over the budget of {stats.query_budget})",
+                extra=extra,
+            )
+        else:
+            logger.info(message, extra=extra)
+
+
+def record_metrics(request, response, stats) -> None:
+    if not _recorded.get():
+        return
+    method = request.method if request.method in METHODS else "other"
+    REQUEST_DURATION.labels(
+        label=stats.label,
+        method=method,
+        status=f"{response.status_code // 100}xx",
+    ).observe(stats.duration)
+    REQUEST_QUERIES.labels(label=stats.label).inc(stats.queries)
+    REQUEST_DB_TIME.labels(label=stats.label).inc(stats.db_time)
+    REQUEST_RENDER_TIME.labels(label=stats.label).inc(stats.render_time)
+    record_pool_stats()
+
+
+def _render_finished(stats):
+    if stats._render_started is not None:
+        stats.render_time += time.perf_counter() - stats._render_started
+        stats._render_started = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object, with the request stats inlined."""
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **getattr(record, "request_stats", {}),
+        }
+        return json.dumps(data)
+
+
+def connection_pools() -> dict:
+    """Returns the connection pools open in this process by alias."""
+    pools = {}
+    for alias in settings.DATABASES:
+        connection = connections[alias]
+        # Reading connection.pool would create the pool
+        pool = getattr(type(connection), "_connection_pools", {}).get(alias)
+        if pool is not None:
+            pools[alias] = pool
+    return pools
+
+
+def record_pool_stats() -> None:
+    """Records the stats of the connection pools of this process, which
+    only it can read."""
+    for alias, pool in connection_pools().items():
+        # Counters are reset by pop_stats(), so they are added up here
+        stats = pool.pop_stats()
+        DB_POOL_CONNECTIONS.labels(alias=alias, state="open").set(
+            stats.get("pool_size", 0)
+        )
+        DB_POOL_CONNECTIONS.labels(alias=alias, state="idle").set(
+            stats.get("pool_available", 0)
+        )
+        DB_POOL_MAX_CONNECTIONS.labels(alias=alias).set(
+            stats.get("pool_max", 0)
+        )
+        DB_POOL_WAITING.labels(alias=alias).set(
+            stats.get("requests_waiting", 0)
+        )
+        DB_POOL_REQUESTS.labels(alias=alias).inc(stats.get("requests_num", 0))
+        DB_POOL_QUEUED.labels(alias=alias).inc(
+            stats.get("requests_queued", 0)
+        )
+        DB_POOL_WAIT.labels(alias=alias).inc(
+            stats.get("requests_wait_ms", 0) / 1000
+        )
+        DB_POOL_ERRORS.labels(alias=alias).inc(
+            stats.get("requests_errors", 0)
+        )
+        DB_POOL_CONNECTS.labels(alias=alias).inc(
+            stats.get("connections_num", 0)
+        )
+        DB_POOL_CONNECT_TIME.labels(alias=alias).inc(
+            stats.get("connections_ms", 0) / 1000
+        )
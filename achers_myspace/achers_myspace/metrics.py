@@ -0,0 +1,107 @@
+"""Application metrics, kept by prometheus_client.
+
+The metrics are prometheus_client's ``Counter``, ``Gauge`` and
+``Histogram``, defined in the modules that update them.
+
+Gunicorn workers don't share memory. With ``PROMETHEUS_MULTIPROC_DIR`` set,
+which gunicorn.conf.py does, the client keeps the values of each process in
+files there, and ``exposition()`` adds up the files of all processes, so
+``/metrics`` shows the whole of gunicorn whichever worker answers the
+scrape. Gauges are kept per process, with a ``pid`` label, and dropped by
+``mark_process_dead()`` when their process exits, see gunicorn.conf.py.
+Without the directory ``/metrics`` only shows the process answering.
+
+Processes outside gunicorn, like the ``run_jobs`` worker and the processes
+of a static export, call ``set_process_group()`` to keep their files in a
+subdirectory, which gunicorn leaves alone when it starts. ``/metrics`` adds
+them up with the rest.
+"""
+import atexit
+import glob
+import os
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    generate_latest,
+    multiprocess,
+)
+
+DIRECTORY_ENV = "PROMETHEUS_MULTIPROC_DIR"
+# Inherited by the processes a process starts, see set_process_group()
+GROUP_ENV = "ACHERS_METRICS_GROUP"
+
+
+def metrics_dir() -> str:
+    """Returns the directory this process keeps its values in, or "" when
+    they are kept in memory."""
+    return os.environ.get(DIRECTORY_ENV, "")
+
+
+def shared_dir() -> str:
+    """Returns the directory of the gunicorn workers, which holds those of
+    the process groups."""
+    directory = metrics_dir()
+    if directory and os.environ.get(GROUP_ENV):
+        return os.path.dirname(directory)
+    return directory
+
+
+def set_process_group(name: str) -> None:
+    """Keeps the files of this process, and of the processes it starts, in
+    the subdirectory ``name``.
+
+    Must be called before a metric is updated.
+    """
+    directory = metrics_dir()
+    if not directory or os.environ.get(GROUP_ENV):
+        # Not shared, or in the group of the process that started this one
+        return
+    directory = os.path.join(directory, name)
+    os.makedirs(directory, exist_ok=True)
+    os.environ[GROUP_ENV] = name
+    os.environ[DIRECTORY_ENV] = directory
+    atexit.register(mark_process_dead, os.getpid(), directory)
+
+
+def mark_process_dead(pid: int, directory: str) -> None:
+    """Drops the gauges of an exited process, its counters and histograms
+    keep counting."""
+    multiprocess.mark_process_dead(pid, directory)
+
+
+def clear_directory(directory: str) -> None:
+    """Removes the files of earlier runs, when the server starts.
+
+    The subdirectories of process groups are left, they belong to processes
+    that keep running.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "*.db")):
+        os.remove(path)
+
+
+class ProcessFilesCollector:
+    """Adds up the files of the processes in ``directory`` and in the
+    subdirectories of its process groups."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def collect(self):
+        files = [
+            *glob.glob(os.path.join(self.directory, "*.db")),
+            *glob.glob(os.path.join(self.directory, "*", "*.db")),
+        ]
+        return multiprocess.MultiProcessCollector.merge(files)
+
+
+def exposition(directory: str | None = None) -> bytes:
+    """Returns the metrics of all processes sharing the directory, or of
+    this process when there is none, in the Prometheus text format."""
+    directory = shared_dir() if directory is None else directory
+    if not directory:
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    registry.register(ProcessFilesCollector(directory))
+    return generate_latest(registry)
@@ -0,0 +1,239 @@
+"""Full-response cache for pages served to anonymous visitors.
+
+Responses for HomePage and BlogPage (including the ``?after=``/``?before=``
+cursor and ``?tag=`` variants of the wall) and the feeds of the wall are
+stored in the ``pages`` cache, keyed on the path plus the normalized query
+string. Publishing a post purges exactly the keys it affects: the post
+itself, the pages of the wall (and of its tags) next to the position that
+changed and the feeds of those lists.
+"""
+import hashlib
+import logging
+from urllib.parse import urlencode
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+
+from achers_myspace import instrumentation
+from achers_myspace.pagination import canonical_cursor, encode_cursor
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE_ALIAS = "pages"
+
+# Query parameters that select a variant of a page. Requests with any other
+# parameter are never cached.
+VARY_ON_PARAMS = ("after", "before", "tag")
+CURSOR_PARAMS = ("after", "before")
+
+
+def get_cache():
+    return caches[PAGE_CACHE_ALIAS]
+
+
+def normalize_query(params) -> str | None:
+    """Returns a canonical query string, or None if it can't be cached."""
+    if any(name not in VARY_ON_PARAMS for name in params):
+        return None
+    normalized = {}
+    for name in VARY_ON_PARAMS:
+        values = params.getlist(name)
+        if len(values) > 1:
+            return None
+        if not values or values[0] == "":
+            continue
+        normalized[name] = values[0]
+
+    cursors = [name for name in CURSOR_PARAMS if name in normalized]
+    if len(cursors) > 1:
+        return None
+    for name in cursors:
+        normalized[name] = canonical_cursor(normalized[name])
+        if normalized[name] is None:
+            return None
+    return urlencode(sorted(normalized.items()))
+
+
+def make_key(path: str, query: str = "") -> str:
+    """Returns the cache key for a path and a normalized query string."""
+    digest = hashlib.md5(f"{path}?{query}".encode()).hexdigest()
+    return f"pagecache:{digest}"
+
+
+def request_key(request, user=None) -> str | None:
+    """Returns the cache key for a request, or None if it can't be cached.
+
+    ``user`` defaults to ``request.user``, pass the result of
+    ``request.auser()`` in async code.
+    """
+    if request.method != "GET":
+        return None
+    if user is None:
+        user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return None
+    query = normalize_query(request.GET)
+    if query is None:
+        return None
+    return make_key(request.path, query)
+
+
+def allow(request) -> None:
+    """Marks the response to this request as safe to store."""
+    request._page_cache_allowed = True
+
+
+def skip(request) -> None:
+    """Keeps the response to this request out of the cache."""
+    request._page_cache_allowed = False
+
+
+def is_cacheable_response(response) -> bool:
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and "private" not in response.get("Cache-Control", "")
+        and "no-store" not in response.get("Cache-Control", "")
+    )
+
+
+def purge_urls(urls) -> None:
+    """Drops the cached responses for ``(path, query)`` pairs."""
+    keys = [make_key(path, query) for path, query in urls]
+    get_cache().delete_many(keys)
+    logger.debug(f"Purged {len(keys)} cached page(s)")
+
+
+def purge_all() -> None:
+    get_cache().clear()
+
+
+def wall_urls(home_path: str, tag: str | None, change: dict, keys=()):
+    """Yields the wall pages touched by a change recorded by the wall.
+
+    ``keys`` are the current keys of the list, only used when the change
+    may have touched every page.
+    """
+    def url(**params):
+        if tag:
+            params["tag"] = tag
+        return home_path, urlencode(sorted(params.items()))
+
+    if change.get("all"):
+        first_page, after, before = True, keys, keys
+    else:
+        first_page = change["first_page"]
+        after, before = change["after"], change["before"]
+    if first_page:
+        yield url()
+    for key in after:
+        yield url(after=encode_cursor(key))
+    for key in before:
+        yield url(before=encode_cursor(key))
+
+
+def purge_post(page) -> list[tuple] | None:
+    """Purges a BlogPage and the pages and feeds of the wall it changed.
+
+    Returns the purged ``(path, query)`` pairs, or None when every page was
+    purged.
+    """
+    from blog.feeds import feed_urls
+    from home import wall
+
+    urls = []
+    _, _, page_path = page.get_url_parts() or (None, None, None)
+    if page_path:
+        urls.append((page_path, ""))
+
+    changes = wall.pop_changes(page.pk)
+    if changes.pop(wall.TAGS_CHANGED, False):
+        # The tag list shows up on every page of the wall
+        purge_all()
+        return None
+    if changes:
+        home = page.get_parent().specific
+        _, _, home_path = home.get_url_parts() or (None, None, None)
+        for name in changes:
+            urls.extend(feed_urls(wall.list_tag(name)))
+        if home_path:
+            for name, change in changes.items():
+                tag = wall.list_tag(name)
+                keys = []
+                if change.get("all"):
+                    keys = wall.get_post_keys(home.pk, tag)
+                urls.extend(wall_urls(home_path, tag, change, keys))
+    purge_urls(urls)
+    return urls
+
+
+class PageCacheMiddleware:
+    """Serves and stores full responses of cacheable Wagtail pages.
+
+    Must come after AuthenticationMiddleware. Pages opt in per request
+    through ``allow()``, see the ``before_serve_page`` hook in the blog app.
+    Under ASGI a hit is served without leaving the event loop, as far as
+    the cache backend allows.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        key = request_key(request)
+        if key is None:
+            return self.get_response(request)
+
+        response = get_cache().get(key)
+        if response is not None:
+            return self.hit(response)
+        instrumentation.cache_miss("page")
+
+        response = self.get_response(request)
+        if self.should_store(request, response):
+            get_cache().set(key, response, settings.PAGE_CACHE_TIMEOUT)
+            response["X-Page-Cache"] = "MISS"
+        return response
+
+    async def __acall__(self, request):
+        key = None
+        if request.method == "GET":
+            user = AnonymousUser()
+            if settings.SESSION_COOKIE_NAME in request.COOKIES:
+                # request.user would load the session synchronously
+                user = await request.auser()
+            key = request_key(request, user)
+        if key is None:
+            return await self.get_response(request)
+
+        response = await get_cache().aget(key)
+        if response is not None:
+            return self.hit(response)
+        instrumentation.cache_miss("page")
+
+        response = await self.get_response(request)
+        if self.should_store(request, response):
+            await get_cache().aset(key, response, settings.PAGE_CACHE_TIMEOUT)
+            response["X-Page-Cache"] = "MISS"
+        return response
+
+    def hit(self, response):
+        instrumentation.cache_hit("page")
+        response["X-Page-Cache"] = "HIT"
+        return response
+
+    def should_store(self, request, response) -> bool:
+        return (
+            getattr(request, "_page_cache_allowed", False)
+            and is_cacheable_response(response)
+        )
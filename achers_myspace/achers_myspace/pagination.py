@@ -0,0 +1,129 @@
+"""Keyset (cursor) pagination over sorted key lists.
+
+Pages are addressed with opaque cursors (``?after=``/``?before=``) holding
+the sort key of the item next to the page, instead of a page number. Finding
+a page is a binary search over the sorted keys, there is no COUNT and no
+OFFSET, and publishing a post only changes the pages right around it.
+"""
+import base64
+import bisect
+import json
+from collections.abc import Sequence
+
+
+def encode_cursor(key: tuple) -> str:
+    """Returns the opaque cursor for a sort key."""
+    data = json.dumps(list(key), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str | None) -> tuple | None:
+    """Returns the sort key of a cursor, or None if it isn't valid."""
+    if not cursor:
+        return None
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json.loads(data)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(key, list) or not key or not all(
+        isinstance(part, (int, bool)) for part in key
+    ):
+        return None
+    return tuple(key)
+
+
+def canonical_cursor(cursor: str | None) -> str | None:
+    """Returns the canonical form of a cursor, or None if it isn't valid."""
+    key = decode_cursor(cursor)
+    return encode_cursor(key) if key is not None else None
+
+
+class KeysetPage(Sequence):
+    """A page of items, with cursors for the pages next to it.
+
+    Quacks enough like Django's ``Page`` for ``{% for %}`` and
+    ``has_other_pages`` checks. ``total`` is None when not counted, and
+    ``total_is_estimate`` is set when it is only a lower bound.
+    """
+
+    def __init__(self, object_list, start, next_cursor, previous_cursor,
+                 has_next, has_previous, total=None,
+                 total_is_estimate=False):
+        self.object_list = object_list
+        self.start = start
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.total = total
+        self.total_is_estimate = total_is_estimate
+
+    def __repr__(self):
+        return f"<KeysetPage from {self.start_index()}>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def start_index(self):
+        return self.start + 1 if self.object_list else 0
+
+    def end_index(self):
+        return self.start + len(self.object_list)
+
+
+def paginate_keys(keys: list, per_page: int, after: tuple | None = None,
+                  before: tuple | None = None, total=None,
+                  total_is_estimate=False) -> KeysetPage:
+    """Returns the page of ``keys`` (sorted ascending) next to a cursor key.
+
+    Without a cursor the first page is returned. A previous page that is the
+    first page gets no cursor, so links to it point at the plain URL.
+    """
+    if after is not None:
+        start = bisect.bisect_right(keys, after)
+        end = min(start + per_page, len(keys))
+    elif before is not None:
+        end = bisect.bisect_left(keys, before)
+        start = max(end - per_page, 0)
+    else:
+        start, end = 0, min(per_page, len(keys))
+
+    page_keys = keys[start:end]
+    has_next = end < len(keys)
+    has_previous = start > 0
+    next_cursor = encode_cursor(page_keys[-1]) if has_next else None
+    previous_cursor = None
+    if has_previous and start > per_page:
+        previous_cursor = encode_cursor(keys[start])
+    return KeysetPage(
+        page_keys, start, next_cursor, previous_cursor, has_next,
+        has_previous, total, total_is_estimate,
+    )
+
+
+def page_number_cursor(keys: list, per_page: int, number) -> str | None:
+    """Returns the ``after`` cursor of an old-style ``?page=`` number.
+
+    The first page (and anything that isn't a valid page) has no cursor.
+    """
+    try:
+        number = int(number)
+    except (TypeError, ValueError):
+        return None
+    start = min((number - 1) * per_page, (len(keys) - 1) // per_page * per_page)
+    if start <= 0:
+        return None
+    return encode_cursor(keys[start - 1])
@@ -0,0 +1,305 @@
+"""Opt-in profiling of slow and sampled requests.
+
+With ``PROFILING`` on, ``ProfilingMiddleware`` keeps a profile of every
+request slower than ``PROFILE_SLOW_MS`` and of a ``PROFILE_SAMPLE_RATE``
+fraction of all requests, with the SQL they ran, as rows of the profiling
+app's ``RequestProfile`` listed under Settings → Request profiles in the
+admin.
+
+Requests that aren't sampled only have their time taken. Once one has run
+for ``PROFILE_SLOW_MS``, one thread per process starts sampling its stack
+every ``PROFILE_INTERVAL_MS``, so the profile of a slow request shows where
+the time went past the threshold, without its SQL. That thread sleeps
+while no request in flight is past the threshold, so fast requests cost a
+few dictionary updates. Sampled requests are sampled from the start, with
+their SQL. The samples are stored as collapsed stacks, which flamegraph.pl,
+speedscope and inferno draw as flame graphs. With ``PROFILE_CPROFILE`` on, sampled
+requests run under cProfile instead and can be downloaded as pstats files
+for snakeviz or flameprof. Only one profiler can run in a process at a
+time, so a sampled request that overlaps another one under cProfile, in
+another thread of the worker, has its stack sampled instead.
+
+With ``PROFILING`` off the middleware takes itself out of the stack, and
+requests pay nothing. It only handles sync requests: under ASGI Django runs
+it, and the views below it, in a thread.
+"""
+import cProfile
+import io
+import logging
+import marshal
+import math
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from functools import cache
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from achers_myspace import instrumentation
+
+logger = logging.getLogger(__name__)
+
+# Lines of the summary of a profile
+SUMMARY_LINES = 30
+
+
+@cache
+def _path_prefixes() -> tuple[str, ...]:
+    prefixes = {os.path.join(path, "") for path in sys.path if path}
+    return tuple(sorted(prefixes, key=len, reverse=True))
+
+
+def frame_label(code) -> str:
+    """Returns a frame of a collapsed stack, the function and where it is."""
+    filename = code.co_filename
+    for prefix in _path_prefixes():
+        if filename.startswith(prefix):
+            filename = filename[len(prefix):]
+            break
+    # Semicolons separate the frames of a stack
+    return f"{code.co_qualname} ({filename}:{code.co_firstlineno})".replace(
+        ";", ","
+    )
+
+
+class Capture:
+    """The stack samples of one request, keyed on tuples of code objects,
+    taken from ``sample_after`` on (a ``time.perf_counter()`` value)."""
+
+    def __init__(self, ident: int, sample_after: float = 0.0):
+        self.ident = ident
+        self.sample_after = sample_after
+        self.stacks = Counter()
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def add(self, frame) -> None:
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        codes.reverse()
+        self.stacks[tuple(codes)] += 1
+
+    def collapsed(self) -> str:
+        """Returns the samples as collapsed stacks, root frame first."""
+        lines = Counter()
+        for codes, count in self.stacks.items():
+            lines[";".join(frame_label(code) for code in codes)] += count
+        return "".join(
+            f"{stack} {count}\n" for stack, count in sorted(lines.items())
+        )
+
+    def summary(self) -> str:
+        """Returns the functions the samples were taken in, most first."""
+        own, total = Counter(), self.samples
+        for codes, count in self.stacks.items():
+            if codes:
+                own[frame_label(codes[-1])] += count
+        lines = [f"{total} samples, by the function running:"]
+        lines.extend(
+            f"{count:8d} {count / total:6.1%}  {label}"
+            for label, count in own.most_common(SUMMARY_LINES)
+        )
+        return "\n".join(lines)
+
+
+class StackSampler:
+    """Samples the stacks of the threads handling requests, from one thread
+    per process that sleeps while no request in flight is due a sample."""
+
+    def __init__(self):
+        self._captures = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        # When the thread wakes up next by itself, a request due earlier
+        # wakes it up
+        self._next_due = math.inf
+        self._pid = None
+
+    def start(self, delay: float = 0.0) -> Capture:
+        """Starts sampling the current thread in ``delay`` seconds."""
+        capture = Capture(threading.get_ident(), time.perf_counter() + delay)
+        with self._lock:
+            if self._pid != os.getpid():
+                # First use in this process, e.g. a forked gunicorn worker
+                self._pid = os.getpid()
+                self._next_due = math.inf
+                threading.Thread(
+                    target=self._run, name="stack-sampler", daemon=True
+                ).start()
+            self._captures[capture.ident] = capture
+            wakeup = capture.sample_after < self._next_due
+            if wakeup:
+                self._next_due = capture.sample_after
+        if wakeup:
+            self._wakeup.set()
+        return capture
+
+    def stop(self, capture: Capture) -> None:
+        """Stops sampling, ``capture`` gets no samples after this returns."""
+        with self._lock:
+            self._captures.pop(capture.ident, None)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                self._wakeup.clear()
+                self._next_due = min(
+                    (c.sample_after for c in self._captures.values()),
+                    default=math.inf,
+                )
+                wait = self._next_due - time.perf_counter()
+            if wait > 0:
+                # Until a request is due, or one due earlier starts
+                self._wakeup.wait(None if wait == math.inf else wait)
+                continue
+            time.sleep(settings.PROFILE_INTERVAL_MS / 1000)
+            now = time.perf_counter()
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, capture in self._captures.items():
+                    frame = frames.get(ident)
+                    if frame is not None and capture.sample_after <= now:
+                        capture.add(frame)
+            del frames
+
+
+sampler = StackSampler()
+
+
+# Held by the request running under cProfile
+_cprofile_lock = threading.Lock()
+
+
+def start_cprofile() -> cProfile.Profile | None:
+    """Returns an enabled profiler, or None if another thread is running
+    under cProfile, or another profiling tool is active."""
+    if not _cprofile_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiling tool is already active, e.g. a debugger
+        _cprofile_lock.release()
+        return None
+    return profiler
+
+
+def stop_cprofile(profiler: cProfile.Profile) -> None:
+    profiler.disable()
+    _cprofile_lock.release()
+
+
+def cprofile_summary(stats: pstats.Stats) -> str:
+    stream = io.StringIO()
+    stats.stream = stream
+    stats.sort_stats("cumulative").print_stats(SUMMARY_LINES)
+    return stream.getvalue().strip()
+
+
+def format_sql(queries) -> str:
+    return "\n".join(
+        f"{seconds * 1000:8.2f} ms  {sql}" for seconds, sql in queries
+    )
+
+
+def save_profile(request, response, duration: float, trigger: str,
+                 capture=None, profiler=None, queries=()) -> None:
+    """Stores a ``RequestProfile`` and drops the oldest beyond
+    ``PROFILE_KEEP``."""
+    from profiling.models import RequestProfile
+
+    stats = getattr(request, "request_stats", None)
+    profile = RequestProfile(
+        method=request.method[:10],
+        path=request.get_full_path()[:2000],
+        label=stats.label if stats else "",
+        status_code=response.status_code,
+        duration_ms=round(duration * 1000, 2),
+        trigger=trigger,
+        queries=stats.queries if stats else 0,
+        db_ms=round(stats.db_time * 1000, 2) if stats else 0,
+        sql=format_sql(queries),
+    )
+    if profiler is not None:
+        profile_stats = pstats.Stats(profiler)
+        profile.kind = RequestProfile.Kind.CPROFILE
+        profile.samples = profile_stats.total_calls
+        profile.summary = cprofile_summary(profile_stats)
+        profile.pstats = marshal.dumps(profile_stats.stats)
+    else:
+        profile.kind = RequestProfile.Kind.STACKS
+        profile.samples = capture.samples
+        profile.summary = capture.summary() if capture.samples else ""
+        profile.stacks = capture.collapsed()
+    profile.save()
+
+    stale = RequestProfile.objects.values_list("pk", flat=True)[
+        settings.PROFILE_KEEP:
+    ]
+    RequestProfile.objects.filter(pk__in=list(stale)).delete()
+
+
+class ProfilingMiddleware:
+    """Profiles slow and sampled requests, see the module docstring.
+
+    Comes right after ``InstrumentationMiddleware``, whose query wrapper
+    records the SQL.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sampled = random.random() < settings.PROFILE_SAMPLE_RATE
+        slow_ms = settings.PROFILE_SLOW_MS
+        if not sampled and not slow_ms:
+            return self.get_response(request)
+
+        stats = getattr(request, "request_stats", None)
+        if sampled and stats is not None:
+            stats.sql = []
+        profiler = capture = None
+        if sampled and settings.PROFILE_CPROFILE:
+            profiler = start_cprofile()
+        if profiler is None:
+            capture = sampler.start(delay=0 if sampled else slow_ms / 1000)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            if profiler is not None:
+                stop_cprofile(profiler)
+            else:
+                sampler.stop(capture)
+            duration = time.perf_counter() - started
+            queries = stats.sql if stats is not None and stats.sql else []
+            if stats is not None:
+                stats.sql = None
+
+        slow = bool(slow_ms) and duration * 1000 >= slow_ms
+        if sampled or slow:
+            try:
+                with instrumentation.not_accounted():
+                    save_profile(
+                        request, response, duration,
+                        "sampled" if sampled else "slow",
+                        capture, profiler, queries,
+                    )
+            except Exception:
+                logger.warning(
+                    f"Could not save the profile of {request.path}",
+                    exc_info=True,
+                )
+        return response
@@ -24,6 +24,22 @@ env = environ.Env()
 environ.Env.read_env(BASE_DIR.parent / '.env')
 
 MAILER_API_KEY = env("ACHERS_MAILER_API_KEY", default="")
+# Dotted path of the MailerLite client, blog.testing.FakeMailerClient
+# records campaigns instead of sending them
+MAILER_CLIENT_CLASS = env(
+    "ACHERS_MAILER_CLIENT_CLASS",
+    default="blog.mailer.PooledMailerClient"
+)
+MAILER_API_HOST = "https://connect.mailerlite.com/"
+MAILER_CONNECT_TIMEOUT = env.float("ACHERS_MAILER_CONNECT_TIMEOUT", default=5)
+MAILER_READ_TIMEOUT = env.float("ACHERS_MAILER_READ_TIMEOUT", default=30)
+# Only idempotent calls (GET, PUT, DELETE) are retried
+MAILER_RETRIES = env.int("ACHERS_MAILER_RETRIES", default=3)
+MAILER_POOL_SIZE = env.int("ACHERS_MAILER_POOL_SIZE", default=4)
+# Batch sends (see blog.newsletter_batch) run this many campaigns at once,
+# and keep all calls under MailerLite's limit of requests per minute
+MAILER_BATCH_CONCURRENCY = env.int("ACHERS_MAILER_BATCH_CONCURRENCY", default=4)
+MAILER_RATE_LIMIT = env.int("ACHERS_MAILER_RATE_LIMIT", default=120)
 SECURE_REFERRER_POLICY = "strict-origin-when-cross-origin"
 
 # SECURITY WARNING: keep the secret key used in production secret!
@@ -42,6 +58,51 @@ DEBUG = env.bool("ACHERS_DEBUG", default=False)
 
 CSRF_TRUSTED_ORIGINS = env.list("ACHERS_CSRF_TRUSTED_ORIGINS", default=[])
 
+# Per-request query count and timings, see achers_myspace.instrumentation
+SERVER_TIMING = env.bool("ACHERS_SERVER_TIMING", default=DEBUG)
+# INFO logs every request, WARNING only the ones over their query budget
+REQUEST_LOG_LEVEL = env("ACHERS_REQUEST_LOG_LEVEL", default="WARNING")
+
+# Prometheus metrics at /metrics, see achers_myspace.metrics. Processes
+# share their values through files in PROMETHEUS_MULTIPROC_DIR, which
+# gunicorn.conf.py sets; without it /metrics only shows the process
+# answering. With a token set, scrapes must send it as
+# "Authorization: Bearer <token>".
+METRICS_TOKEN = env.str("ACHERS_METRICS_TOKEN", default="")
+
+# Profiles of requests slower than PROFILE_SLOW_MS (0 for none) and of a
+# PROFILE_SAMPLE_RATE fraction of all requests, kept in the database (the
+# newest PROFILE_KEEP), see achers_myspace.profiling. Sampled requests run
+# under cProfile with PROFILE_CPROFILE, the others have their stacks sampled
+# every PROFILE_INTERVAL_MS, slow ones from PROFILE_SLOW_MS on.
+PROFILING = env.bool("ACHERS_PROFILING", default=False)
+PROFILE_SLOW_MS = env.int("ACHERS_PROFILE_SLOW_MS", default=1000)
+PROFILE_SAMPLE_RATE = env.float("ACHERS_PROFILE_SAMPLE_RATE", default=0)
+PROFILE_CPROFILE = env.bool("ACHERS_PROFILE_CPROFILE", default=False)
+PROFILE_INTERVAL_MS = env.float("ACHERS_PROFILE_INTERVAL_MS", default=5)
+PROFILE_KEEP = env.int("ACHERS_PROFILE_KEEP", default=200)
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "json": {"()": "achers_myspace.instrumentation.JsonFormatter"},
+    },
+    "handlers": {
+        "requests": {
+            "class": "logging.StreamHandler",
+            "formatter": "json",
+        },
+    },
+    "loggers": {
+        "achers_myspace.requests": {
+            "handlers": ["requests"],
+            "level": REQUEST_LOG_LEVEL,
+            "propagate": False,
+        },
+    },
+}
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/6.0/howto/deployment/checklist/
 
@@ -73,14 +134,22 @@ INSTALLED_APPS = [
     "wagtail_newsletter",
     "blog",
     "home",
+    "profiling",
 ]
 
 MIDDLEWARE = [
+    "achers_myspace.instrumentation.InstrumentationMiddleware",
+    # Only in the stack with PROFILING on, see achers_myspace/profiling.py
+    "achers_myspace.profiling.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    # Answers conditional requests for page cache hits and other views,
+    # pages answer them before rendering, see achers_myspace/conditional.py
+    "django.middleware.http.ConditionalGetMiddleware",
+    "achers_myspace.page_cache.PageCacheMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "wagtail.contrib.redirects.middleware.RedirectMiddleware",
@@ -120,6 +189,52 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# The post wall index lives here, so it has to be shared between workers in
+# production (see production.py).
+
+CACHES = {
+    "default": env.cache(
+        "ACHERS_CACHE_URL",
+        default="locmemcache://"
+    ),
+    # Full responses for anonymous visitors, see achers_myspace/page_cache.py
+    "pages": env.cache(
+        "ACHERS_PAGE_CACHE_URL",
+        default="locmemcache://pages"
+    ),
+}
+
+# Purging on publish keeps cached pages fresh, this only bounds their age.
+PAGE_CACHE_TIMEOUT = env.int("ACHERS_PAGE_CACHE_TIMEOUT", default=60 * 60)
+
+
+# Post wall
+# "excerpt" shows the stored excerpt of each post with a link to the rest,
+# "full" the whole body. Excerpts are made on save, run render_blog_bodies
+# after changing the length.
+
+WALL_MODE = env.str("ACHERS_WALL_MODE", default="excerpt")
+WALL_EXCERPT_WORDS = env.int("ACHERS_WALL_EXCERPT_WORDS", default=60)
+
+
+# Static export
+# With a directory set, publishing re-exports the pages it changed there for
+# nginx to serve, see achers_myspace/static_export.py. 0 workers means one
+# per CPU.
+
+STATIC_EXPORT_ROOT = env.str("ACHERS_STATIC_EXPORT_ROOT", default="")
+STATIC_EXPORT_WORKERS = env.int("ACHERS_STATIC_EXPORT_WORKERS", default=0)
+
+
+# Background jobs
+# Failed jobs are retried after JOB_RETRY_DELAY seconds, doubling each time.
+
+JOB_RETRY_DELAY = env.int("ACHERS_JOB_RETRY_DELAY", default=30)
+JOB_RETRY_MAX_DELAY = env.int("ACHERS_JOB_RETRY_MAX_DELAY", default=60 * 60)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -165,10 +280,21 @@ STATICFILES_DIRS = [
 
 STATIC_ROOT = BASE_DIR / "static"
 STATIC_URL = "/static/"
+# Bytes saved by collectstatic, see the static_report command. Kept out of
+# STATIC_ROOT, which nginx serves.
+STATIC_REPORT_PATH = env.str(
+    "ACHERS_STATIC_REPORT_PATH", default=str(BASE_DIR / "static-report.json")
+)
 
 MEDIA_ROOT = BASE_DIR / "media"
 MEDIA_URL = "/media/"
 
+# Formats offered as <source>s of rich text images, best first, see
+# blog.image_formats. AVIF needs pillow-heif.
+RICHTEXT_IMAGE_FORMATS = env.list(
+    "ACHERS_RICHTEXT_IMAGE_FORMATS", default=["avif", "webp"]
+)
+
 # Default storage settings
 # See https://docs.djangoproject.com/en/6.0/ref/settings/#std-setting-STORAGES
 STORAGES = {
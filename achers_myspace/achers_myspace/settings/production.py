@@ -7,7 +7,51 @@ INSTALLED_APPS = INSTALLED_APPS + ["django.contrib.postgres"]
 # outdated JavaScript / CSS assets being served from cache
 # (e.g. after a Wagtail upgrade).
 # See https://docs.djangoproject.com/en/6.0/ref/contrib/staticfiles/#manifeststaticfilesstorage
-STORAGES["staticfiles"]["BACKEND"] = "django.contrib.staticfiles.storage.ManifestStaticFilesStorage"
+# This subclass also writes WOFF2 fonts, WebP/AVIF icons and .gz/.br copies
+# for nginx, see achers_myspace.storage.
+STORAGES["staticfiles"]["BACKEND"] = "achers_myspace.storage.OptimizedManifestStaticFilesStorage"
+
+# Gunicorn workers don't share memory, so the default cache has to live
+# outside the process for the post wall index to stay consistent. The
+# worker container updates the wall, purges pages and exports them from
+# the page cache as well, so both caches live on the cache volume that
+# docker-compose mounts in the web and worker containers.
+CACHES = {
+    "default": env.cache(
+        "ACHERS_CACHE_URL",
+        default="filecache:///app/cache/default"
+    ),
+    "pages": env.cache(
+        "ACHERS_PAGE_CACHE_URL",
+        default="filecache:///app/cache/pages"
+    ),
+}
+
+# Reuse PostgreSQL connections instead of connecting for every request.
+# Each worker process keeps a psycopg pool, or without the pool a persistent
+# connection per thread. Pool stats are collected into the db_pool_* metrics
+# (see achers_myspace.instrumentation). SQLite is left as it is.
+if DATABASES["default"]["ENGINE"] == "django.db.backends.postgresql":
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+    _db_options = DATABASES["default"].setdefault("OPTIONS", {})
+    if env.bool("ACHERS_DATABASE_POOL", default=True):
+        # Pooled connections must not be persistent as well
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        _db_options["pool"] = {
+            "min_size": env.int("ACHERS_DATABASE_POOL_MIN_SIZE", default=1),
+            # Enough for every gunicorn thread of the worker
+            "max_size": env.int("ACHERS_DATABASE_POOL_MAX_SIZE", default=4),
+            # Seconds a request waits for a free connection before failing
+            "timeout": env.float("ACHERS_DATABASE_POOL_TIMEOUT", default=10),
+            "max_idle": env.float("ACHERS_DATABASE_POOL_MAX_IDLE", default=300),
+            "max_lifetime": env.float(
+                "ACHERS_DATABASE_POOL_MAX_LIFETIME", default=3600
+            ),
+        }
+    else:
+        DATABASES["default"]["CONN_MAX_AGE"] = env.int(
+            "ACHERS_DATABASE_CONN_MAX_AGE", default=600
+        )
 
 # In production, Django will store uploaded files in a persistent volume at /app/media
 MEDIA_ROOT = "/app/media"
@@ -0,0 +1,14 @@
+/* Click-to-load embeds, see blog/embeds.py: the player iframe waits in a
+   <template> inside the facade and replaces it on the first click. */
+document.addEventListener("click", function (event) {
+    var facade = event.target.closest(".embed-facade");
+    if (!facade) {
+        return;
+    }
+    var template = facade.querySelector("template");
+    if (!template) {
+        return;
+    }
+    event.preventDefault();
+    facade.replaceWith(template.content.cloneNode(true));
+});
@@ -0,0 +1,254 @@
+"""Static export of the public site for nginx to serve.
+
+``export()`` renders the wall (every tag and every ``?after=``/``?before=``
+page reachable from its links), the live posts and the feeds through the
+full Django stack, as an anonymous visitor, and writes them under
+a directory per site hostname under ``STATIC_EXPORT_ROOT``::
+
+    /                          -> achers.org/index.html
+    /?after=<cursor>&tag=gigs  -> achers.org/index?after=<cursor>&tag=gigs.html
+    /tour-diary-1/             -> achers.org/tour-diary-1/index.html
+    /feeds/rss/                -> achers.org/feeds/rss/index.rss
+
+so nginx finds a request's file from ``$uri`` and ``$args`` (see nginx.conf)
+and only hands the admin, search and anything not exported to Django. Old
+``?page=`` links are redirects and are left to Django as well.
+
+A full export renders every URL, spread over processes, and removes the
+files of URLs that are gone. Publishing queues an export of just the URLs
+``page_cache.purge_post`` purged, see ``blog.tasks.queue_export``.
+"""
+import logging
+import math
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from urllib.parse import parse_qsl, quote, urlsplit
+
+from django.conf import settings
+
+# Imported by worker processes before Django is set up, see _init_worker()
+from achers_myspace.pagination import decode_cursor, paginate_keys
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {
+    "text/html": ".html",
+    "application/rss+xml": ".rss",
+    "application/atom+xml": ".atom",
+    "application/feed+json": ".json",
+}
+# Starting a process costs about a second, small exports stay in this one
+MIN_URLS_PER_WORKER = 50
+
+
+def link_query(params) -> str:
+    """Returns the query string the templates link to for ``params``.
+
+    The templates put ``after``/``before`` before ``tag`` and escape tags
+    with the ``urlencode`` filter, which differs from ``urlencode()`` in
+    how it escapes spaces.
+    """
+    params = dict(params)
+    return "&".join(
+        f"{name}={quote(params[name], safe='/')}"
+        for name in ("after", "before", "tag")
+        if params.get(name)
+    )
+
+
+def export_name(path: str, query: str, content_type: str) -> str | None:
+    """Returns the file of a URL relative to the export root."""
+    extension = EXTENSIONS.get(content_type.split(";")[0].strip())
+    if extension is None:
+        return None
+    name = f"index?{query}" if query else "index"
+    return f"{path.strip('/')}/{name}{extension}".lstrip("/")
+
+
+def is_export_name(name: str) -> bool:
+    return os.path.basename(name).startswith("index") and name.endswith(
+        tuple(EXTENSIONS.values())
+    )
+
+
+def wall_queries(keys: list, per_page: int, tag: str | None = None):
+    """Yields the query of every page of a wall list reachable by links."""
+    base = {"tag": tag} if tag else {}
+    yield link_query(base)
+    page = paginate_keys(keys, per_page)
+    while page.has_next():
+        cursor = page.next_cursor
+        yield link_query({**base, "after": cursor})
+        page = paginate_keys(keys, per_page, after=decode_cursor(cursor))
+        if page.previous_cursor:
+            yield link_query({**base, "before": page.previous_cursor})
+
+
+def site_urls() -> dict:
+    """Returns the ``(path, query)`` of every URL to export, by site."""
+    from blog.feeds import feed_urls
+    from blog.models import BlogPage
+    from home import wall
+    from home.models import HomePage
+
+    urls = {}
+    for home in HomePage.objects.live():
+        site = home.get_site()
+        if site is None:
+            continue
+        paths = urls.setdefault(site.root_url, set())
+        home_path = home.relative_url(site)
+        tags = [None, *wall.tag_counts(home.pk)]
+        for tag in tags:
+            keys = wall.get_post_keys(home.pk, tag)
+            paths.update(
+                (home_path, query)
+                for query in wall_queries(keys, home.posts_per_page, tag)
+            )
+            paths.update(
+                (path, link_query(parse_qsl(query)))
+                for path, query in feed_urls(tag)
+            )
+        for post in BlogPage.objects.live().child_of(home).only("url_path"):
+            paths.add((post.relative_url(site), ""))
+    return urls
+
+
+def site_directory(root: str, root_url: str) -> str:
+    """Returns the directory of a site, nginx looks in ``<root>/$host``."""
+    return os.path.join(root, urlsplit(root_url).hostname)
+
+
+def render(root_url: str, urls, root: str) -> list[str]:
+    """Renders ``urls`` of a site and writes or removes their files.
+
+    Returns the names of the files written, relative to ``root``.
+    """
+    from django.test import Client
+
+    from achers_myspace import instrumentation, page_cache
+
+    scheme, host = urlsplit(root_url)[:2]
+    directory = site_directory(root, root_url)
+    client = Client(HTTP_HOST=host, raise_request_exception=False)
+    names = []
+    for path, query in urls:
+        # Not a visitor's request, the HTTP metrics are about those
+        with instrumentation.not_recorded():
+            response = client.get(
+                f"{path}?{query}" if query else path, secure=scheme == "https"
+            )
+        name = None
+        if page_cache.is_cacheable_response(response):
+            name = export_name(path, query, response.get("Content-Type", ""))
+        if name:
+            write_file(directory, name, response.content)
+            names.append(os.path.relpath(os.path.join(directory, name), root))
+        elif response.status_code != 200:
+            # Unpublished or deleted since, nginx must pass it to Django
+            remove_url(directory, path, query)
+    return names
+
+
+def write_file(directory: str, name: str, content: bytes) -> None:
+    """Replaces a file in one step, nginx never serves half of it."""
+    path = Path(directory, name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".export-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def remove_url(directory: str, path: str, query: str) -> int:
+    """Removes the file of a URL, returns how many were removed."""
+    count = 0
+    for content_type in EXTENSIONS:
+        file = Path(directory, export_name(path, query, content_type))
+        if file.exists():
+            file.unlink()
+            count += 1
+    return count
+
+
+def _init_worker():
+    import django
+
+    django.setup()
+
+
+def export(urls=None, root: str | None = None,
+           workers: int | None = None) -> dict:
+    """Exports the site, or only ``urls``, to the export root.
+
+    ``urls`` are ``(path, query)`` pairs as the page cache purges them.
+    Returns the number of files written and removed.
+    """
+    root = root or settings.STATIC_EXPORT_ROOT
+    targets = site_urls()
+    render_urls, remove = {}, []
+    if urls is None:
+        render_urls = {site: sorted(paths) for site, paths in targets.items()}
+    else:
+        for path, query in urls:
+            url = (path, link_query(parse_qsl(query)))
+            for site, paths in targets.items():
+                if url in paths:
+                    render_urls.setdefault(site, []).append(url)
+                else:
+                    remove.append((site, url))
+
+    total = sum(len(paths) for paths in render_urls.values())
+    workers = workers or settings.STATIC_EXPORT_WORKERS or os.cpu_count()
+    workers = max(min(workers, total // MIN_URLS_PER_WORKER), 1)
+
+    names = []
+    if workers == 1:
+        for site, paths in render_urls.items():
+            names.extend(render(site, paths, root))
+    else:
+        from django.db import connections
+
+        # Workers are started fresh, they open their own connections
+        connections.close_all()
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(workers, mp_context=context,
+                                 initializer=_init_worker) as pool:
+            futures = []
+            for site, paths in render_urls.items():
+                size = math.ceil(len(paths) / (workers * 4))
+                for start in range(0, len(paths), size):
+                    futures.append(pool.submit(
+                        render, site, paths[start:start + size], root
+                    ))
+            for future in futures:
+                names.extend(future.result())
+
+    removed = sum(
+        remove_url(site_directory(root, site), *url) for site, url in remove
+    )
+    if urls is None:
+        removed += remove_stale(root, set(names))
+
+    logger.info(f"Exported {len(names)} file(s) to {root}, removed {removed}")
+    return {"written": len(names), "removed": removed, "workers": workers}
+
+
+def remove_stale(root: str, names: set) -> int:
+    """Removes exported files that weren't written by a full export."""
+    count = 0
+    for directory, _, files in os.walk(root):
+        for file in files:
+            name = os.path.relpath(os.path.join(directory, file), root)
+            if is_export_name(name) and name not in names:
+                os.unlink(os.path.join(directory, file))
+                count += 1
+    return count
@@ -0,0 +1,198 @@
+"""Static files storage that optimizes assets while ``collectstatic`` runs.
+
+On top of ``ManifestStaticFilesStorage``'s content hashing it:
+
+- converts the fonts in ``fonts/`` to WOFF2 with fontTools, dropping the
+  hinting and unused tables but keeping every glyph,
+- converts the PNG icons to WebP and AVIF, kept only when smaller,
+- writes ``.gz`` (and ``.br``) siblings of text assets for nginx's
+  ``gzip_static``/``brotli_static``,
+
+and records the bytes saved in ``STATIC_REPORT_PATH``, outside the
+public ``STATIC_ROOT``, see the ``static_report`` command. Converted files are added before the
+hashing pass, so the CSS and templates can refer to them.
+"""
+import gzip
+import io
+import json
+import logging
+import posixpath
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+FONT_EXTENSIONS = (".ttf", ".otf")
+ICON_EXTENSIONS = (".png",)
+# Converted to every format that comes out smaller than the original
+ICON_FORMATS = {
+    ".webp": ("WEBP", {"quality": 85, "method": 6}),
+    ".avif": ("AVIF", {"quality": 70}),
+}
+COMPRESSIBLE_EXTENSIONS = (
+    ".css", ".js", ".mjs", ".map", ".json", ".svg", ".txt", ".xml", ".html",
+    ".ico", ".ttf", ".otf", ".eot",
+)
+# Compressing tiny files doesn't pay for the extra request handling
+MIN_COMPRESS_SIZE = 256
+
+
+def woff2_font(data: bytes) -> bytes:
+    """Returns a font converted to WOFF2, without hinting."""
+    from fontTools import subset
+    from fontTools.ttLib import TTFont
+
+    # Keep the timestamp so rebuilds give the same bytes and hash
+    font = TTFont(io.BytesIO(data), recalcTimestamp=False)
+    options = subset.Options()
+    options.flavor = "woff2"
+    options.hinting = False
+    options.layout_features = ["*"]
+    options.name_IDs = ["*"]
+    options.notdef_outline = True
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=font.getBestCmap().keys())
+    subsetter.subset(font)
+    output = io.BytesIO()
+    font.flavor = "woff2"
+    font.save(output)
+    return output.getvalue()
+
+
+def convert_icon(data: bytes, extension: str) -> bytes:
+    """Returns an image converted to the format of ``extension``."""
+    from PIL import Image
+
+    image_format, save_options = ICON_FORMATS[extension]
+    with Image.open(io.BytesIO(data)) as image:
+        output = io.BytesIO()
+        image.save(output, image_format, **save_options)
+        return output.getvalue()
+
+
+def gzip_bytes(data: bytes) -> bytes:
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def brotli_bytes(data: bytes) -> bytes:
+    return brotli.compress(data, quality=11)
+
+
+class OptimizedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """``ManifestStaticFilesStorage`` that converts and precompresses assets."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        self.report = {"converted": [], "compressed": []}
+        if not dry_run:
+            self.convert_assets(paths)
+
+        originals, hashed = set(), set()
+        for name, hashed_name, done in super().post_process(
+            paths, dry_run, **options
+        ):
+            originals.add(name)
+            if hashed_name:
+                hashed.add(hashed_name)
+            yield name, hashed_name, done
+
+        if not dry_run:
+            # Both copies are served, but only the hashed ones are linked
+            # from pages, so only they count in the report
+            for name in sorted(originals - hashed):
+                self.compress(name)
+            for name in sorted(hashed):
+                self.compress(name, report=True)
+            self.write_report()
+
+    def _replace(self, name: str, data: bytes) -> None:
+        if self.exists(name):
+            self.delete(name)
+        self._save(name, ContentFile(data))
+
+    def _read(self, name: str) -> bytes:
+        with self.open(name) as f:
+            return f.read()
+
+    def convert_assets(self, paths: dict) -> None:
+        """Adds WOFF2 fonts and WebP/AVIF icons next to their originals."""
+        for name in sorted(paths):
+            base, extension = posixpath.splitext(name)
+            extension = extension.lower()
+            if extension in FONT_EXTENSIONS and name.startswith("fonts/"):
+                # The CSS refers to the WOFF2 fonts, they are always written
+                targets, optional = [".woff2"], False
+            elif extension in ICON_EXTENSIONS and "/" not in name:
+                targets, optional = list(ICON_FORMATS), True
+            else:
+                continue
+
+            original = self._read(name)
+            for target in targets:
+                if target == ".woff2":
+                    data = woff2_font(original)
+                else:
+                    try:
+                        data = convert_icon(original, target)
+                    except (OSError, KeyError, ValueError):
+                        logger.warning(f"Could not convert {name} to {target}",
+                                       exc_info=True)
+                        continue
+                if optional and len(data) >= len(original):
+                    continue
+                self._replace(base + target, data)
+                paths[base + target] = (self, base + target)
+                self.report["converted"].append({
+                    "name": base + target,
+                    "original": name,
+                    "original_bytes": len(original),
+                    "bytes": len(data),
+                })
+
+    def compress(self, name: str, report: bool = False) -> None:
+        """Writes ``.gz``/``.br`` siblings that are smaller than the file."""
+        if not name.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+            return
+        data = self._read(name)
+        if len(data) < MIN_COMPRESS_SIZE:
+            return
+        entry = {"name": name, "bytes": len(data)}
+        encoders = {".gz": gzip_bytes}
+        if brotli is not None:
+            encoders[".br"] = brotli_bytes
+        for suffix, encode in encoders.items():
+            compressed = encode(data)
+            if len(compressed) < len(data):
+                self._replace(name + suffix, compressed)
+                entry[suffix.lstrip(".") + "_bytes"] = len(compressed)
+        if report:
+            self.report["compressed"].append(entry)
+
+    def write_report(self) -> None:
+        converted = self.report["converted"]
+        compressed = self.report["compressed"]
+        self.report["totals"] = {
+            "converted_saved_bytes": sum(
+                item["original_bytes"] - item["bytes"] for item in converted
+            ),
+            "gzip_saved_bytes": sum(
+                item["bytes"] - item.get("gz_bytes", item["bytes"])
+                for item in compressed
+            ),
+            "brotli_saved_bytes": sum(
+                item["bytes"] - item.get("br_bytes", item["bytes"])
+                for item in compressed
+            ),
+        }
+        if settings.STATIC_REPORT_PATH:
+            Path(settings.STATIC_REPORT_PATH).write_text(
+                json.dumps(self.report, indent=2)
+            )
+        logger.info(f"Static assets: {self.report['totals']}")
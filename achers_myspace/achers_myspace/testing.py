@@ -0,0 +1,48 @@
+"""Test helpers shared by the apps."""
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from prometheus_client import REGISTRY
+
+
+def metric_value(metric, sample: str = "", **labels) -> float:
+    """Returns the value of a prometheus_client metric in this process, or
+    0 before it was first updated.
+
+    ``sample`` picks a sample of a histogram, like ``"count"``; counters
+    default to their ``_total``.
+    """
+    family = metric.describe()[0]
+    if not sample and family.type == "counter":
+        sample = "total"
+    name = f"{family.name}_{sample}" if sample else family.name
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class QueryBudgetMixin:
+    """Fails a test when a view runs more queries than its ``query_budget``.
+
+    Mix into a ``TestCase``; the request goes through
+    ``InstrumentationMiddleware``, which picks up the budget declared on
+    the Wagtail page class or the view function.
+    """
+
+    def assertWithinQueryBudget(self, path, data=None, **extra):
+        """Returns the response to a GET of ``path``, failing the test if it
+        ran more queries than its budget."""
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(path, data, **extra)
+        stats = response.request_stats
+        if response.get("X-Page-Cache") == "HIT":
+            self.fail(f"{path} was served from the page cache")
+        if stats.query_budget is None:
+            self.fail(f"{stats.label} at {path} declares no query_budget")
+        if stats.over_budget:
+            queries = "\n".join(
+                f"{number}. {query['sql']}"
+                for number, query in enumerate(captured.captured_queries, 1)
+            )
+            self.fail(
+                f"{stats.label} at {path} ran {stats.queries} queries, over "
+                f"its budget of {stats.query_budget}:\n{queries}"
+            )
+        return response
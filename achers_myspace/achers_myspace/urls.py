@@ -6,6 +6,8 @@ from wagtail.admin import urls as wagtailadmin_urls
 from wagtail import urls as wagtail_urls
 from wagtail.documents import urls as wagtaildocs_urls
 
+from achers_myspace.views import metrics_view
+from blog import feeds
 from search import views as search_views
 
 urlpatterns = [
@@ -13,6 +15,10 @@ urlpatterns = [
     path("admin/", include(wagtailadmin_urls)),
     path("documents/", include(wagtaildocs_urls)),
     path("search/", search_views.search, name="search"),
+    path("feeds/rss/", feeds.PostsFeed(), name="rss_feed"),
+    path("feeds/atom/", feeds.AtomPostsFeed(), name="atom_feed"),
+    path("feeds/json/", feeds.JsonPostsFeed(), name="json_feed"),
+    path("metrics", metrics_view, name="metrics"),
 ]
 
 if settings.DEBUG:
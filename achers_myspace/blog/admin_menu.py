@@ -0,0 +1,69 @@
+"""The "New Blog Post" item of the Wagtail admin menu.
+
+Wagtail builds its menu items once per process, the item looks up the home
+page to add posts under when the menu is rendered. The home page id of
+each site (by hostname) is kept in the cache, so rendering the menu costs
+no queries. Creating, moving or deleting a top level page, or changing a
+site, drops the cached ids, see ``blog.signals``.
+"""
+from django.core.cache import cache
+from django.urls import reverse
+from wagtail.admin.menu import MenuItem
+from wagtail.admin.ui.sidebar import LinkMenuItem
+from wagtail.models import Site
+
+from home.models import HomePage
+
+CACHE_KEY = "admin:new-post-parents"
+# Stands for "no home page" in the cache, so a miss isn't looked up again
+NO_PARENT = 0
+
+
+def new_post_parent_id(request) -> int | None:
+    """Returns the id of the home page new posts of the request's site go to."""
+    host = request.get_host()
+    parents = cache.get(CACHE_KEY) or {}
+    if host not in parents:
+        parents[host] = find_new_post_parent(request) or NO_PARENT
+        cache.set(CACHE_KEY, parents, None)
+    return parents[host] or None
+
+
+def find_new_post_parent(request) -> int | None:
+    """Returns the site's root page if it is a home page, else the first
+    top level home page."""
+    site = Site.find_for_request(request)
+    homes = HomePage.objects.filter(depth=2).order_by("path")
+    if site is not None:
+        home_id = homes.filter(pk=site.root_page_id).values_list(
+            "pk", flat=True
+        ).first()
+        if home_id:
+            return home_id
+    return homes.values_list("pk", flat=True).first()
+
+
+def invalidate() -> None:
+    cache.delete(CACHE_KEY)
+
+
+class NewBlogPostMenuItem(MenuItem):
+    """Links to the form adding a blog post under the site's home page."""
+
+    def is_shown(self, request):
+        return new_post_parent_id(request) is not None
+
+    def render_component(self, request):
+        # The instance is shared by all requests, the URL isn't stored on it
+        url = reverse(
+            "wagtailadmin_pages:add",
+            args=["blog", "blogpage", new_post_parent_id(request)],
+        )
+        return LinkMenuItem(
+            self.name,
+            self.label,
+            url,
+            icon_name=self.icon_name,
+            classname=self.classname,
+            attrs=self.attrs,
+        )
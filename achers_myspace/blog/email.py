@@ -1,114 +1,193 @@
-import re
+import hashlib
+import threading
+from collections import OrderedDict
+from html.parser import HTMLParser
 from urllib.parse import urljoin
 import logging
 
-import mailerlite
-from bs4 import BeautifulSoup
+from django.conf import settings
+from django.utils.module_loading import import_string
 
 from achers_myspace.settings.base import MAILER_API_KEY
+from blog.embeds import build_tag, find_provider
 
 logger = logging.getLogger(__name__)
 
-SPOTIFY_EMBED_REGEX = r'spotify\.com/embed/(playlist|album|track)/([^?]+)'
+# Attributes of the responsive rich text images, see blog.image_formats
+RESPONSIVE_ATTRS = ('srcset', 'sizes', 'loading', 'decoding')
+
+# Converted HTML keyed on a hash of the input, newsletters are converted
+# again each time wagtail_newsletter previews or sends them
+CONVERTED_CACHE_SIZE = 128
+_converted = OrderedDict()
+_converted_lock = threading.Lock()
+
+
+def _convert_img(attrs: dict, original: str, base_url: str) -> str:
+    src = attrs.get('src', '')
+    # Email clients load the plain src, relative srcset URLs would break
+    responsive = [name for name in RESPONSIVE_ATTRS if name in attrs]
+    for name in responsive:
+        del attrs[name]
+    if src and not src.startswith(('http://', 'https://', 'data:')):
+        # Convert relative URL to absolute
+        attrs['src'] = urljoin(base_url, src)
+        attrs['style'] = 'max-width: 100%; height: auto; display: block;'
+        return build_tag('img', attrs)
+    if responsive:
+        return build_tag('img', attrs)
+    return original
+
+
+def _convert_iframe(attrs: dict, inner: str, original: str) -> str:
+    provider, match = find_provider(attrs.get('src', ''))
+    if provider is None:
+        return original
+    return provider.to_email(match, attrs, inner)
+
+
+class EmailEmbedConverter(HTMLParser):
+    """Rewrites the images and players of HTML for email in one pass over
+    the stream of tags, and copies the rest as it comes.
+
+    Start tags are copied as written, end tags, text and comments as the
+    parser reports them.
+    """
+
+    def __init__(self, base_url: str):
+        super().__init__(convert_charrefs=False)
+        self.base_url = base_url
+        self.parts = []
+        # <picture> elements the parser is in, their <source>s are dropped
+        self.pictures = 0
+        # The start tag, attributes and content of the iframe being read
+        self.iframe = None
+
+    def convert(self, html_content: str) -> str:
+        self.feed(html_content)
+        self.close()
+        if self.iframe is not None:
+            # Never closed, left as it was
+            original, _, inner = self.iframe
+            self.parts.append(original + "".join(inner))
+        return "".join(self.parts)
+
+    def write(self, text: str) -> None:
+        if self.iframe is not None:
+            self.iframe[2].append(text)
+        else:
+            self.parts.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        original = self.get_starttag_text()
+        if self.iframe is not None:
+            # The fallback content of the iframe
+            self.write(original)
+            return
+        attrs = {name: value or '' for name, value in attrs}
+        if tag == 'img':
+            self.write(_convert_img(attrs, original, self.base_url))
+        elif tag == 'iframe':
+            self.iframe = (original, attrs, [])
+        elif tag == 'source' and self.pictures:
+            # The <img> of the <picture> is kept
+            pass
+        else:
+            if tag == 'picture':
+                self.pictures += 1
+            self.write(original)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag in ('iframe', 'picture'):
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag == 'iframe' and self.iframe is not None:
+            original, attrs, inner = self.iframe
+            self.iframe = None
+            inner = "".join(inner)
+            self.parts.append(_convert_iframe(
+                attrs, inner, f"{original}{inner}</iframe>"
+            ))
+            return
+        if tag == 'picture' and self.iframe is None and self.pictures:
+            self.pictures -= 1
+        self.write(f"</{tag}>")
+
+    def handle_data(self, data):
+        self.write(data)
+
+    def handle_entityref(self, name):
+        self.write(f"&{name};")
+
+    def handle_charref(self, name):
+        self.write(f"&#{name};")
+
+    def handle_comment(self, data):
+        self.write(f"<!--{data}-->")
+
+    def handle_decl(self, decl):
+        self.write(f"<!{decl}>")
+
+    def handle_pi(self, data):
+        self.write(f"<?{data}>")
+
+    def unknown_decl(self, data):
+        self.write(f"<![{data}]>")
+
+
+def _convert_embeds(html_content: str, base_url: str) -> str:
+    return EmailEmbedConverter(base_url).convert(html_content)
 
 
 def convert_embeds_for_email(
     html_content: str,
     base_url: str = "https://achers.org",
 ) -> str:
-    """Convert YouTube and Spotify embeds to email-friendly format."""
-    soup = BeautifulSoup(html_content, 'html.parser')
-
-    # Convert all relative image URLs to absolute
-    for img in soup.find_all('img'):
-        src = img.get('src', '')
-        if src and not src.startswith(('http://', 'https://', 'data:')):
-            # Convert relative URL to absolute
-            img['src'] = urljoin(base_url, src)
-            img['style'] = 'max-width: 100%; height: auto; display: block;'
-
-    # Find all iframes (YouTube and Spotify embeds)
-    for iframe in soup.find_all('iframe'):
-        src = iframe.get('src', '')
-
-        # YouTube embeds
-        if 'youtube.com' in src or 'youtu.be' in src:
-            # Extract video ID from iframe src
-            match = re.search(r'embed/([^?]+)', src)
-            if match:
-                video_id = match.group(1)
-                video_url = f"https://www.youtube.com/watch?v={video_id}"
-                thumbnail_url = (
-                    f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg"
-                )
-
-                # Create email-friendly replacement
-                replacement = soup.new_tag(
-                    'div', style='margin: 20px 0; text-align: center;'
-                )
-                link = soup.new_tag(
-                    'a', href=video_url, style='display: block;'
-                )
-                img = soup.new_tag(
-                    'img',
-                    src=thumbnail_url,
-                    alt='Watch on YouTube',
-                    style=(
-                        'max-width: 100%; height: auto; '
-                        'border: 2px solid #333;'
-                    )
-                )
-                link.append(img)
-                replacement.append(link)
-                iframe.replace_with(replacement)
-
-        # Spotify embeds
-        elif 'spotify.com' in src:
-            # Extract Spotify URL
-            match = re.search(
-                SPOTIFY_EMBED_REGEX, src
-            )
-            if match:
-                content_type = match.group(1)
-                content_id = match.group(2)
-                title = iframe.get('title', 'Listen on Spotify')
-                if title != "Listen on Spotify":
-                    title = title.replace('Spotify Embed: ', '')
-                spotify_url = (
-                    f"https://open.spotify.com/{content_type}/{content_id}"
-                )
-                # Create email-friendly replacement
-                div_style = (
-                    "margin: 20px 0; padding: 15px; background: #222; "
-                    "border: 2px solid #333; text-align: center;"
-                )
-                replacement = soup.new_tag('div', style=div_style)
-                text_p = soup.new_tag('p', style='margin: 0;')
-                link = soup.new_tag(
-                    'a', href=spotify_url,
-                    style=(
-                        'color: #ff6b6b; font-weight: bold; '
-                        'text-decoration: none;'
-                    )
-                )
-                link.string = title
-                text_p.append(link)
-                replacement.append(text_p)
-                iframe.replace_with(replacement)
-    return str(soup)
-
-
-def send_blog_post(
-    subject: str,
-    content: str,
-):
-    """Sends an email with the given body using MailerLite."""
-    # Convert embeds to email-friendly format
-    email_content = convert_embeds_for_email(content)
-
-    mailer = mailerlite.Client({
-        "api_key": MAILER_API_KEY
-    })
+    """Convert YouTube, Spotify and other embeds to email-friendly format.
+
+    Relative image URLs are made absolute and the responsive ``srcset`` and
+    ``<source>`` variants dropped. Iframes are replaced by the
+    matching provider from blog.embeds, others are left alone.
+    """
+    digest = hashlib.sha256(
+        f"{base_url}\0{html_content}".encode()
+    ).hexdigest()
+    with _converted_lock:
+        if digest in _converted:
+            _converted.move_to_end(digest)
+            return _converted[digest]
+
+    result = _convert_embeds(html_content, base_url)
+
+    with _converted_lock:
+        _converted[digest] = result
+        if len(_converted) > CONVERTED_CACHE_SIZE:
+            _converted.popitem(last=False)
+    return result
+
+
+_mailer_clients = {}
+_mailer_clients_lock = threading.Lock()
+
+
+def get_mailer_client():
+    """Returns the process-wide client of the configured MAILER_CLIENT_CLASS."""
+    client_class = import_string(settings.MAILER_CLIENT_CLASS)
+    key = (client_class, MAILER_API_KEY)
+    with _mailer_clients_lock:
+        if key not in _mailer_clients:
+            _mailer_clients[key] = client_class({
+                "api_key": MAILER_API_KEY
+            })
+        return _mailer_clients[key]
+
+
+def create_campaign(subject: str, email_content: str, mailer=None) -> int:
+    """Creates a MailerLite campaign and returns its id."""
+    if mailer is None:
+        mailer = get_mailer_client()
 
     params = {
         "name": subject,
@@ -123,5 +202,24 @@ def send_blog_post(
     }
 
     response = mailer.campaigns.create(params)
-    campaign_id = int(response['data']['id'])
+    return int(response['data']['id'])
+
+
+def schedule_campaign(campaign_id: int, mailer=None):
+    """Schedules a MailerLite campaign for instant delivery."""
+    if mailer is None:
+        mailer = get_mailer_client()
     mailer.campaigns.schedule(campaign_id, {"delivery": "instant"})
+
+
+def send_blog_post(
+    subject: str,
+    content: str,
+):
+    """Sends an email with the given body using MailerLite."""
+    # Convert embeds to email-friendly format
+    email_content = convert_embeds_for_email(content)
+
+    mailer = get_mailer_client()
+    campaign_id = create_campaign(subject, email_content, mailer)
+    schedule_campaign(campaign_id, mailer)
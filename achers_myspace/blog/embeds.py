@@ -0,0 +1,283 @@
+"""Providers for third-party embeds found in blog post HTML.
+
+Each provider recognises the iframe ``src`` of one service with a
+precompiled pattern and knows how to replace the iframe with something an
+email client can show (``to_email``), or with a click-to-load facade for the
+site (``to_facade``). Register new services with ``register_provider``.
+
+Blog posts store their body with facades when they are saved, see
+``BlogPage.web_body_html``; the ``embed_facades`` filter rewrites the rest.
+"""
+import re
+from html import escape, unescape
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+PROVIDERS = []
+
+TAG_PATTERN = re.compile(r"<[^>]+>")
+IFRAME_PATTERN = re.compile(
+    r"<iframe\b(?P<attrs>(?:[^>\"']|\"[^\"]*\"|'[^']*')*)>"
+    r"(?P<inner>.*?)</iframe\s*>",
+    re.IGNORECASE | re.DOTALL,
+)
+ATTR_PATTERN = re.compile(
+    r"""([^\s=/>"']+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>"']+)))?"""
+)
+
+
+def register_provider(provider):
+    """Adds an embed provider, it is tried after the ones already registered."""
+    PROVIDERS.append(provider)
+    return provider
+
+
+def find_provider(src: str):
+    """Returns ``(provider, match)`` for an iframe src, or ``(None, None)``."""
+    for provider in PROVIDERS:
+        match = provider.match(src)
+        if match:
+            return provider, match
+    return None, None
+
+
+def parse_attrs(text: str) -> dict:
+    """Parses the attributes of an HTML start tag into a dict."""
+    attrs = {}
+    for name, double, single, bare in ATTR_PATTERN.findall(text):
+        attrs[name.lower()] = unescape(double or single or bare)
+    return attrs
+
+
+def build_tag(name: str, attrs: dict, content: str | None = None) -> str:
+    """Returns an HTML tag; ``content=None`` makes a void tag like ``<img/>``."""
+    attributes = "".join(
+        f' {key}="{escape(value, quote=True)}"' for key, value in attrs.items()
+    )
+    if content is None:
+        return f"<{name}{attributes}/>"
+    return f"<{name}{attributes}>{content}</{name}>"
+
+
+class EmbedProvider:
+    """Base class for embed providers."""
+
+    name = ""
+    # Cheap substring checks run before the pattern
+    domains = ()
+    pattern = None
+
+    def match(self, src: str):
+        if not any(domain in src for domain in self.domains):
+            return None
+        return self.pattern.search(src)
+
+    def to_email(self, match, attrs: dict, inner: str = "") -> str:
+        """Returns the email-friendly HTML replacing the iframe.
+
+        ``attrs`` are the iframe's attributes, ``inner`` its fallback content.
+        """
+        raise NotImplementedError
+
+    def facade_url(self, match, attrs: dict, inner: str = "") -> str:
+        """Returns the page the facade links to when scripts don't run."""
+        raise NotImplementedError
+
+    def facade_label(self, attrs: dict, inner: str = "") -> str:
+        return attrs.get("title", "") or f"Play on {self.name.title()}"
+
+    def facade_thumbnail(self, match) -> str | None:
+        return None
+
+    def facade_iframe_attrs(self, attrs: dict) -> dict:
+        """Returns the attributes of the iframe loaded on click."""
+        return attrs
+
+    def to_facade(self, match, attrs: dict, inner: str = "") -> str:
+        """Returns a placeholder that loads the iframe when clicked.
+
+        The iframe waits in a ``<template>``, see ``js/achers_myspace.js``.
+        """
+        label = self.facade_label(attrs, inner)
+        content = build_tag(
+            "span", {"class": "embed-facade-label"}, escape(label, quote=False)
+        )
+        thumbnail = self.facade_thumbnail(match)
+        if thumbnail:
+            content = build_tag("img", {
+                "src": thumbnail, "alt": "", "loading": "lazy",
+            }) + content
+        iframe = build_tag("iframe", self.facade_iframe_attrs(attrs), inner)
+        link = build_tag("a", {
+            "class": "embed-facade-link",
+            "href": self.facade_url(match, attrs, inner),
+            "aria-label": label,
+        }, content)
+        return build_tag(
+            "div",
+            {"class": f"embed-facade embed-facade-{self.name}"},
+            build_tag("template", {}, iframe) + link,
+        )
+
+
+class YouTubeProvider(EmbedProvider):
+    name = "youtube"
+    domains = ("youtube.com", "youtu.be")
+    pattern = re.compile(r"embed/([^?]+)")
+
+    def video_id(self, match) -> str:
+        return match.group(1)
+
+    def url(self, match) -> str:
+        return f"https://www.youtube.com/watch?v={self.video_id(match)}"
+
+    def thumbnail_url(self, match) -> str:
+        return (
+            f"https://img.youtube.com/vi/{self.video_id(match)}/maxresdefault.jpg"
+        )
+
+    def facade_url(self, match, attrs: dict, inner: str = "") -> str:
+        return self.url(match)
+
+    def facade_label(self, attrs: dict, inner: str = "") -> str:
+        title = attrs.get("title", "")
+        if not title or title == "YouTube video player":
+            return "Play video"
+        return title
+
+    def facade_thumbnail(self, match) -> str | None:
+        # Unlike maxresdefault, exists for every video
+        return f"https://i.ytimg.com/vi/{self.video_id(match)}/hqdefault.jpg"
+
+    def facade_iframe_attrs(self, attrs: dict) -> dict:
+        # The click on the facade was the click on play
+        scheme, netloc, path, query, fragment = urlsplit(attrs.get("src", ""))
+        params = dict(parse_qsl(query, keep_blank_values=True))
+        params["autoplay"] = "1"
+        return {
+            **attrs,
+            "src": urlunsplit((scheme, netloc, path, urlencode(params), fragment)),
+        }
+
+    def to_email(self, match, attrs: dict, inner: str = "") -> str:
+        img = build_tag("img", {
+            "src": self.thumbnail_url(match),
+            "alt": "Watch on YouTube",
+            "style": "max-width: 100%; height: auto; border: 2px solid #333;",
+        })
+        link = build_tag(
+            "a", {"href": self.url(match), "style": "display: block;"}, img
+        )
+        return build_tag(
+            "div", {"style": "margin: 20px 0; text-align: center;"}, link
+        )
+
+
+class LinkCardProvider(EmbedProvider):
+    """Replaces the iframe with a styled link to the service."""
+
+    default_title = ""
+    title_prefix = ""
+
+    def url(self, match, inner: str = "") -> str:
+        raise NotImplementedError
+
+    def title(self, attrs: dict, inner: str = "") -> str:
+        title = attrs.get("title", self.default_title)
+        if title != self.default_title:
+            title = title.replace(self.title_prefix, "")
+        return title
+
+    def facade_url(self, match, attrs: dict, inner: str = "") -> str:
+        return self.url(match, inner)
+
+    def facade_label(self, attrs: dict, inner: str = "") -> str:
+        return self.title(attrs, inner)
+
+    def to_email(self, match, attrs: dict, inner: str = "") -> str:
+        link = build_tag(
+            "a",
+            {
+                "href": self.url(match, inner),
+                "style": (
+                    "color: #ff6b6b; font-weight: bold; "
+                    "text-decoration: none;"
+                ),
+            },
+            escape(self.title(attrs, inner), quote=False),
+        )
+        text_p = build_tag("p", {"style": "margin: 0;"}, link)
+        return build_tag(
+            "div",
+            {
+                "style": (
+                    "margin: 20px 0; padding: 15px; background: #222; "
+                    "border: 2px solid #333; text-align: center;"
+                ),
+            },
+            text_p,
+        )
+
+
+class SpotifyProvider(LinkCardProvider):
+    name = "spotify"
+    domains = ("spotify.com",)
+    pattern = re.compile(r"spotify\.com/embed/(playlist|album|track)/([^?]+)")
+    default_title = "Listen on Spotify"
+    title_prefix = "Spotify Embed: "
+
+    def url(self, match, inner: str = "") -> str:
+        content_type, content_id = match.groups()
+        return f"https://open.spotify.com/{content_type}/{content_id}"
+
+
+class BandcampProvider(LinkCardProvider):
+    """Bandcamp players carry a link to the release as fallback content."""
+
+    name = "bandcamp"
+    domains = ("bandcamp.com",)
+    pattern = re.compile(
+        r"bandcamp\.com/EmbeddedPlayer/(?:.*?/)?(album|track)=(\d+)"
+    )
+    link_pattern = re.compile(
+        r'<a\b[^>]*href="([^"]+)"[^>]*>(.*?)</a>', re.IGNORECASE | re.DOTALL
+    )
+    default_title = "Listen on Bandcamp"
+
+    def url(self, match, inner: str = "") -> str:
+        link = self.link_pattern.search(inner)
+        if link:
+            return unescape(link.group(1))
+        content_type, content_id = match.groups()
+        return f"https://bandcamp.com/EmbeddedPlayer/{content_type}={content_id}/"
+
+    def title(self, attrs: dict, inner: str = "") -> str:
+        link = self.link_pattern.search(inner)
+        if link:
+            text = unescape(TAG_PATTERN.sub("", link.group(2)))
+            text = " ".join(text.split())
+            if text:
+                return text
+        return super().title(attrs, inner)
+
+
+def convert_embeds_for_web(html_content: str) -> str:
+    """Replaces the iframes of known providers with click-to-load facades.
+
+    Iframes of other services are left alone.
+    """
+    if "<iframe" not in html_content.lower():
+        return html_content
+
+    def replace(match):
+        attrs = parse_attrs(match.group("attrs"))
+        provider, src_match = find_provider(attrs.get("src", ""))
+        if provider is None:
+            return match.group(0)
+        return provider.to_facade(src_match, attrs, match.group("inner"))
+
+    return IFRAME_PATTERN.sub(replace, html_content)
+
+
+register_provider(YouTubeProvider())
+register_provider(SpotifyProvider())
+register_provider(BandcampProvider())
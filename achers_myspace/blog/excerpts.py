@@ -0,0 +1,67 @@
+"""Excerpts of blog posts for the wall.
+
+A post's excerpt is its rendered body up to a ``[more]`` paragraph, or its
+first ``WALL_EXCERPT_WORDS`` words, with the images, players and other
+embeds taken out and a thumbnail of the first image in front. It is made
+when the post is saved and stored in ``BlogPage.excerpt_html``, so a page
+of the wall stays small however long its posts are. The excerpt is left
+empty when it would show the whole body, the wall shows the body then.
+"""
+import re
+
+from django.conf import settings
+from django.utils.text import Truncator
+
+from blog import image_formats
+
+# A paragraph of its own, the editor has no other way to place a marker
+MORE_MARKER = re.compile(r"<p\b[^>]*>\s*\[more\]\s*</p>", re.IGNORECASE)
+MEDIA = re.compile(
+    r"<picture\b.*?</picture\s*>"
+    r"|<iframe\b.*?</iframe\s*>"
+    r"|<(?:img|embed|source)\b[^>]*>",
+    re.IGNORECASE | re.DOTALL,
+)
+# Left behind by the media, e.g. the responsive-object wrapper of players
+EMPTY_ELEMENT = re.compile(
+    r"<(div|p|figure|span|a)\b[^>]*>\s*</\1\s*>", re.IGNORECASE
+)
+
+
+def remove_marker(html: str) -> str:
+    """Returns the rendered body without its ``[more]`` marker."""
+    return MORE_MARKER.sub("", html, count=1)
+
+
+def strip_media(html: str) -> str:
+    html = MEDIA.sub("", html)
+    while True:
+        stripped = EMPTY_ELEMENT.sub("", html)
+        if stripped == html:
+            return html.strip()
+        html = stripped
+
+
+def render_thumbnail(body: str) -> str:
+    image, alt = image_formats.first_image(body)
+    if image is None:
+        return ""
+    return str(image_formats.THUMBNAIL.image_to_html(image, alt))
+
+
+def make_excerpt(html: str, body: str, words: int | None = None) -> str:
+    """Returns the excerpt of a post from its rendered ``html``, with the
+    marker still in, and its rich text ``body`` for the thumbnail.
+
+    Returns an empty string when the excerpt would be the whole body.
+    """
+    words = words or settings.WALL_EXCERPT_WORDS
+    marker = MORE_MARKER.search(html)
+    if marker:
+        html = html[:marker.start()]
+    text = strip_media(html)
+    excerpt = Truncator(text).words(words, html=True)
+    if not marker and excerpt == text and text == html.strip():
+        # Nothing was cut or taken out
+        return ""
+    return render_thumbnail(body) + excerpt
@@ -0,0 +1,175 @@
+"""RSS, Atom and JSON feeds of the posts on the wall.
+
+``/feeds/rss/``, ``/feeds/atom/`` and ``/feeds/json/`` list the newest posts
+in the order of the wall, ``?tag=`` narrows them to a tag like it does on
+the wall. Items carry the stored body HTML, converted like newsletters are
+so feed readers get absolute image URLs and links instead of players.
+
+Feeds are stored in the page cache and purged with the wall pages when a
+post is published, unpublished or deleted, see ``page_cache.purge_post``.
+They send the same kind of validators as the wall, so a poller whose copy
+is current gets a 304 without the feed being built.
+"""
+import copy
+import json
+from typing import NamedTuple
+
+from django.contrib.syndication.views import Feed
+from django.http import Http404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed, SyndicationFeed
+from django.utils.http import http_date, urlencode
+from wagtail.models import Site
+
+from achers_myspace import page_cache
+from achers_myspace.conditional import make_etag
+from blog.email import convert_embeds_for_email
+from home import wall
+from home.models import HomePage
+
+# Feed readers poll for new posts, they don't page back through the wall
+FEED_LENGTH = 20
+
+FEED_URL_NAMES = ("rss_feed", "atom_feed", "json_feed")
+
+
+class JsonFeedGenerator(SyndicationFeed):
+    """Writes a JSON Feed 1.1, https://www.jsonfeed.org/version/1.1/."""
+
+    content_type = "application/feed+json; charset=utf-8"
+
+    def write(self, outfile, encoding):
+        feed = {
+            "version": "https://jsonfeed.org/version/1.1",
+            "title": self.feed["title"],
+            "home_page_url": self.feed["link"],
+            "feed_url": self.feed["feed_url"],
+            "description": self.feed["description"],
+            "language": self.feed["language"],
+            "items": [self.item_json(item) for item in self.items],
+        }
+        outfile.write(json.dumps(
+            {name: value for name, value in feed.items() if value},
+            ensure_ascii=False,
+        ))
+
+    def item_json(self, item: dict) -> dict:
+        data = {
+            "id": item["unique_id"] or item["link"],
+            "url": item["link"],
+            "title": item["title"],
+            "content_html": item["description"],
+            "tags": list(item["categories"] or ()),
+        }
+        if item["pubdate"]:
+            data["date_published"] = item["pubdate"].isoformat()
+        if item["updateddate"]:
+            data["date_modified"] = item["updateddate"].isoformat()
+        return data
+
+
+class FeedSubject(NamedTuple):
+    home: HomePage
+    tag: str | None
+
+
+def feed_urls(tag: str | None = None):
+    """Yields ``(path, query)`` of every feed of the wall, or of a tag."""
+    query = urlencode({"tag": tag}) if tag else ""
+    for name in FEED_URL_NAMES:
+        yield reverse(name), query
+
+
+class PostsFeed(Feed):
+    """The RSS feed of the wall, the other feeds only change the format."""
+
+    feed_type = Rss201rev2Feed
+
+    def __call__(self, request, *args, **kwargs):
+        subject = self.get_object(request)
+        etag = make_etag(
+            "feed", type(self).__name__, subject.home.live_revision_id,
+            wall.modified(subject.home.pk), subject.tag,
+        )
+        last_modified = subject.home.get_last_modified(request)
+        timestamp = int(last_modified.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = super().__call__(request, subject=subject)
+            page_cache.allow(request)
+        # Replaces the date of the newest item Feed sets, the wall also
+        # changes when posts are unpublished
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(timestamp)
+        return response
+
+    def get_object(self, request, subject=None):
+        if subject is not None:
+            return subject
+        site = Site.find_for_request(request)
+        home = site.root_page.specific if site else None
+        if not isinstance(home, HomePage):
+            raise Http404("No wall on this site.")
+        tag = request.GET.get("tag") or None
+        if tag and tag not in wall.tag_counts(home.pk):
+            raise Http404("No posts with this tag.")
+        return FeedSubject(home, tag)
+
+    def get_feed(self, obj, request):
+        # One instance serves every request, the methods building the feed
+        # find the request on a copy
+        feed = copy.copy(self)
+        feed.request = request
+        return super(PostsFeed, feed).get_feed(obj, request)
+
+    def title(self, subject):
+        if subject.tag:
+            return f"{subject.home.title}: {subject.tag}"
+        return subject.home.title
+
+    def link(self, subject):
+        url = subject.home.get_url(self.request)
+        if subject.tag:
+            url += f"?{urlencode({'tag': subject.tag})}"
+        return url
+
+    def description(self, subject):
+        return subject.home.search_description or subject.home.title
+
+    def items(self, subject):
+        keys = wall.get_post_keys(subject.home.pk, subject.tag)[:FEED_LENGTH]
+        return wall.fetch_posts([wall.key_post_id(key) for key in keys])
+
+    def item_title(self, post):
+        return post.title
+
+    def item_description(self, post):
+        return convert_embeds_for_email(
+            post.rendered_body, self.request.build_absolute_uri("/")
+        )
+
+    def item_link(self, post):
+        return post.get_url(self.request)
+
+    def item_pubdate(self, post):
+        return post.first_published_at
+
+    def item_updateddate(self, post):
+        return post.last_published_at
+
+    def item_categories(self, post):
+        return post.tag_names
+
+
+class AtomPostsFeed(PostsFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, subject):
+        return self.description(subject)
+
+
+class JsonPostsFeed(PostsFeed):
+    feed_type = JsonFeedGenerator
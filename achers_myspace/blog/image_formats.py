@@ -0,0 +1,193 @@
+"""Responsive image formats for rich text.
+
+Wagtail picks these up through the ``image_formats`` module of the app.
+They replace the default ``fullwidth``/``left``/``right`` formats, so
+existing bodies keep working, with ones that render a ``<picture>`` with
+AVIF and WebP sources, ``srcset``/``sizes`` and lazy loading.
+
+Renditions are not created while a body renders: until they all exist an
+image renders as the rendition of the plain format if there is one, or as
+the original file scaled down by its ``width``/``height``. They are made in
+bulk by ``generate_renditions``, from the ``images.renditions`` job queued
+when a post is published and from the ``prewarm_renditions`` command, which
+then render the body again.
+
+``THUMBNAIL`` isn't offered to editors, it renders the first image of a
+post in its excerpt on the wall, see ``blog.excerpts``.
+"""
+import logging
+
+from django.conf import settings
+from django.forms.utils import flatatt
+from django.utils.safestring import mark_safe
+from django.utils.translation import gettext_lazy as _
+from wagtail.images import get_image_model
+from wagtail.images.formats import (
+    Format,
+    get_image_format,
+    register_image_format,
+    unregister_image_format,
+)
+from wagtail.images.models import Filter, ResponsiveImage
+from wagtail.rich_text.rewriters import FIND_EMBED_TAG, extract_attrs
+
+logger = logging.getLogger(__name__)
+
+# Matches the max-width of the post body and of the wall on small screens
+MOBILE_BREAKPOINT = 768
+
+SOURCE_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+
+
+class ResponsiveFormat(Format):
+    """A rich text image format rendering a responsive ``<picture>``.
+
+    ``width`` is the width of the ``src`` image, ``widths`` the other
+    candidates offered in ``srcset``. Images are never upscaled.
+    """
+
+    def __init__(self, name, label, classname, width, widths, sizes):
+        super().__init__(name, label, classname, f"width-{width}")
+        self.width = width
+        self.widths = sorted({width, *widths})
+        self.sizes = sizes
+
+    def image_widths(self, image) -> list[int]:
+        return sorted({min(width, image.width) for width in self.widths})
+
+    def base_spec(self, image) -> str:
+        return f"width-{min(self.width, image.width)}"
+
+    def filter_specs(self, image) -> list[str]:
+        """Returns the specs of every rendition the image renders with."""
+        specs = []
+        for fmt in [None, *settings.RICHTEXT_IMAGE_FORMATS]:
+            suffix = f"|format-{fmt}" if fmt else ""
+            specs.extend(
+                f"width-{width}{suffix}" for width in self.image_widths(image)
+            )
+        return specs
+
+    def original_to_html(self, image, attrs) -> str:
+        """Returns an ``<img>`` of the original file, at the size of the
+        ``src`` rendition."""
+        width = min(self.width, image.width)
+        height = round(image.height * width / image.width)
+        attrs = {"src": image.file.url, "width": width, "height": height,
+                 **attrs}
+        return mark_safe(f"<img{flatatt(attrs)}>")
+
+    def image_to_html(self, image, alt_text, extra_attributes=None):
+        if extra_attributes:
+            # The editor only needs the plain image
+            return super().image_to_html(image, alt_text, extra_attributes)
+
+        specs = self.filter_specs(image)
+        renditions = image.find_existing_renditions(
+            *[Filter(spec=spec) for spec in specs]
+        )
+        by_spec = {f.spec: rendition for f, rendition in renditions.items()}
+        attrs = {"alt": alt_text, "loading": "lazy", "decoding": "async"}
+        if self.classname:
+            attrs["class"] = self.classname
+        if len(by_spec) < len(specs):
+            rendition = by_spec.get(self.base_spec(image))
+            if rendition is not None:
+                return rendition.img_tag(attrs)
+            return self.original_to_html(image, attrs)
+
+        widths = self.image_widths(image)
+        sources = []
+        for fmt in settings.RICHTEXT_IMAGE_FORMATS:
+            source = {
+                "type": SOURCE_TYPES.get(fmt, f"image/{fmt}"),
+                "srcset": ResponsiveImage.get_width_srcset(
+                    [by_spec[f"width-{width}|format-{fmt}"] for width in widths]
+                ),
+                "sizes": self.sizes,
+            }
+            sources.append(f"<source{flatatt(source)}>")
+
+        fallbacks = [by_spec[f"width-{width}"] for width in widths]
+        if len(fallbacks) > 1:
+            attrs["srcset"] = ResponsiveImage.get_width_srcset(fallbacks)
+            attrs["sizes"] = self.sizes
+        img = by_spec[self.base_spec(image)].img_tag(attrs)
+        return mark_safe(f"<picture>{''.join(sources)}{img}</picture>")
+
+
+def body_images(body: str) -> list[tuple]:
+    """Returns ``(image, format)`` for each image embedded in rich text."""
+    embeds = []
+    for match in FIND_EMBED_TAG.finditer(body or ""):
+        attrs = extract_attrs(match.group(1))
+        if attrs.get("embedtype") == "image" and attrs.get("id", "").isdigit():
+            embeds.append((int(attrs["id"]), attrs.get("format", "")))
+    images = get_image_model().objects.in_bulk({pk for pk, _ in embeds})
+
+    found = []
+    for pk, format_name in embeds:
+        try:
+            image_format = get_image_format(format_name)
+        except KeyError:
+            continue
+        if pk in images and isinstance(image_format, ResponsiveFormat):
+            found.append((images[pk], image_format))
+    return found
+
+
+def first_image(body: str):
+    """Returns the first image embedded in rich text and its alt text."""
+    for match in FIND_EMBED_TAG.finditer(body or ""):
+        attrs = extract_attrs(match.group(1))
+        if attrs.get("embedtype") == "image" and attrs.get("id", "").isdigit():
+            image = get_image_model().objects.filter(pk=attrs["id"]).first()
+            if image is not None:
+                return image, attrs.get("alt", "")
+    return None, ""
+
+
+def generate_renditions(body: str) -> int:
+    """Creates the missing renditions of the images in rich text, and of
+    the thumbnail of the first one.
+
+    Returns the number of renditions the images render with.
+    """
+    count = 0
+    images = body_images(body)
+    if images:
+        images.insert(0, (first_image(body)[0], THUMBNAIL))
+    for image, image_format in images:
+        try:
+            count += len(image.get_renditions(*image_format.filter_specs(image)))
+        except Exception:
+            # A broken image must not keep the other images from renditions
+            logger.warning(f"Could not create renditions of image {image.pk}",
+                           exc_info=True)
+    return count
+
+
+for name in ("fullwidth", "left", "right"):
+    unregister_image_format(name)
+
+register_image_format(ResponsiveFormat(
+    "fullwidth", _("Full width"), "richtext-image full-width",
+    width=800, widths=(400, 1200, 1600),
+    sizes=f"(max-width: {MOBILE_BREAKPOINT}px) calc(100vw - 40px), 800px",
+))
+register_image_format(ResponsiveFormat(
+    "left", _("Left-aligned"), "richtext-image left",
+    width=500, widths=(320, 1000),
+    sizes=f"(max-width: {MOBILE_BREAKPOINT}px) calc(100vw - 40px), 500px",
+))
+register_image_format(ResponsiveFormat(
+    "right", _("Right-aligned"), "richtext-image right",
+    width=500, widths=(320, 1000),
+    sizes=f"(max-width: {MOBILE_BREAKPOINT}px) calc(100vw - 40px), 500px",
+))
+
+THUMBNAIL = ResponsiveFormat(
+    "thumbnail", _("Thumbnail"), "post-thumbnail",
+    width=240, widths=(480, 800),
+    sizes=f"(max-width: {MOBILE_BREAKPOINT}px) calc(100vw - 40px), 240px",
+)
@@ -0,0 +1,137 @@
+"""A small DB-backed job queue.
+
+Tasks are plain functions registered under a name with ``@task``. They take
+the ``BackgroundJob`` being run and may store progress in ``job.result`` so
+a retry can pick up where a failed attempt stopped. Jobs are queued with
+``enqueue`` and run by the ``run_jobs`` management command.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from blog.models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+# A running job not updated for this long is assumed to belong to a worker
+# that died, and is picked up again.
+STALE_AFTER = timedelta(minutes=15)
+
+
+def task(name: str):
+    """Registers a function as the task run for jobs named ``name``."""
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(task_name: str, key: str, payload: dict | None = None,
+            max_attempts: int = 5) -> tuple[BackgroundJob, bool]:
+    """Queues a job unless one with the same key already exists."""
+    return BackgroundJob.objects.get_or_create(
+        key=key,
+        defaults={
+            "task": task_name,
+            "payload": payload or {},
+            "max_attempts": max_attempts,
+        },
+    )
+
+
+def backoff(attempts: int) -> timedelta:
+    """Returns how long to wait before retrying after ``attempts`` tries."""
+    delay = settings.JOB_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.JOB_RETRY_MAX_DELAY))
+
+
+def fail_stale(now) -> int:
+    """Fails stale running jobs without attempts left, e.g. ones that kill
+    the worker every time. Returns how many there were."""
+    return BackgroundJob.objects.filter(
+        status=BackgroundJob.Status.RUNNING,
+        updated_at__lte=now - STALE_AFTER,
+        attempts__gte=F("max_attempts"),
+    ).update(
+        status=BackgroundJob.Status.FAILED,
+        last_error="The worker stopped during the last attempt.",
+        updated_at=now,
+    )
+
+
+def claim_next() -> BackgroundJob | None:
+    """Marks the next due job as running and returns it."""
+    now = timezone.now()
+    if failed := fail_stale(now):
+        logger.error(f"Failed {failed} job(s) whose worker stopped")
+    due = BackgroundJob.objects.filter(
+        Q(status=BackgroundJob.Status.PENDING, run_after__lte=now)
+        | Q(
+            status=BackgroundJob.Status.RUNNING,
+            updated_at__lte=now - STALE_AFTER,
+            attempts__lt=F("max_attempts"),
+        )
+    ).order_by("run_after", "pk")
+
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        job = due.first()
+        if job is None:
+            return None
+        job.status = BackgroundJob.Status.RUNNING
+        job.attempts += 1
+        job.save(update_fields=["status", "attempts", "updated_at"])
+    return job
+
+
+def run_now(job: BackgroundJob) -> bool:
+    """Runs a job in this process instead of waiting for the worker."""
+    job.status = BackgroundJob.Status.RUNNING
+    job.attempts += 1
+    job.save(update_fields=["status", "attempts", "updated_at"])
+    return run_job(job)
+
+
+def run_job(job: BackgroundJob) -> bool:
+    """Runs a claimed job, scheduling a retry with backoff if it fails."""
+    try:
+        func = TASKS[job.task]
+        func(job)
+    except Exception as e:
+        logger.error(
+            f"Job {job.key} failed (attempt {job.attempts}): {e}",
+            exc_info=True,
+        )
+        job.last_error = f"{type(e).__name__}: {e}"
+        if job.attempts >= job.max_attempts:
+            job.status = BackgroundJob.Status.FAILED
+        else:
+            job.status = BackgroundJob.Status.PENDING
+            job.run_after = timezone.now() + backoff(job.attempts)
+        job.save()
+        return False
+
+    job.status = BackgroundJob.Status.SUCCEEDED
+    job.last_error = ""
+    job.save()
+    logger.info(f"Job {job.key} succeeded")
+    return True
+
+
+def run_pending(limit: int | None = None) -> int:
+    """Runs due jobs until none are left or ``limit`` ran. Returns the count."""
+    count = 0
+    while limit is None or count < limit:
+        job = claim_next()
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
@@ -0,0 +1,208 @@
+"""A MailerLite client that reuses pooled HTTP connections.
+
+The stock ``mailerlite.Client`` goes through ``requests.request`` for every
+call, which opens a new TLS connection each time and waits up to two minutes
+for an answer. ``PooledMailerClient`` sends everything through one
+process-wide ``requests.Session`` with keep-alive connections, separate
+connect/read timeouts and retries for idempotent calls, and records the
+latency and outcome of each call in ``achers_myspace.metrics``.
+
+``RateLimiter`` spaces out the calls of batch sends, which run several at
+once, to stay under MailerLite's limit of requests per minute.
+"""
+import json
+import logging
+import re
+import threading
+import time
+from urllib.parse import urljoin
+
+import mailerlite
+import requests
+from django.conf import settings
+from mailerlite.api_client import ApiClient
+from prometheus_client import Counter, Histogram
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+MAILER_CALLS = Counter(
+    "mailer_api_calls_total",
+    "MailerLite API calls by endpoint and outcome.",
+    ["method", "endpoint", "outcome"],
+)
+MAILER_LATENCY = Histogram(
+    "mailer_api_call_seconds",
+    "Latency of MailerLite API calls.",
+    ["method", "endpoint"],
+)
+
+# Numeric ids are dropped from the endpoint label to keep it bounded
+ID_PATTERN = re.compile(r"/\d+(?=/|$)")
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def build_session() -> requests.Session:
+    """Returns a session with a keep-alive pool and idempotent retries."""
+    retry = Retry(
+        total=settings.MAILER_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        # Retry.DEFAULT_ALLOWED_METHODS leaves out POST, a retried create
+        # could send a second campaign
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.MAILER_POOL_SIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Returns the process-wide MailerLite session."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = build_session()
+        return _session
+
+
+def reset_session():
+    """Closes the pooled connections, the next call opens new ones."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def error_outcome(error: requests.RequestException) -> str:
+    """Returns the outcome label for a failed call."""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return f"http_{error.response.status_code}"
+    if isinstance(error, requests.Timeout) or "timed out" in str(error):
+        # Retried read timeouts surface as a ConnectionError
+        return "timeout"
+    if isinstance(error, requests.ConnectionError):
+        return "connection_error"
+    return "error"
+
+
+class PooledApiClient(ApiClient):
+    """``ApiClient`` that goes through the shared session."""
+
+    def __init__(self, config=None) -> None:
+        config = config or {}
+        super().__init__(config)
+        self.host = config.get("host", settings.MAILER_API_HOST)
+        self.timeout = (
+            config.get("connect_timeout", settings.MAILER_CONNECT_TIMEOUT),
+            config.get("read_timeout", settings.MAILER_READ_TIMEOUT),
+        )
+
+    def request(self, method, path, query_params=None, body=None):
+        method = method.lower()
+        kwargs = {
+            "params": query_params,
+            "headers": self.headers,
+            "timeout": self.timeout,
+        }
+        if method in ("post", "put"):
+            kwargs["data"] = json.dumps(body)
+
+        endpoint = ID_PATTERN.sub("/:id", path)
+        labels = {"method": method.upper(), "endpoint": endpoint}
+        outcome = "error"
+        started = time.perf_counter()
+        try:
+            response = get_session().request(
+                method, urljoin(self.host, path), **kwargs
+            )
+            response.raise_for_status()
+            outcome = "ok"
+        except requests.RequestException as e:
+            outcome = error_outcome(e)
+            logger.warning(f"MailerLite {method.upper()} {path} failed: {e}")
+            raise
+        finally:
+            MAILER_LATENCY.labels(**labels).observe(
+                time.perf_counter() - started
+            )
+            MAILER_CALLS.labels(outcome=outcome, **labels).inc()
+        return response
+
+
+class PooledMailerClient(mailerlite.Client):
+    """``mailerlite.Client`` whose API classes share pooled connections."""
+
+    def __init__(self, config=None):
+        super().__init__(config or {})
+        self.api_client = PooledApiClient(config)
+        for api in vars(self).values():
+            if hasattr(api, "api_client"):
+                api.api_client = self.api_client
+
+
+def retry_after(error: requests.RequestException) -> float | None:
+    """Returns the seconds a rate limited call asks to wait, else None."""
+    response = getattr(error, "response", None)
+    if response is None or response.status_code != 429:
+        return None
+    try:
+        return max(float(response.headers.get("Retry-After", 60)), 0)
+    except ValueError:
+        return 60.0
+
+
+class RateLimiter:
+    """Spaces calls from any number of threads ``60 / per_minute`` apart.
+
+    A call answered with 429 pauses every thread for its ``Retry-After``
+    and is tried again, a rate limited request created nothing.
+    """
+
+    def __init__(self, per_minute: int, retries: int = 3,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.interval = 60 / per_minute if per_minute else 0
+        self.retries = retries
+        self.clock = clock
+        self.sleep = sleep
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        """Blocks until the next call may start."""
+        with self.lock:
+            now = self.clock()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            self.sleep(slot - now)
+
+    def pause(self, seconds: float) -> None:
+        """Holds back every call for ``seconds`` from now."""
+        with self.lock:
+            self.next_slot = max(self.next_slot, self.clock() + seconds)
+
+    def call(self, func, *args, **kwargs):
+        """Calls ``func`` in the next free slot."""
+        for attempt in range(self.retries + 1):
+            self.wait()
+            try:
+                return func(*args, **kwargs)
+            except requests.RequestException as e:
+                delay = retry_after(e)
+                if delay is None or attempt == self.retries:
+                    raise
+                logger.warning(f"MailerLite rate limited, waiting {delay}s")
+                self.pause(delay)
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from achers_myspace import page_cache
+from blog.models import BlogPage
+from blog.tasks import queue_export
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the responsive renditions of the images in blog posts and "
+        "re-renders the bodies that use them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--live",
+            action="store_true",
+            help="Only prepare published posts.",
+        )
+
+    def handle(self, *args, **options):
+        posts = BlogPage.objects.filter(body__contains='embedtype="image"')
+        if options["live"]:
+            posts = posts.live()
+
+        count = changed = 0
+        for post in posts.order_by("-date").iterator():
+            count += 1
+            if post.prepare_renditions():
+                changed += 1
+                self.stdout.write(f"Prepared '{post.title}'")
+
+        if changed:
+            page_cache.purge_all()
+            queue_export()
+        self.stdout.write(self.style.SUCCESS(
+            f"Prepared renditions for {count} post(s), {changed} re-rendered."
+        ))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from achers_myspace import page_cache
+from blog.models import BlogPage
+from blog.tasks import queue_export
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-renders the rich text body HTML and the wall excerpts of "
+        "existing blog posts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--missing",
+            action="store_true",
+            help=(
+                "Only render posts that have no stored body HTML, or body "
+                "HTML with player facades, yet."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        posts = BlogPage.objects.all()
+        if options["missing"]:
+            posts = posts.filter(Q(body_html="") | Q(web_body_html=""))
+
+        count = 0
+        for post in posts.iterator():
+            # Update the row directly so no new revision is created
+            BlogPage.objects.filter(pk=post.pk).update(**post.render_fields())
+            count += 1
+
+        if count:
+            page_cache.purge_all()
+            queue_export()
+        self.stdout.write(self.style.SUCCESS(f"Rendered {count} blog post(s)."))
@@ -0,0 +1,61 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from achers_myspace import metrics
+from blog.jobs import run_pending
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Runs queued background jobs, such as newsletter sends."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run the jobs that are due and exit.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=5,
+            help="Seconds to wait when there is nothing to do.",
+        )
+
+    def handle(self, *args, **options):
+        # Apart from gunicorn's, which clears its files when it starts. The
+        # processes of static exports inherit the group.
+        metrics.set_process_group("jobs")
+        if options["once"]:
+            count = run_pending()
+            self.stdout.write(f"Ran {count} job(s).")
+            return
+
+        # Jobs update the wall index and purge pages, which the web
+        # processes only see in a cache they share with this one
+        for alias, config in settings.CACHES.items():
+            if config["BACKEND"].endswith(".LocMemCache"):
+                self.stderr.write(self.style.WARNING(
+                    f"The '{alias}' cache is local to this process, pages "
+                    "served by the web processes won't be purged."
+                ))
+        self.stdout.write("Waiting for jobs...")
+        try:
+            while True:
+                # Requests recycle the connections of the web processes,
+                # this loop has to drop broken or expired ones itself
+                close_old_connections()
+                try:
+                    ran = run_pending()
+                except DatabaseError:
+                    logger.exception("Could not claim jobs, retrying")
+                    ran = 0
+                if not ran:
+                    time.sleep(options["sleep"])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped.")
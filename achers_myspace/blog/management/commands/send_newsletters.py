@@ -0,0 +1,121 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from blog.jobs import STALE_AFTER, run_now
+from blog.models import BackgroundJob, BlogPage
+from blog.tasks import SEND_NEWSLETTER_BATCH, queue_newsletter_batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends newsletters for many published blog posts, a campaign for "
+        "each or one digest of all of them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "page_ids", nargs="*", type=int,
+            help="Posts to send.",
+        )
+        parser.add_argument(
+            "--since", type=datetime.date.fromisoformat,
+            help="Only posts dated on or after this day (YYYY-MM-DD).",
+        )
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Send every published post.",
+        )
+        parser.add_argument(
+            "--digest", action="store_true",
+            help="Send one campaign listing all the posts.",
+        )
+        parser.add_argument(
+            "--subject", default="",
+            help="Subject of the digest (default: the newest post's title).",
+        )
+        parser.add_argument(
+            "--now", action="store_true",
+            help="Send in this process instead of queuing for the worker.",
+        )
+        parser.add_argument(
+            "--resume", type=int, metavar="JOB_ID",
+            help="Send what is left of a failed or stalled batch.",
+        )
+
+    def handle(self, *args, **options):
+        if options["resume"]:
+            job = self.resume(options["resume"])
+        else:
+            if not (options["page_ids"] or options["since"] or options["all"]):
+                raise CommandError(
+                    "Give the ids of the posts to send, --since or --all."
+                )
+            posts = BlogPage.objects.live()
+            if options["page_ids"]:
+                posts = posts.filter(pk__in=options["page_ids"])
+            if options["since"]:
+                posts = posts.filter(date__gte=options["since"])
+            page_ids = list(posts.values_list("pk", flat=True))
+            if not page_ids:
+                raise CommandError("No published posts to send.")
+            job, created = queue_newsletter_batch(
+                page_ids, digest=options["digest"], subject=options["subject"]
+            )
+            if not created:
+                raise CommandError(
+                    f"This batch was queued a moment ago as job {job.pk}."
+                )
+
+        if not options["now"]:
+            self.stdout.write(self.style.SUCCESS(
+                f"Queued newsletter batch {job.pk} for the worker."
+            ))
+            return
+
+        succeeded = run_now(job)
+        job.refresh_from_db()
+        result = job.result
+        summary = (
+            f"Sent {result.get('sent', 0)} campaign(s) in "
+            f"{result.get('elapsed_s', 0)}s ({result.get('per_minute', 0)}/min)"
+        )
+        if not succeeded:
+            if job.status == BackgroundJob.Status.FAILED:
+                retry = f"Run again with --resume {job.pk}."
+            else:
+                retry = f"The worker retries batch {job.pk}."
+            raise CommandError(
+                f"{summary}, {result.get('failed', 0)} failed: "
+                f"{job.last_error}. {retry}"
+            )
+        self.stdout.write(self.style.SUCCESS(summary + "."))
+
+    def resume(self, job_id: int) -> BackgroundJob:
+        """Queues a failed batch again, or one whose worker stopped.
+
+        Pending and running batches belong to the worker, resetting them
+        could send the same campaigns from two processes at once.
+        """
+        now = timezone.now()
+        resumable = Q(status=BackgroundJob.Status.FAILED) | Q(
+            status=BackgroundJob.Status.RUNNING,
+            updated_at__lte=now - STALE_AFTER,
+        )
+        jobs = BackgroundJob.objects.filter(
+            pk=job_id, task=SEND_NEWSLETTER_BATCH
+        )
+        # One update, so a worker can't claim the batch in between
+        if not jobs.filter(resumable).update(
+            status=BackgroundJob.Status.PENDING, attempts=0, updated_at=now
+        ):
+            job = jobs.first()
+            if job is None:
+                raise CommandError(f"No newsletter batch {job_id}.")
+            raise CommandError(
+                f"Newsletter batch {job_id} is {job.get_status_display().lower()}"
+                ", only failed or stalled batches can be resumed."
+            )
+        return jobs.get()
@@ -0,0 +1,18 @@
+# Generated by Django 6.1.2 on 2026-10-17 12:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_blogpage_newsletter_campaign_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpage',
+            name='body_html',
+            field=models.TextField(blank=True, editable=False, help_text='Body with rich text references expanded, set on save.', verbose_name='Rendered body'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.1.2 on 2026-10-17 12:27
+
+from django.db import migrations, models
+
+
+def fill_tag_names(apps, schema_editor):
+    BlogPage = apps.get_model('blog', 'BlogPage')
+    BlogPageTag = apps.get_model('blog', 'BlogPageTag')
+    names = {}
+    tagged = BlogPageTag.objects.values_list('content_object_id', 'tag__name')
+    for pk, name in tagged:
+        names.setdefault(pk, []).append(name)
+    for pk, tag_names in names.items():
+        BlogPage.objects.filter(pk=pk).update(tag_names=sorted(tag_names))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_backgroundjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpage',
+            name='tag_names',
+            field=models.JSONField(blank=True, default=list, editable=False, help_text='Sorted names of the tags, set on save.', verbose_name='Tag names'),
+        ),
+        migrations.RunPython(fill_tag_names, migrations.RunPython.noop),
+    ]
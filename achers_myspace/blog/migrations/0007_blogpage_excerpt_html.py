@@ -0,0 +1,18 @@
+# Generated by Django 6.1.2 on 2026-10-17 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_blogpage_tag_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpage',
+            name='excerpt_html',
+            field=models.TextField(blank=True, editable=False, help_text='Start of the body with a thumbnail, shown on the wall. Set on save, empty when it would be the whole body.', verbose_name='Rendered excerpt'),
+        ),
+    ]
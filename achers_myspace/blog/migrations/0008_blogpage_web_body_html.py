@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_blogpage_excerpt_html'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpage',
+            name='web_body_html',
+            field=models.TextField(blank=True, editable=False, help_text='Rendered body with players replaced by click-to-load facades, set on save.', verbose_name='Rendered body for the site'),
+        ),
+    ]
@@ -1,23 +1,52 @@
 import logging
+import time
+from contextlib import contextmanager
 
 from django.db import models
+from django.utils import timezone
 from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 
 from wagtail.models import Page
 from wagtail.fields import RichTextField
 from wagtail.snippets.models import register_snippet
+from wagtail.templatetags.wagtailcore_tags import richtext
 from wagtail.admin.panels import FieldPanel
 from modelcluster.fields import ParentalKey
 from modelcluster.contrib.taggit import ClusterTaggableManager
 from taggit.models import TagBase, ItemBase
 from wagtail_newsletter.models import NewsletterPageMixin
+from prometheus_client import Histogram
 
 
+from achers_myspace.conditional import ConditionalGetMixin, make_etag
+from blog import excerpts, image_formats
 from blog.email import send_blog_post, convert_embeds_for_email
+from blog.embeds import convert_embeds_for_web
 
 
 logger = logging.getLogger(__name__)
 
+NEWSLETTER_SENDS = Histogram(
+    "newsletter_send_seconds",
+    "Time to render and send the newsletter of a post, by outcome.",
+    ["outcome"],
+)
+
+
+@contextmanager
+def record_newsletter_send():
+    """Times sending a newsletter, which failed if the block raises."""
+    started = time.perf_counter()
+    outcome = "failed"
+    try:
+        yield
+        outcome = "sent"
+    finally:
+        NEWSLETTER_SENDS.labels(outcome=outcome).observe(
+            time.perf_counter() - started
+        )
+
 
 @register_snippet
 class BlogTag(TagBase):
@@ -43,15 +72,49 @@ class BlogPageTag(ItemBase):
     )
 
 
-class BlogPage(NewsletterPageMixin, Page):
+class BlogPage(ConditionalGetMixin, NewsletterPageMixin, Page):
     """A Wagtail Page model representing an individual blog post."""
     date = models.DateField("Post date")
     body = RichTextField(blank=True)
     tags = ClusterTaggableManager(through=BlogPageTag, blank=True)
     send_email = models.BooleanField("Send e-mail", default=False)
     top = models.BooleanField("Pin to top", default=False)
+    body_html = models.TextField(
+        "Rendered body",
+        blank=True,
+        editable=False,
+        help_text="Body with rich text references expanded, set on save.",
+    )
+    web_body_html = models.TextField(
+        "Rendered body for the site",
+        blank=True,
+        editable=False,
+        help_text=(
+            "Rendered body with players replaced by click-to-load facades, "
+            "set on save."
+        ),
+    )
+    excerpt_html = models.TextField(
+        "Rendered excerpt",
+        blank=True,
+        editable=False,
+        help_text=(
+            "Start of the body with a thumbnail, shown on the wall. Set on "
+            "save, empty when it would be the whole body."
+        ),
+    )
+    tag_names = models.JSONField(
+        "Tag names",
+        default=list,
+        blank=True,
+        editable=False,
+        help_text="Sorted names of the tags, set on save.",
+    )
 
     newsletter_template = "blog/email.html"
+    # Queries a render of the post may run, including filling Wagtail's
+    # cache of the site root paths, see achers_myspace.testing
+    query_budget = 7
 
     # Only allow BlogPage as child of HomePage
     parent_page_types = ['home.HomePage']
@@ -66,6 +129,102 @@ class BlogPage(NewsletterPageMixin, Page):
         FieldPanel("top"),
     ]
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "body" in update_fields:
+            rendered = self.render_fields()
+            for name, value in rendered.items():
+                setattr(self, name, value)
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, *rendered}
+        if update_fields is None:
+            # Tags edited in the admin or restored from a revision are held
+            # in memory by the ClusterTaggableManager until this save
+            self.tag_names = sorted(tag.name for tag in self.tags.all())
+        return super().save(*args, **kwargs)
+
+    @classmethod
+    def sync_tag_names(cls, page_ids) -> None:
+        """Rewrites ``tag_names`` of the given posts from the tag table."""
+        names = {pk: [] for pk in page_ids}
+        tagged = BlogPageTag.objects.filter(
+            content_object_id__in=names.keys()
+        ).values_list("content_object_id", "tag__name")
+        for pk, name in tagged:
+            names[pk].append(name)
+        for pk, tag_names in names.items():
+            cls.objects.filter(pk=pk).update(tag_names=sorted(tag_names))
+
+    def render_body(self) -> str:
+        """Expands embeds, links and images in the body into front-end HTML."""
+        return excerpts.remove_marker(str(richtext(self.body)))
+
+    def render_body_and_excerpt(self) -> tuple[str, str]:
+        """Returns the front-end HTML of the body and the excerpt of it."""
+        html = str(richtext(self.body))
+        return excerpts.remove_marker(html), excerpts.make_excerpt(
+            html, self.body
+        )
+
+    def render_fields(self) -> dict:
+        """Returns the stored renders of the body, by field name."""
+        body_html, excerpt_html = self.render_body_and_excerpt()
+        return {
+            "body_html": body_html,
+            "web_body_html": convert_embeds_for_web(body_html),
+            "excerpt_html": excerpt_html,
+        }
+
+    def prepare_renditions(self) -> bool:
+        """Creates the responsive renditions of the body images and renders
+        the body with them. Returns whether the stored body changed."""
+        if not image_formats.generate_renditions(self.body):
+            return False
+        rendered = self.render_fields()
+        if all(getattr(self, name) == value for name, value in rendered.items()):
+            return False
+        # Update the row directly so no new revision is created
+        BlogPage.objects.filter(pk=self.pk).update(**rendered)
+        for name, value in rendered.items():
+            setattr(self, name, value)
+        return True
+
+    def get_etag(self, request):
+        # The body also changes without a new revision once its renditions
+        # are ready, see prepare_renditions(), and the tags when one is
+        # renamed or deleted
+        return make_etag(
+            "post", self.live_revision_id, self.body_html,
+            self.web_body_html, self.tag_names,
+        )
+
+    def get_last_modified(self, request):
+        return self.last_published_at
+
+    def serve_preview(self, request, mode_name):
+        # The body being previewed hasn't been saved, so isn't rendered yet
+        self.body_html = self.render_body()
+        self.web_body_html = convert_embeds_for_web(self.body_html)
+        return super().serve_preview(request, mode_name)
+
+    @property
+    def rendered_excerpt(self) -> str:
+        return mark_safe(self.excerpt_html)
+
+    @property
+    def rendered_body(self) -> str:
+        """Returns the pre-rendered body, rendering it if not stored yet."""
+        if self.body_html or not self.body:
+            return mark_safe(self.body_html)
+        return mark_safe(self.render_body())
+
+    @property
+    def rendered_web_body(self) -> str:
+        """Returns the pre-rendered body with player facades, for the site."""
+        if self.web_body_html or not self.body:
+            return mark_safe(self.web_body_html)
+        return mark_safe(convert_embeds_for_web(self.rendered_body))
+
     def get_newsletter_html(self, extra_context=None):
         """Returns the HTML content for the newsletter email."""
         context = self.get_newsletter_context()
@@ -75,14 +234,19 @@ class BlogPage(NewsletterPageMixin, Page):
         )
         return convert_embeds_for_email(html_content)
 
+    def render_newsletter_email(self) -> str:
+        """Returns the HTML sent to MailerLite subscribers for this post."""
+        return render_to_string("blog/newsletter.html", {
+            "page": self,
+        })
+
     def send_newsletter(self) -> bool:
         """Sends an email notification about the blog post."""
         try:
-            subject = f"{self.title}"
-            html_content = render_to_string("blog/newsletter.html", {
-                "page": self,
-            })
-            send_blog_post(subject, html_content)
+            with record_newsletter_send():
+                subject = f"{self.title}"
+                html_content = self.render_newsletter_email()
+                send_blog_post(subject, html_content)
             logger.info(f"Sent blog post email for '{self.title}'")
             return True
         except Exception as e:
@@ -90,3 +254,44 @@ class BlogPage(NewsletterPageMixin, Page):
             import traceback
             logger.error(traceback.format_exc())
             return False
+
+
+class BackgroundJob(models.Model):
+    """A unit of work run outside the request by the ``run_jobs`` worker."""
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        RUNNING = "running", "Running"
+        SUCCEEDED = "succeeded", "Succeeded"
+        FAILED = "failed", "Failed"
+
+    task = models.CharField(max_length=100)
+    key = models.CharField(
+        max_length=255,
+        unique=True,
+        help_text="Idempotency key, a job is only queued once per key.",
+    )
+    payload = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(default=dict, blank=True)
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.PENDING,
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "background job"
+        verbose_name_plural = "background jobs"
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+        ]
+
+    def __str__(self):
+        return self.key
@@ -0,0 +1,121 @@
+"""Newsletters for many posts at once.
+
+A batch sends either a campaign per post, e.g. to backfill the archive, or
+one digest campaign listing them all. Campaigns are created and scheduled
+by ``MAILER_BATCH_CONCURRENCY`` threads sharing a ``RateLimiter``, while the
+calling thread renders the emails and records every finished campaign, so a
+batch that fails part way resumes where it stopped. See
+``blog.tasks.send_newsletter_batch``.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from blog.email import (
+    convert_embeds_for_email,
+    create_campaign,
+    get_mailer_client,
+    schedule_campaign,
+)
+from blog.mailer import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+DIGEST_KEY = "digest"
+
+
+def post_content(post) -> str:
+    return convert_embeds_for_email(post.render_newsletter_email())
+
+
+def digest_content(posts, subject: str) -> str:
+    return convert_embeds_for_email(render_to_string("blog/digest.html", {
+        "subject": subject,
+        "posts": posts,
+    }))
+
+
+def default_subject(posts) -> str:
+    if len(posts) == 1:
+        return posts[0].title
+    return f"{posts[0].title} and {len(posts) - 1} more"
+
+
+def post_campaigns(posts) -> list:
+    """Returns a ``(key, subject, render)`` campaign for each post."""
+    return [(str(post.pk), post.title, partial(post_content, post))
+            for post in posts]
+
+
+def digest_campaign(posts, subject: str = "") -> list:
+    """Returns the ``(key, subject, render)`` campaign of a digest."""
+    if not posts:
+        return []
+    subject = subject or default_subject(posts)
+    return [(DIGEST_KEY, subject, partial(digest_content, posts, subject))]
+
+
+def create_and_schedule(mailer, limiter, subject, content, campaign_id=None):
+    """Sends one campaign, returns its id (if created) and the error."""
+    try:
+        if campaign_id is None:
+            campaign_id = limiter.call(create_campaign, subject, content, mailer)
+        limiter.call(schedule_campaign, campaign_id, mailer)
+    except Exception as e:
+        return campaign_id, e
+    return campaign_id, None
+
+
+def send_campaigns(campaigns, progress: dict, checkpoint=None,
+                   mailer=None) -> dict:
+    """Sends the ``(key, subject, render)`` campaigns not done yet.
+
+    ``progress`` maps keys to ``{"id": campaign id, "scheduled": bool}``
+    and is updated as each campaign finishes, followed by a call to
+    ``checkpoint()``. Created campaigns aren't created again. Returns the
+    counts of this run and its throughput.
+    """
+    mailer = mailer or get_mailer_client()
+    limiter = RateLimiter(settings.MAILER_RATE_LIMIT, settings.MAILER_RETRIES)
+    started = time.perf_counter()
+    sent, errors = 0, {}
+
+    with ThreadPoolExecutor(settings.MAILER_BATCH_CONCURRENCY) as pool:
+        futures = {}
+        for key, subject, render in campaigns:
+            state = progress.get(key, {})
+            if state.get("scheduled"):
+                continue
+            campaign_id = state.get("id")
+            # Rendering queries the database, so it stays in this thread
+            content = render() if campaign_id is None else None
+            future = pool.submit(
+                create_and_schedule, mailer, limiter, subject, content,
+                campaign_id,
+            )
+            futures[future] = key
+
+        for future in as_completed(futures):
+            key = futures[future]
+            campaign_id, error = future.result()
+            progress[key] = {"id": campaign_id, "scheduled": error is None}
+            if error is None:
+                sent += 1
+            else:
+                errors[key] = f"{type(error).__name__}: {error}"
+                logger.warning(f"Newsletter campaign {key} failed: {error}")
+            if checkpoint is not None:
+                checkpoint()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "sent": sent,
+        "failed": len(errors),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 2),
+        "per_minute": round(sent / elapsed * 60, 1) if elapsed else 0.0,
+    }
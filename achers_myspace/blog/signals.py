@@ -0,0 +1,82 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from wagtail.models import Page, Site
+from wagtail.signals import page_published, post_page_move
+
+from achers_myspace import page_cache
+from blog import admin_menu
+from blog.models import BlogPage, BlogTag
+from blog.tasks import queue_export, queue_renditions
+from home import wall
+from home.models import HomePage
+from search import index as search_index
+
+
+def sync_tagged_posts(page_ids) -> None:
+    """Brings the posts of a renamed or deleted tag up to date."""
+    if not page_ids:
+        return
+    with transaction.atomic():
+        BlogPage.sync_tag_names(page_ids)
+        search_index.update_tags(page_ids)
+    # Walls group posts by tag name, and every page shows the tag list
+    for home_id in HomePage.objects.values_list("pk", flat=True):
+        wall.invalidate(home_id)
+    page_cache.purge_all()
+    queue_export()
+
+
+@receiver(post_save, sender=BlogTag)
+def sync_tag_names_on_rename(sender, instance, created, **kwargs):
+    """Rename the tag in the stored tag lists of its posts."""
+    if created:
+        return
+    sync_tagged_posts(list(
+        instance.tagged_blogs.values_list("content_object_id", flat=True)
+    ))
+
+
+@receiver(pre_delete, sender=BlogTag)
+def remember_posts_of_deleted_tag(sender, instance, **kwargs):
+    instance._tagged_page_ids = list(
+        instance.tagged_blogs.values_list("content_object_id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=BlogTag)
+def sync_tag_names_on_delete(sender, instance, **kwargs):
+    """Drop a deleted tag from the stored tag lists of its posts."""
+    sync_tagged_posts(getattr(instance, "_tagged_page_ids", []))
+
+
+@receiver(page_published, sender=BlogPage)
+def queue_renditions_on_publish(sender, instance, revision, **kwargs):
+    """Create the responsive renditions of the post images in the background."""
+    queue_renditions(instance, revision.pk)
+
+
+@receiver(post_save)
+def invalidate_admin_menu_on_create(sender, instance, created, **kwargs):
+    """Look the admin menu's home page up again after top level changes."""
+    if created and isinstance(instance, Page) and instance.depth == 2:
+        admin_menu.invalidate()
+
+
+@receiver(post_delete)
+def invalidate_admin_menu_on_delete(sender, instance, **kwargs):
+    if isinstance(instance, Page) and instance.depth == 2:
+        admin_menu.invalidate()
+
+
+@receiver(post_page_move)
+def invalidate_admin_menu_on_move(sender, instance, parent_page_before,
+                                  parent_page_after, **kwargs):
+    if 1 in (parent_page_before.depth, parent_page_after.depth):
+        admin_menu.invalidate()
+
+
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+def invalidate_admin_menu_on_site_change(sender, **kwargs):
+    admin_menu.invalidate()
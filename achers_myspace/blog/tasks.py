@@ -0,0 +1,171 @@
+"""Background tasks of the blog app, run by the ``run_jobs`` worker."""
+import hashlib
+import logging
+
+from django.conf import settings
+from django.utils import timezone
+
+from achers_myspace import page_cache, static_export
+from blog.email import (
+    convert_embeds_for_email,
+    create_campaign,
+    schedule_campaign,
+)
+from blog import newsletter_batch
+from blog.jobs import enqueue, task
+from blog.image_formats import body_images
+from blog.models import BlogPage, record_newsletter_send
+from home import wall
+
+logger = logging.getLogger(__name__)
+
+SEND_NEWSLETTER = "newsletter.send"
+SEND_NEWSLETTER_BATCH = "newsletter.batch"
+GENERATE_RENDITIONS = "images.renditions"
+EXPORT_SITE = "site.export"
+
+
+def queue_newsletter(page):
+    """Queues the newsletter for the live revision of a blog post.
+
+    Queuing is idempotent, a revision is only ever sent once.
+    """
+    return enqueue(
+        SEND_NEWSLETTER,
+        key=f"newsletter:page={page.pk}:revision={page.live_revision_id}",
+        payload={"page_id": page.pk, "revision_id": page.live_revision_id},
+    )
+
+
+@task(SEND_NEWSLETTER)
+def send_newsletter(job):
+    """Creates and schedules the MailerLite campaign for a blog post."""
+    page = BlogPage.objects.get(pk=job.payload["page_id"])
+    if not page.live:
+        job.result["skipped"] = "Page is no longer live"
+        logger.info(f"Skipped newsletter for unpublished '{page.title}'")
+        return
+
+    with record_newsletter_send():
+        # A retry after a failed schedule must not create a second campaign
+        if "campaign_id" not in job.result:
+            email_content = convert_embeds_for_email(
+                page.render_newsletter_email()
+            )
+            job.result["campaign_id"] = create_campaign(page.title, email_content)
+            job.save(update_fields=["result", "updated_at"])
+
+        schedule_campaign(job.result["campaign_id"])
+    logger.info(f"Sent blog post email for '{page.title}'")
+
+
+def queue_newsletter_batch(page_ids, digest: bool = False, subject: str = ""):
+    """Queues newsletters for many blog posts, one each or a digest of all.
+
+    The same batch is queued once a minute at most, so submitting it twice
+    doesn't send it twice.
+    """
+    page_ids = sorted(set(page_ids))
+    batch = hashlib.sha256(repr((page_ids, digest, subject)).encode())
+    minute = timezone.now().strftime("%Y%m%d%H%M")
+    return enqueue(
+        SEND_NEWSLETTER_BATCH,
+        key=f"newsletter-batch:{batch.hexdigest()[:16]}:{minute}",
+        payload={"page_ids": page_ids, "digest": digest, "subject": subject},
+    )
+
+
+@task(SEND_NEWSLETTER_BATCH)
+def send_newsletter_batch(job):
+    """Sends the campaigns of a batch that haven't been sent yet.
+
+    Each finished campaign is saved in ``job.result["campaigns"]``, a retry
+    after a failure only sends the rest.
+    """
+    page_ids = job.payload["page_ids"]
+    posts = list(
+        BlogPage.objects.live().filter(pk__in=page_ids).order_by("date", "pk")
+    )
+    if job.payload.get("digest"):
+        campaigns = newsletter_batch.digest_campaign(
+            posts[::-1], job.payload.get("subject", "")
+        )
+    else:
+        campaigns = newsletter_batch.post_campaigns(posts)
+
+    job.result["skipped"] = sorted(set(page_ids) - {post.pk for post in posts})
+    progress = job.result.setdefault("campaigns", {})
+    result = newsletter_batch.send_campaigns(
+        campaigns, progress,
+        # Also keeps the job from looking stale to other workers
+        checkpoint=lambda: job.save(update_fields=["result", "updated_at"]),
+    )
+    job.result.update(result)
+    logger.info(
+        f"Sent {result['sent']} newsletter campaign(s) in "
+        f"{result['elapsed_s']}s ({result['per_minute']}/min)"
+    )
+    if result["failed"]:
+        raise RuntimeError(
+            f"{result['failed']} of {len(campaigns)} campaign(s) failed"
+        )
+
+
+def queue_renditions(page, revision_id=None):
+    """Queues the responsive image renditions of a published blog post.
+
+    Returns ``(None, False)`` when the body has no images.
+    """
+    if not body_images(page.body):
+        return None, False
+    revision_id = revision_id or page.live_revision_id
+    return enqueue(
+        GENERATE_RENDITIONS,
+        key=f"renditions:page={page.pk}:revision={revision_id}",
+        payload={"page_id": page.pk, "revision_id": revision_id},
+    )
+
+
+@task(GENERATE_RENDITIONS)
+def generate_renditions(job):
+    """Creates the image renditions of a blog post and re-renders its body."""
+    page = BlogPage.objects.get(pk=job.payload["page_id"])
+    changed = page.prepare_renditions()
+    job.result["body_changed"] = changed
+    if changed and page.live:
+        # Re-inserting the post records the wall pages that show it. The
+        # web processes see both through the caches they share with the
+        # worker, see settings.production
+        wall.update_post(page)
+        queue_export(page_cache.purge_post(page))
+    logger.info(f"Generated image renditions for '{page.title}'")
+
+
+def queue_export(urls=None):
+    """Queues a static export of ``(path, query)`` pairs, or of the site.
+
+    Returns ``(None, False)`` when ``STATIC_EXPORT_ROOT`` isn't set or
+    there is nothing to export.
+    """
+    if not settings.STATIC_EXPORT_ROOT or urls == []:
+        return None, False
+    if urls is not None:
+        urls = [list(url) for url in urls]
+    # Every publish needs its own export, the time keeps the keys apart
+    scope = "site" if urls is None else f"{len(urls)}-urls"
+    return enqueue(
+        EXPORT_SITE,
+        key=f"export:{scope}:{timezone.now().isoformat()}",
+        payload={"urls": urls},
+    )
+
+
+@task(EXPORT_SITE)
+def export_site(job):
+    """Writes the static export of the pages a publish changed."""
+    urls = job.payload.get("urls")
+    result = static_export.export(
+        None if urls is None else [tuple(url) for url in urls]
+    )
+    job.result.update(result)
+    logger.info(f"Exported {result['written']} page(s)")
@@ -0,0 +1,17 @@
+from django import template
+from django.utils.html import conditional_escape
+from django.utils.safestring import mark_safe
+
+from blog.embeds import convert_embeds_for_web
+
+register = template.Library()
+
+
+@register.filter(is_safe=True)
+def embed_facades(html):
+    """Replaces known player iframes with click-to-load facades.
+
+    Use on rendered rich text, or with ``{% filter embed_facades %}`` around
+    iframes in a template.
+    """
+    return mark_safe(convert_embeds_for_web(str(conditional_escape(html))))
@@ -0,0 +1,58 @@
+"""Test doubles for the MailerLite integration.
+
+Point ``MAILER_CLIENT_CLASS`` at ``blog.testing.FakeMailerClient`` to record
+campaigns instead of sending them.
+"""
+import itertools
+
+
+class FakeCampaigns:
+    """Records campaign calls in ``FakeMailerClient.outbox``."""
+
+    def __init__(self, client_class):
+        self.client_class = client_class
+
+    def create(self, campaign):
+        self.client_class.check("create")
+        campaign_id = next(self.client_class.ids)
+        self.client_class.outbox.append({
+            "id": campaign_id,
+            "campaign": campaign,
+            "scheduled": None,
+        })
+        return {"data": {"id": str(campaign_id)}}
+
+    def schedule(self, campaign_id, params):
+        self.client_class.check("schedule")
+        for sent in self.client_class.outbox:
+            if sent["id"] == campaign_id:
+                sent["scheduled"] = params
+                return {"data": {"id": str(campaign_id)}}
+        raise ValueError(f"Unknown campaign {campaign_id}")
+
+
+class FakeMailerClient:
+    """A stand-in for ``mailerlite.Client`` that never talks to MailerLite.
+
+    Calls named in ``fail_on`` (e.g. ``{"schedule"}``) raise ``failure``.
+    """
+
+    outbox = []
+    fail_on = set()
+    failure = ConnectionError("MailerLite is unavailable")
+    ids = itertools.count(1)
+
+    def __init__(self, config=None):
+        self.config = config or {}
+        self.campaigns = FakeCampaigns(type(self))
+
+    @classmethod
+    def reset(cls):
+        cls.outbox = []
+        cls.fail_on = set()
+        cls.ids = itertools.count(1)
+
+    @classmethod
+    def check(cls, call):
+        if call in cls.fail_on:
+            raise cls.failure
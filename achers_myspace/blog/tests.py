@@ -1,8 +1,52 @@
+import datetime
+import json
+import re
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
 from unittest.mock import patch, MagicMock
 
-from django.test import TestCase
+import requests
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+from wagtail.images.models import Image
+from wagtail.images.tests.utils import get_test_image_file
+from wagtail.models import Page, Site
+from wagtail.test.utils import WagtailPageTestCase
 
-from blog.email import convert_embeds_for_email, send_blog_post
+from achers_myspace import page_cache
+from achers_myspace.testing import QueryBudgetMixin, metric_value
+from blog import embeds, jobs, mailer
+from blog.email import (
+    convert_embeds_for_email,
+    create_campaign,
+    schedule_campaign,
+    send_blog_post,
+)
+from blog.models import NEWSLETTER_SENDS, BackgroundJob, BlogPage, BlogTag
+from blog.tasks import (
+    SEND_NEWSLETTER_BATCH,
+    queue_newsletter,
+    queue_newsletter_batch,
+    queue_renditions,
+)
+from blog.testing import FakeMailerClient
+from blog.wagtail_hooks import (
+    purge_page_cache_on_publish,
+    purge_page_cache_on_unpublish,
+    send_newsletter_on_publish,
+)
+from home import wall
+from home.models import HomePage
 
 
 class ConvertEmbedsForEmailTest(TestCase):
@@ -128,13 +172,161 @@ class ConvertEmbedsForEmailTest(TestCase):
         self.assertIn('<p>Just some text</p>', result)
 
 
+class EmbedProvidersTest(TestCase):
+    """Tests for the embed provider registry and the single-pass rewriter."""
+
+    def test_converts_bandcamp_embed_to_release_link(self):
+        html = (
+            '<iframe src="https://bandcamp.com/EmbeddedPlayer/album=2152755717'
+            '/size=large/" seamless><a href="https://achersldn.bandcamp.com/'
+            'album/bottom-of-the-hill">Bottom of the Hill by Achers</a>'
+            '</iframe>'
+        )
+        result = convert_embeds_for_email(html)
+
+        self.assertNotIn('<iframe', result)
+        self.assertIn(
+            'href="https://achersldn.bandcamp.com/album/bottom-of-the-hill"',
+            result,
+        )
+        self.assertIn('Bottom of the Hill by Achers', result)
+
+    def test_registered_provider_is_used(self):
+        class VimeoProvider(embeds.LinkCardProvider):
+            domains = ("vimeo.com",)
+            pattern = re.compile(r"player\.vimeo\.com/video/(\d+)")
+            default_title = "Watch on Vimeo"
+
+            def url(self, match, inner=""):
+                return f"https://vimeo.com/{match.group(1)}"
+
+        provider = embeds.register_provider(VimeoProvider())
+        self.addCleanup(embeds.PROVIDERS.remove, provider)
+
+        result = convert_embeds_for_email(
+            '<iframe src="https://player.vimeo.com/video/42"></iframe>'
+        )
+
+        self.assertIn('href="https://vimeo.com/42"', result)
+
+    def test_keeps_quoted_angle_brackets_in_attributes(self):
+        html = '<img alt="a > b" src="/media/x.jpg">'
+        result = convert_embeds_for_email(html)
+
+        self.assertIn('alt="a &gt; b"', result)
+        self.assertIn('src="https://achers.org/media/x.jpg"', result)
+
+    def test_drops_picture_sources_only(self):
+        html = (
+            '<picture><source srcset="/media/a.webp" type="image/webp">'
+            '<img src="/media/a.jpg"></picture>'
+            '<video controls><source src="/media/clip.mp4" type="video/mp4">'
+            '</video>'
+            '<audio><source src="/media/song.mp3"></audio>'
+        )
+        result = convert_embeds_for_email(html)
+
+        self.assertNotIn('a.webp', result)
+        self.assertIn('src="https://achers.org/media/a.jpg"', result)
+        self.assertIn('<source src="/media/clip.mp4" type="video/mp4">', result)
+        self.assertIn('<source src="/media/song.mp3">', result)
+
+    def test_copies_text_and_markup_around_embeds(self):
+        html = (
+            '<!-- intro --><p class="lead">Fish &amp; chips &#8211; '
+            '<br/>tonight</p>'
+            '<iframe src="https://www.youtube.com/embed/abc"></iframe>'
+        )
+        result = convert_embeds_for_email(html)
+
+        self.assertTrue(result.startswith(
+            '<!-- intro --><p class="lead">Fish &amp; chips &#8211; '
+            '<br/>tonight</p>'
+        ))
+        self.assertIn('watch?v=abc', result)
+
+    def test_escapes_titles(self):
+        html = (
+            '<iframe src="https://open.spotify.com/embed/track/abc" '
+            'title="Spotify Embed: Rock &amp; Roll <3"></iframe>'
+        )
+        result = convert_embeds_for_email(html)
+
+        self.assertIn('Rock &amp; Roll &lt;3', result)
+
+    def test_web_replaces_youtube_iframe_with_facade(self):
+        html = (
+            '<iframe src="https://www.youtube.com/embed/abc?si=x" '
+            'title="YouTube video player" allowfullscreen></iframe>'
+        )
+        result = embeds.convert_embeds_for_web(html)
+
+        self.assertTrue(result.startswith(
+            '<div class="embed-facade embed-facade-youtube"><template><iframe'
+        ))
+        self.assertIn(
+            'src="https://www.youtube.com/embed/abc?si=x&amp;autoplay=1"', result
+        )
+        self.assertIn('href="https://www.youtube.com/watch?v=abc"', result)
+        self.assertIn('src="https://i.ytimg.com/vi/abc/hqdefault.jpg"', result)
+        self.assertIn('aria-label="Play video"', result)
+        # The only iframe is the one waiting in the template
+        self.assertEqual(result.count("<iframe"), 1)
+
+    def test_web_facade_keeps_bandcamp_fallback_link(self):
+        html = (
+            '<iframe src="https://bandcamp.com/EmbeddedPlayer/album=2152755717'
+            '/size=large/" seamless><a href="https://achersldn.bandcamp.com/'
+            'album/bottom-of-the-hill">Bottom of the Hill by Achers</a>'
+            '</iframe>'
+        )
+        result = embeds.convert_embeds_for_web(html)
+
+        self.assertIn('class="embed-facade embed-facade-bandcamp"', result)
+        self.assertIn(
+            'class="embed-facade-link" '
+            'href="https://achersldn.bandcamp.com/album/bottom-of-the-hill"',
+            result,
+        )
+        self.assertIn(
+            '<span class="embed-facade-label">Bottom of the Hill by Achers',
+            result,
+        )
+
+    def test_web_leaves_unknown_iframes(self):
+        html = '<iframe src="https://example.com/player"></iframe>'
+
+        self.assertEqual(embeds.convert_embeds_for_web(html), html)
+
+    def test_facade_filter(self):
+        html = mark_safe(
+            '<iframe src="https://open.spotify.com/embed/track/abc"></iframe>'
+        )
+        template = Template("{% load embed_facades %}{{ html|embed_facades }}")
+
+        result = template.render(Context({"html": html}))
+
+        self.assertIn('class="embed-facade embed-facade-spotify"', result)
+        self.assertIn("Listen on Spotify", result)
+
+    def test_memoizes_conversion_by_content(self):
+        html = '<iframe src="https://www.youtube.com/embed/memo"></iframe>'
+        first = convert_embeds_for_email(html)
+
+        with patch('blog.email._convert_embeds') as convert:
+            second = convert_embeds_for_email(html)
+
+        convert.assert_not_called()
+        self.assertEqual(first, second)
+
+
 class SendBlogPostTest(TestCase):
     """Tests for the send_blog_post function."""
 
-    @patch('blog.email.mailerlite.Client')
-    def test_creates_and_schedules_campaign(self, mock_client_class):
+    @patch('blog.email.get_mailer_client')
+    def test_creates_and_schedules_campaign(self, get_mailer_client):
         mock_client = MagicMock()
-        mock_client_class.return_value = mock_client
+        get_mailer_client.return_value = mock_client
         mock_client.campaigns.create.return_value = {
             'data': {'id': '12345'}
         }
@@ -152,10 +344,10 @@ class SendBlogPostTest(TestCase):
             12345, {"delivery": "instant"}
         )
 
-    @patch('blog.email.mailerlite.Client')
-    def test_converts_embeds_before_sending(self, mock_client_class):
+    @patch('blog.email.get_mailer_client')
+    def test_converts_embeds_before_sending(self, get_mailer_client):
         mock_client = MagicMock()
-        mock_client_class.return_value = mock_client
+        get_mailer_client.return_value = mock_client
         mock_client.campaigns.create.return_value = {
             'data': {'id': '1'}
         }
@@ -167,3 +359,1070 @@ class SendBlogPostTest(TestCase):
         content = call_args['emails'][0]['content']
         self.assertNotIn('<iframe', content)
         self.assertIn('youtube.com/watch?v=test', content)
+
+
+class StubMailerLiteHandler(BaseHTTPRequestHandler):
+    """Answers like the MailerLite campaigns API, see PooledMailerClientTest."""
+
+    # Keep-alive, like the real API
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.server.calls.append(("POST", self.path, self.client_address[1]))
+        self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path == "/api/campaigns":
+            self.reply(200, {"data": {"id": "77"}})
+        elif self.path in self.server.fail_paths:
+            self.reply(503, {})
+        else:
+            self.reply(200, {"data": {"id": "77"}})
+
+    def do_GET(self):
+        self.server.calls.append(("GET", self.path, self.client_address[1]))
+        if self.server.fail_paths.pop(self.path, None):
+            self.reply(503, {})
+        elif self.path == "/api/slow":
+            time.sleep(0.5)
+            self.reply(200, {})
+        else:
+            self.reply(200, {"data": {"id": "77"}})
+
+    def reply(self, status, data):
+        body = json.dumps(data).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client timed out and hung up, see
+            # test_read_timeout_is_enforced_and_counted
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PooledMailerClientTest(TestCase):
+    """Tests for the pooled MailerLite client against a local stub server."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubMailerLiteHandler)
+        cls.server.calls = []
+        cls.server.fail_paths = {}
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.calls.clear()
+        self.server.fail_paths.clear()
+        mailer.reset_session()
+        self.addCleanup(mailer.reset_session)
+        host, port = self.server.server_address
+        self.client = mailer.PooledMailerClient({
+            "api_key": "test",
+            "host": f"http://{host}:{port}/",
+            "read_timeout": 0.2,
+        })
+
+    def test_creates_and_schedules_over_one_connection(self):
+        campaign_id = create_campaign("Subject", "<p>Hi</p>", self.client)
+        schedule_campaign(campaign_id, self.client)
+
+        self.assertEqual(campaign_id, 77)
+        self.assertEqual(
+            [call[:2] for call in self.server.calls],
+            [("POST", "/api/campaigns"), ("POST", "/api/campaigns/77/schedule")],
+        )
+        # Both calls came from the same client port, the connection was reused
+        self.assertEqual(len({call[2] for call in self.server.calls}), 1)
+
+    def test_records_latency_and_outcome(self):
+        labels = {"method": "GET", "endpoint": "api/campaigns/:id"}
+        calls_before = metric_value(mailer.MAILER_LATENCY, "count", **labels)
+        ok_before = metric_value(mailer.MAILER_CALLS, outcome="ok", **labels)
+
+        self.client.campaigns.get(77)
+
+        self.assertEqual(
+            metric_value(mailer.MAILER_LATENCY, "count", **labels),
+            calls_before + 1,
+        )
+        self.assertEqual(
+            metric_value(mailer.MAILER_CALLS, outcome="ok", **labels),
+            ok_before + 1,
+        )
+
+    @override_settings(MAILER_RETRIES=1)
+    def test_read_timeout_is_enforced_and_counted(self):
+        labels = {"method": "GET", "endpoint": "api/slow"}
+        before = metric_value(mailer.MAILER_CALLS, outcome="timeout", **labels)
+
+        with self.assertRaises(requests.RequestException):
+            self.client.api_client.request("GET", "api/slow")
+
+        self.assertEqual(
+            metric_value(mailer.MAILER_CALLS, outcome="timeout", **labels),
+            before + 1,
+        )
+
+    @override_settings(MAILER_RETRIES=2)
+    def test_retries_idempotent_calls(self):
+        self.server.fail_paths["/api/campaigns/77"] = True
+
+        response = self.client.campaigns.get(77)
+
+        self.assertEqual(response["data"]["id"], "77")
+        self.assertEqual(
+            [call[:2] for call in self.server.calls],
+            [("GET", "/api/campaigns/77"), ("GET", "/api/campaigns/77")],
+        )
+
+    def test_does_not_retry_posts(self):
+        self.server.fail_paths["/api/campaigns/77/schedule"] = True
+
+        with self.assertRaises(requests.HTTPError):
+            schedule_campaign(77, self.client)
+
+        self.assertEqual(len(self.server.calls), 1)
+
+
+class RateLimiterTest(TestCase):
+    """Tests for the rate limiter of batch sends."""
+
+    def setUp(self):
+        self.now = 0.0
+        self.sleeps = []
+        self.limiter = mailer.RateLimiter(
+            per_minute=60, retries=2, clock=lambda: self.now, sleep=self.sleep
+        )
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def rate_limited(self, retry_after="5"):
+        response = requests.Response()
+        response.status_code = 429
+        response.headers["Retry-After"] = retry_after
+        return requests.HTTPError("429 Too Many Requests", response=response)
+
+    def test_spaces_calls(self):
+        for _ in range(3):
+            self.limiter.call(lambda: None)
+
+        self.assertEqual(self.sleeps, [1.0, 1.0])
+
+    def test_waits_for_retry_after(self):
+        outcomes = [self.rate_limited(), "created"]
+
+        def create():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        self.assertEqual(self.limiter.call(create), "created")
+        self.assertEqual(self.sleeps, [5.0])
+
+    def test_other_errors_are_not_retried(self):
+        calls = []
+
+        def create():
+            calls.append(1)
+            raise requests.ConnectionError("down")
+
+        with self.assertRaises(requests.ConnectionError):
+            self.limiter.call(create)
+        self.assertEqual(len(calls), 1)
+
+
+class BlogPageBodyHtmlTest(WagtailPageTestCase):
+    """Tests for the pre-rendered BlogPage body HTML."""
+
+    def setUp(self):
+        root_page = Page.get_first_root_node()
+        self.homepage = HomePage(title="Home", body="<p>Welcome</p>")
+        root_page.add_child(instance=self.homepage)
+        Site.objects.create(
+            hostname="testsite", root_page=self.homepage, is_default_site=True
+        )
+        self.linked = BlogPage(
+            title="Linked", date=datetime.date(2024, 1, 1), slug="linked"
+        )
+        self.homepage.add_child(instance=self.linked)
+
+    def test_expands_body_on_save(self):
+        post = BlogPage(
+            title="Post",
+            date=datetime.date(2024, 1, 2),
+            body=f'<p><a linktype="page" id="{self.linked.pk}">link</a></p>',
+        )
+        self.homepage.add_child(instance=post)
+
+        self.assertIn('href="http://testsite/linked/"', post.body_html)
+        self.assertNotIn("linktype", post.body_html)
+
+    def test_stores_body_with_facades(self):
+        post = BlogPage(
+            title="Post",
+            date=datetime.date(2024, 1, 2),
+            body='<p><iframe src="https://www.youtube.com/embed/abc"></iframe></p>',
+        )
+        self.homepage.add_child(instance=post)
+
+        # Newsletters and feeds convert the players of body_html themselves
+        self.assertNotIn("embed-facade", post.body_html)
+        self.assertIn(
+            'class="embed-facade embed-facade-youtube"', post.web_body_html
+        )
+        response = self.client.get("/post/")
+        self.assertContains(response, 'class="embed-facade embed-facade-youtube"')
+
+    def test_publish_renders_new_body(self):
+        post = BlogPage(
+            title="Post", date=datetime.date(2024, 1, 2), body="<p>Old</p>"
+        )
+        self.homepage.add_child(instance=post)
+
+        post.body = "<p>New</p>"
+        post.save_revision().publish()
+        post.refresh_from_db()
+
+        self.assertIn("<p>New</p>", post.body_html)
+
+    def test_rendered_body_falls_back_without_stored_html(self):
+        post = BlogPage(
+            title="Post", date=datetime.date(2024, 1, 2), body="<p>Text</p>"
+        )
+        self.homepage.add_child(instance=post)
+        BlogPage.objects.filter(pk=post.pk).update(body_html="")
+        post.refresh_from_db()
+
+        self.assertIn("<p>Text</p>", post.rendered_body)
+
+    def test_page_renders_stored_html(self):
+        post = BlogPage(
+            title="Post", date=datetime.date(2024, 1, 2), body="<p>Body</p>"
+        )
+        self.homepage.add_child(instance=post)
+        BlogPage.objects.filter(pk=post.pk).update(
+            web_body_html="<p>Stored</p>"
+        )
+        post.refresh_from_db()
+
+        response = post.serve(self.client.get("/").wsgi_request)
+        response.render()
+
+        self.assertContains(response, "<p>Stored</p>")
+
+    def test_preview_renders_unsaved_body(self):
+        post = BlogPage(
+            title="Post", date=datetime.date(2024, 1, 2), body="<p>Saved</p>"
+        )
+        self.homepage.add_child(instance=post)
+
+        post.body = "<p>Unsaved</p>"
+        response = post.make_preview_request()
+
+        self.assertContains(response, "<p>Unsaved</p>")
+
+    def test_backfill_command_renders_missing_bodies(self):
+        post = BlogPage(
+            title="Post", date=datetime.date(2024, 1, 2), body="<p>Body</p>"
+        )
+        self.homepage.add_child(instance=post)
+        BlogPage.objects.filter(pk=post.pk).update(body_html="")
+
+        call_command("render_blog_bodies", "--missing", stdout=StringIO())
+
+        post.refresh_from_db()
+        self.assertIn("<p>Body</p>", post.body_html)
+
+    def test_backfill_command_renders_missing_facades(self):
+        post = BlogPage(
+            title="Post",
+            date=datetime.date(2024, 1, 2),
+            body='<p><iframe src="https://www.youtube.com/embed/abc"></iframe></p>',
+        )
+        self.homepage.add_child(instance=post)
+        BlogPage.objects.filter(pk=post.pk).update(web_body_html="")
+
+        call_command("render_blog_bodies", "--missing", stdout=StringIO())
+
+        post.refresh_from_db()
+        self.assertIn("embed-facade-youtube", post.web_body_html)
+
+
+@override_settings(WALL_EXCERPT_WORDS=5)
+class BlogPageExcerptTest(WagtailPageTestCase):
+    """Tests for the stored excerpt of a BlogPage."""
+
+    def setUp(self):
+        root_page = Page.get_first_root_node()
+        self.homepage = HomePage(title="Home", body="<p>Welcome</p>")
+        root_page.add_child(instance=self.homepage)
+
+    def add_post(self, body):
+        post = BlogPage(title="Post", date=datetime.date(2024, 1, 2), body=body)
+        self.homepage.add_child(instance=post)
+        return post
+
+    def test_cuts_after_words(self):
+        post = self.add_post(
+            "<p>One two three four five six seven</p><p>Second</p>"
+        )
+
+        self.assertEqual(post.excerpt_html, "<p>One two three four five…</p>")
+        self.assertIn("Second", post.body_html)
+
+    def test_cuts_at_more_marker(self):
+        post = self.add_post("<p>Intro</p><p>[more]</p><p>The rest</p>")
+
+        self.assertEqual(post.excerpt_html, "<p>Intro</p>")
+        self.assertNotIn("[more]", post.body_html)
+        self.assertIn("The rest", post.body_html)
+
+    def test_short_post_has_no_excerpt(self):
+        post = self.add_post("<p>Short</p>")
+
+        self.assertEqual(post.excerpt_html, "")
+
+    def test_drops_players_and_shows_first_image(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        image = Image.objects.create(title="Band", file=get_test_image_file())
+        post = self.add_post(
+            '<p>Watch</p>'
+            '<p><iframe src="https://www.youtube.com/embed/abc"></iframe></p>'
+            f'<embed embedtype="image" id="{image.pk}" format="fullwidth" '
+            'alt="The band"/>'
+        )
+
+        self.assertNotIn("iframe", post.excerpt_html)
+        self.assertEqual(post.excerpt_html.count("<img"), 1)
+        self.assertIn('class="post-thumbnail"', post.excerpt_html)
+        self.assertIn('alt="The band"', post.excerpt_html)
+        self.assertTrue(post.excerpt_html.endswith("<p>Watch</p>"))
+
+    def test_backfill_command_renders_excerpts(self):
+        post = self.add_post("<p>One two three four five six</p>")
+        BlogPage.objects.filter(pk=post.pk).update(excerpt_html="")
+
+        call_command("render_blog_bodies", stdout=StringIO())
+
+        post.refresh_from_db()
+        self.assertIn("five…", post.excerpt_html)
+
+
+class BlogPageTagNamesTest(QueryBudgetMixin, WagtailPageTestCase):
+    """Tests for the denormalized tag list stored on BlogPage."""
+
+    def setUp(self):
+        cache.clear()
+        page_cache.purge_all()
+        root_page = Page.get_first_root_node()
+        self.homepage = HomePage(title="Home", body="<p>Welcome</p>")
+        root_page.add_child(instance=self.homepage)
+        Site.objects.create(
+            hostname="testsite", root_page=self.homepage, is_default_site=True
+        )
+
+    def add_post(self, title, tags=()):
+        post = BlogPage(title=title, date=datetime.date(2024, 1, 1), live=False)
+        self.homepage.add_child(instance=post)
+        post.tags.add(*tags)
+        post.save_revision().publish()
+        post.refresh_from_db()
+        return post
+
+    def test_publish_stores_sorted_tag_names(self):
+        post = self.add_post("Post", tags=["tour", "music"])
+
+        self.assertEqual(post.tag_names, ["music", "tour"])
+
+    def test_publish_picks_up_tag_changes(self):
+        post = self.add_post("Post", tags=["music"])
+
+        post.tags.set(["gigs"])
+        post.save_revision().publish()
+        post.refresh_from_db()
+
+        self.assertEqual(post.tag_names, ["gigs"])
+
+    def test_renaming_tag_updates_posts_and_wall(self):
+        post = self.add_post("Post", tags=["music"])
+        self.assertEqual(wall.tag_counts(self.homepage.pk), {"music": 1})
+
+        tag = BlogTag.objects.get(name="music")
+        tag.name = "songs"
+        tag.save()
+        post.refresh_from_db()
+
+        self.assertEqual(post.tag_names, ["songs"])
+        self.assertEqual(wall.tag_counts(self.homepage.pk), {"songs": 1})
+
+    def test_deleting_tag_updates_posts(self):
+        post = self.add_post("Post", tags=["music", "gigs"])
+
+        BlogTag.objects.get(name="music").delete()
+        post.refresh_from_db()
+
+        self.assertEqual(post.tag_names, ["gigs"])
+
+    def test_post_stays_within_query_budget(self):
+        post = self.add_post("Post", tags=["music", "gigs"])
+
+        self.assertWithinQueryBudget(post.url)
+
+    def test_page_links_tags_to_wall(self):
+        post = self.add_post("Post", tags=["music"])
+
+        response = self.client.get(post.url)
+
+        self.assertContains(response, '/?tag=music">music</a>')
+
+
+class FeedsTest(WagtailPageTestCase):
+    """Tests for the RSS, Atom and JSON feeds of the wall."""
+
+    def setUp(self):
+        cache.clear()
+        page_cache.purge_all()
+        root = Page.get_first_root_node()
+        self.home = HomePage(title="Achers", body="<p>Welcome</p>")
+        root.add_child(instance=self.home)
+        Site.objects.create(
+            hostname="testserver", root_page=self.home, is_default_site=True
+        )
+        self.old = self.add_post("Old", datetime.date(2024, 1, 1), ["gigs"])
+        self.new = self.add_post("New", datetime.date(2024, 2, 1), ["music"])
+        self.pinned = self.add_post(
+            "Pinned", datetime.date(2023, 1, 1), ["music"], top=True
+        )
+
+    def add_post(self, title, date, tags=(), top=False):
+        post = BlogPage(
+            title=title, date=date, top=top, live=False,
+            body='<p>Hello <a href="/old/">there</a></p>',
+        )
+        self.home.add_child(instance=post)
+        post.tags.add(*tags)
+        post.save_revision().publish()
+        post.refresh_from_db()
+        return post
+
+    def test_rss_lists_posts_in_wall_order(self):
+        response = self.client.get("/feeds/rss/")
+        content = response.content.decode()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(
+            response["Content-Type"].startswith("application/rss+xml")
+        )
+        titles = re.findall(r"<item><title>(.*?)</title>", content)
+        self.assertEqual(titles, ["Pinned", "New", "Old"])
+        self.assertIn("<link>http://testserver/new/</link>", content)
+        self.assertIn("<category>music</category>", content)
+
+    def test_atom_feed(self):
+        response = self.client.get("/feeds/atom/")
+
+        self.assertTrue(
+            response["Content-Type"].startswith("application/atom+xml")
+        )
+        self.assertEqual(
+            re.findall(r"<entry><title>(.*?)</title>", response.content.decode()),
+            ["Pinned", "New", "Old"],
+        )
+
+    def test_json_feed(self):
+        response = self.client.get("/feeds/json/")
+        feed = json.loads(response.content)
+
+        self.assertEqual(response["Content-Type"],
+                         "application/feed+json; charset=utf-8")
+        self.assertEqual(feed["version"], "https://jsonfeed.org/version/1.1")
+        self.assertEqual(feed["title"], "Achers")
+        self.assertEqual([item["title"] for item in feed["items"]],
+                         ["Pinned", "New", "Old"])
+        item = feed["items"][1]
+        self.assertEqual(item["url"], "http://testserver/new/")
+        self.assertEqual(item["tags"], ["music"])
+        self.assertIn("Hello", item["content_html"])
+        self.assertIn("date_published", item)
+
+    def test_tag_feed(self):
+        feed = json.loads(self.client.get("/feeds/json/?tag=music").content)
+
+        self.assertEqual(feed["title"], "Achers: music")
+        self.assertEqual([item["title"] for item in feed["items"]],
+                         ["Pinned", "New"])
+        self.assertEqual(self.client.get("/feeds/rss/?tag=nope").status_code, 404)
+
+    def test_not_modified_without_building_the_feed(self):
+        first = self.client.get("/feeds/rss/")
+        page_cache.purge_all()
+
+        with patch("blog.feeds.PostsFeed.items") as items:
+            response = self.client.get(
+                "/feeds/rss/", HTTP_IF_NONE_MATCH=first["ETag"]
+            )
+
+        self.assertEqual(response.status_code, 304)
+        items.assert_not_called()
+        self.assertEqual(
+            self.client.get(
+                "/feeds/rss/", HTTP_IF_MODIFIED_SINCE=first["Last-Modified"]
+            ).status_code,
+            304,
+        )
+
+    def test_cached_until_a_post_is_published_or_unpublished(self):
+        self.client.get("/feeds/json/?tag=music")
+        with self.assertNumQueries(0):
+            cached = self.client.get("/feeds/json/?tag=music")
+        self.assertEqual(cached["X-Page-Cache"], "HIT")
+
+        newer = self.add_post("Newer", datetime.date(2024, 3, 1), ["music"])
+        purge_page_cache_on_publish(None, newer)
+        feed = json.loads(self.client.get("/feeds/json/?tag=music").content)
+        self.assertEqual([item["title"] for item in feed["items"]],
+                         ["Pinned", "Newer", "New"])
+
+        self.pinned.unpublish()
+        purge_page_cache_on_unpublish(None, self.pinned)
+        feed = json.loads(self.client.get("/feeds/json/?tag=music").content)
+        self.assertEqual([item["title"] for item in feed["items"]],
+                         ["Newer", "New"])
+
+
+class ResponsiveImageTest(WagtailPageTestCase):
+    """Tests for the responsive rich text images and their renditions."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+        page_cache.purge_all()
+
+        root_page = Page.get_first_root_node()
+        self.homepage = HomePage(title="Home", body="<p>Welcome</p>")
+        root_page.add_child(instance=self.homepage)
+        Site.objects.create(
+            hostname="testsite", root_page=self.homepage, is_default_site=True
+        )
+        # 640 pixels wide, so only two of the full width candidates fit
+        self.image = Image.objects.create(
+            title="Band", file=get_test_image_file()
+        )
+        self.post = BlogPage(
+            title="Gig",
+            date=datetime.date(2024, 1, 2),
+            body=(
+                f'<embed embedtype="image" id="{self.image.pk}" '
+                'format="fullwidth" alt="The band"/>'
+            ),
+            live=False,
+        )
+        self.homepage.add_child(instance=self.post)
+
+    def test_renders_plain_image_until_renditions_exist(self):
+        self.assertNotIn("<picture>", self.post.body_html)
+        self.assertIn('loading="lazy"', self.post.body_html)
+        self.assertIn('alt="The band"', self.post.body_html)
+
+    def test_rendering_creates_no_renditions(self):
+        self.assertIn(self.image.file.url, self.post.body_html)
+        self.assertIn('width="640"', self.post.body_html)
+        self.assertEqual(self.image.renditions.count(), 0)
+
+    def test_publish_queues_renditions(self):
+        self.post.save_revision().publish()
+
+        job = BackgroundJob.objects.get()
+        self.assertEqual(job.task, "images.renditions")
+        self.assertEqual(job.payload["page_id"], self.post.pk)
+
+    def test_posts_without_images_queue_nothing(self):
+        self.post.body = "<p>No images</p>"
+
+        self.assertEqual(queue_renditions(self.post), (None, False))
+
+    def test_worker_renders_picture_with_srcset(self):
+        self.post.save_revision().publish()
+
+        self.assertEqual(jobs.run_pending(), 1)
+
+        self.post.refresh_from_db()
+        html = self.post.body_html
+        self.assertTrue(html.startswith("<picture>"))
+        self.assertIn('type="image/avif"', html)
+        self.assertIn('type="image/webp"', html)
+        self.assertRegex(html, r'<img [^>]*srcset="[^"]+ 400w, [^"]+ 640w"')
+        self.assertIn('sizes="(max-width: 768px) calc(100vw - 40px), 800px"', html)
+        self.assertIn('loading="lazy"', html)
+        self.assertIn('width="640"', html)
+        # Two widths of the body image and three of the thumbnail, one
+        # shared, in three formats
+        self.assertEqual(self.image.renditions.count(), 12)
+        self.assertIn('class="post-thumbnail"', self.post.excerpt_html)
+
+    def test_worker_purges_cached_post(self):
+        self.post.save_revision().publish()
+        # The first render also fills Wagtail's cache of site root paths
+        with self.assertNoLogs("achers_myspace.requests", "WARNING"):
+            self.client.get("/gig/")
+        self.assertEqual(self.client.get("/gig/")["X-Page-Cache"], "HIT")
+
+        jobs.run_pending()
+
+        response = self.client.get("/gig/")
+        self.assertEqual(response["X-Page-Cache"], "MISS")
+        self.assertContains(response, "<picture>")
+
+    def test_prewarm_command_renders_archive(self):
+        call_command("prewarm_renditions", stdout=StringIO())
+
+        self.post.refresh_from_db()
+        self.assertIn("<picture>", self.post.body_html)
+
+    def test_email_drops_responsive_variants(self):
+        self.post.prepare_renditions()
+
+        html = convert_embeds_for_email(self.post.body_html)
+
+        self.assertNotIn("<source", html)
+        self.assertNotIn("srcset", html)
+        self.assertIn('src="https://achers.org/media/images/', html)
+
+
+@override_settings(MAILER_CLIENT_CLASS="blog.testing.FakeMailerClient")
+class NewsletterJobTest(WagtailPageTestCase):
+    """Tests for sending newsletters through the background job queue."""
+
+    def setUp(self):
+        FakeMailerClient.reset()
+        root_page = Page.get_first_root_node()
+        self.homepage = HomePage(title="Home", body="<p>Welcome</p>")
+        root_page.add_child(instance=self.homepage)
+        self.post = BlogPage(
+            title="New single",
+            date=datetime.date(2024, 1, 2),
+            body='<iframe src="https://www.youtube.com/embed/abc"></iframe>',
+            send_email=True,
+            live=False,
+        )
+        self.homepage.add_child(instance=self.post)
+        self.post.save_revision().publish()
+        self.post.refresh_from_db()
+
+    def test_publish_queues_instead_of_sending(self):
+        send_newsletter_on_publish(None, self.post)
+
+        job = BackgroundJob.objects.get()
+        self.assertEqual(job.status, BackgroundJob.Status.PENDING)
+        self.assertEqual(job.payload["page_id"], self.post.pk)
+        self.assertEqual(FakeMailerClient.outbox, [])
+        self.post.refresh_from_db()
+        self.assertFalse(self.post.send_email)
+
+    def test_queue_is_idempotent_per_revision(self):
+        queue_newsletter(self.post)
+        queue_newsletter(self.post)
+        self.assertEqual(BackgroundJob.objects.count(), 1)
+
+        self.post.save_revision().publish()
+        self.post.refresh_from_db()
+        queue_newsletter(self.post)
+        self.assertEqual(BackgroundJob.objects.count(), 2)
+
+    def test_worker_sends_campaign(self):
+        queue_newsletter(self.post)
+
+        self.assertEqual(jobs.run_pending(), 1)
+
+        job = BackgroundJob.objects.get()
+        self.assertEqual(job.status, BackgroundJob.Status.SUCCEEDED)
+        [sent] = FakeMailerClient.outbox
+        self.assertEqual(sent["campaign"]["name"], "New single")
+        self.assertIn(
+            "youtube.com/watch?v=abc", sent["campaign"]["emails"][0]["content"]
+        )
+        self.assertEqual(sent["scheduled"], {"delivery": "instant"})
+
+    def test_records_send_duration_and_outcome(self):
+        sent = metric_value(NEWSLETTER_SENDS, "count", outcome="sent")
+        failed = metric_value(NEWSLETTER_SENDS, "count", outcome="failed")
+        queue_newsletter(self.post)
+        FakeMailerClient.fail_on = {"create"}
+        jobs.run_pending()
+
+        FakeMailerClient.fail_on = set()
+        BackgroundJob.objects.update(run_after=timezone.now())
+        jobs.run_pending()
+
+        self.assertEqual(
+            metric_value(NEWSLETTER_SENDS, "count", outcome="failed"),
+            failed + 1,
+        )
+        self.assertEqual(
+            metric_value(NEWSLETTER_SENDS, "count", outcome="sent"), sent + 1
+        )
+
+    def test_failure_is_retried_with_backoff(self):
+        queue_newsletter(self.post)
+        FakeMailerClient.fail_on = {"create"}
+
+        jobs.run_pending()
+
+        job = BackgroundJob.objects.get()
+        self.assertEqual(job.status, BackgroundJob.Status.PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn("MailerLite is unavailable", job.last_error)
+        self.assertGreater(job.run_after, timezone.now())
+        # Not due yet
+        self.assertEqual(jobs.run_pending(), 0)
+
+    def test_retry_does_not_create_second_campaign(self):
+        job, _ = queue_newsletter(self.post)
+        FakeMailerClient.fail_on = {"schedule"}
+        jobs.run_pending()
+
+        FakeMailerClient.fail_on = set()
+        BackgroundJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        jobs.run_pending()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, BackgroundJob.Status.SUCCEEDED)
+        self.assertEqual(len(FakeMailerClient.outbox), 1)
+        self.assertIsNotNone(FakeMailerClient.outbox[0]["scheduled"])
+
+    def test_gives_up_after_max_attempts(self):
+        job, _ = jobs.enqueue(
+            "newsletter.send",
+            key="newsletter:test",
+            payload={"page_id": self.post.pk},
+            max_attempts=1,
+        )
+        FakeMailerClient.fail_on = {"create"}
+
+        jobs.run_pending()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, BackgroundJob.Status.FAILED)
+
+    def test_stale_job_is_claimed_again(self):
+        job, _ = queue_newsletter(self.post)
+        BackgroundJob.objects.filter(pk=job.pk).update(
+            status=BackgroundJob.Status.RUNNING,
+            attempts=1,
+            updated_at=timezone.now() - jobs.STALE_AFTER,
+        )
+
+        self.assertEqual(jobs.run_pending(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, BackgroundJob.Status.SUCCEEDED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_stale_job_without_attempts_left_fails(self):
+        job, _ = queue_newsletter(self.post)
+        BackgroundJob.objects.filter(pk=job.pk).update(
+            status=BackgroundJob.Status.RUNNING,
+            attempts=job.max_attempts,
+            updated_at=timezone.now() - jobs.STALE_AFTER,
+        )
+
+        with self.assertLogs("blog.jobs", "ERROR"):
+            self.assertEqual(jobs.run_pending(), 0)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, BackgroundJob.Status.FAILED)
+        self.assertIn("worker stopped", job.last_error)
+        self.assertEqual(FakeMailerClient.outbox, [])
+
+    def test_worker_outlives_database_errors(self):
+        calls = []
+
+        def run_pending(limit=None):
+            calls.append(limit)
+            if len(calls) == 1:
+                raise DatabaseError("server closed the connection")
+            raise KeyboardInterrupt
+
+        command = "blog.management.commands.run_jobs"
+        with (
+            patch(f"{command}.run_pending", run_pending),
+            patch(f"{command}.close_old_connections") as close,
+            patch(f"{command}.time.sleep"),
+            self.assertLogs(command, "ERROR"),
+        ):
+            call_command("run_jobs", stdout=StringIO(), stderr=StringIO())
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(close.call_count, 2)
+
+    def test_skips_unpublished_post(self):
+        queue_newsletter(self.post)
+        self.post.unpublish()
+
+        jobs.run_pending()
+
+        self.assertEqual(FakeMailerClient.outbox, [])
+        self.assertEqual(
+            BackgroundJob.objects.get().status,
+            BackgroundJob.Status.SUCCEEDED,
+        )
+
+
+@override_settings(
+    MAILER_CLIENT_CLASS="blog.testing.FakeMailerClient",
+    MAILER_RATE_LIMIT=0,
+)
+class NewsletterBatchTest(WagtailPageTestCase):
+    """Tests for sending the newsletters of many posts at once."""
+
+    def setUp(self):
+        FakeMailerClient.reset()
+        root_page = Page.get_first_root_node()
+        self.homepage = HomePage(title="Home", body="<p>Welcome</p>")
+        root_page.add_child(instance=self.homepage)
+        Site.objects.create(
+            hostname="testserver", root_page=self.homepage,
+            is_default_site=True,
+        )
+        self.posts = []
+        for day in range(1, 6):
+            post = BlogPage(
+                title=f"Post {day}", date=datetime.date(2024, 1, day),
+                body=f"<p>Body {day}</p>", live=False,
+            )
+            self.homepage.add_child(instance=post)
+            post.save_revision().publish()
+            post.refresh_from_db()
+            self.posts.append(post)
+        self.page_ids = [post.pk for post in self.posts]
+
+    def test_sends_a_campaign_per_post(self):
+        queue_newsletter_batch(self.page_ids)
+
+        jobs.run_pending()
+
+        job = BackgroundJob.objects.get(task=SEND_NEWSLETTER_BATCH)
+        self.assertEqual(job.status, BackgroundJob.Status.SUCCEEDED)
+        self.assertEqual(job.result["sent"], 5)
+        self.assertIn("per_minute", job.result)
+        self.assertEqual(
+            sorted(sent["campaign"]["name"] for sent in FakeMailerClient.outbox),
+            [f"Post {day}" for day in range(1, 6)],
+        )
+        self.assertTrue(all(sent["scheduled"] for sent in FakeMailerClient.outbox))
+
+    def test_digest_is_one_campaign(self):
+        queue_newsletter_batch(self.page_ids, digest=True)
+
+        jobs.run_pending()
+
+        [sent] = FakeMailerClient.outbox
+        self.assertEqual(sent["campaign"]["name"], "Post 5 and 4 more")
+        content = sent["campaign"]["emails"][0]["content"]
+        self.assertLess(content.index("Body 5"), content.index("Body 1"))
+        self.assertIn('href="http://testserver/post-1/"', content)
+
+    def test_retry_resumes_where_it_stopped(self):
+        job, _ = queue_newsletter_batch(self.page_ids)
+        FakeMailerClient.fail_on = {"schedule"}
+        jobs.run_pending()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, BackgroundJob.Status.PENDING)
+        self.assertEqual(job.result["failed"], 5)
+        self.assertEqual(len(FakeMailerClient.outbox), 5)
+
+        FakeMailerClient.fail_on = set()
+        BackgroundJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        jobs.run_pending()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, BackgroundJob.Status.SUCCEEDED)
+        # The campaigns created by the first attempt were only scheduled
+        self.assertEqual(len(FakeMailerClient.outbox), 5)
+        self.assertTrue(all(sent["scheduled"] for sent in FakeMailerClient.outbox))
+
+    def test_skips_unpublished_posts(self):
+        self.posts[0].unpublish()
+
+        queue_newsletter_batch(self.page_ids)
+        jobs.run_pending()
+
+        job = BackgroundJob.objects.get(task=SEND_NEWSLETTER_BATCH)
+        self.assertEqual(job.result["skipped"], [self.posts[0].pk])
+        self.assertEqual(len(FakeMailerClient.outbox), 4)
+
+    def test_batch_is_queued_once(self):
+        queue_newsletter_batch(self.page_ids)
+        _, created = queue_newsletter_batch(reversed(self.page_ids))
+
+        self.assertFalse(created)
+
+    def test_command_sends_now(self):
+        out = StringIO()
+
+        call_command(
+            "send_newsletters", "--since", "2024-01-04", "--now", stdout=out
+        )
+
+        self.assertIn("Sent 2 campaign(s)", out.getvalue())
+        self.assertEqual(len(FakeMailerClient.outbox), 2)
+
+    def test_command_needs_posts(self):
+        with self.assertRaisesMessage(CommandError, "--all"):
+            call_command("send_newsletters", stdout=StringIO())
+
+        self.assertFalse(BackgroundJob.objects.exists())
+
+    def test_command_reports_failures(self):
+        FakeMailerClient.fail_on = {"create"}
+
+        with self.assertRaisesMessage(CommandError, "The worker retries"):
+            call_command(
+                "send_newsletters", "--all", "--now", stdout=StringIO()
+            )
+
+    def test_command_resumes_failed_batch(self):
+        job, _ = queue_newsletter_batch(self.page_ids)
+        BackgroundJob.objects.filter(pk=job.pk).update(
+            status=BackgroundJob.Status.FAILED, attempts=5
+        )
+
+        call_command(
+            "send_newsletters", "--resume", str(job.pk), "--now",
+            stdout=StringIO(),
+        )
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, BackgroundJob.Status.SUCCEEDED)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(len(FakeMailerClient.outbox), 5)
+
+    def test_command_resumes_stalled_batch(self):
+        job, _ = queue_newsletter_batch(self.page_ids)
+        BackgroundJob.objects.filter(pk=job.pk).update(
+            status=BackgroundJob.Status.RUNNING,
+            updated_at=timezone.now() - jobs.STALE_AFTER,
+        )
+
+        call_command("send_newsletters", "--resume", str(job.pk),
+                     stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, BackgroundJob.Status.PENDING)
+
+    def test_command_does_not_resume_active_batch(self):
+        job, _ = queue_newsletter_batch(self.page_ids)
+        BackgroundJob.objects.filter(pk=job.pk).update(
+            status=BackgroundJob.Status.RUNNING, attempts=2
+        )
+
+        with self.assertRaisesMessage(CommandError, "is running"):
+            call_command("send_newsletters", "--resume", str(job.pk),
+                         stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, BackgroundJob.Status.RUNNING)
+        self.assertEqual(job.attempts, 2)
+
+    def test_admin_bulk_action_queues_batch(self):
+        user = get_user_model().objects.create_superuser(
+            "editor", "editor@example.com", "password"
+        )
+        self.client.force_login(user)
+        url = (
+            "/admin/bulk/wagtailcore/page/send_newsletter/?"
+            + "&".join(f"id={pk}" for pk in [self.homepage.pk, *self.page_ids])
+        )
+
+        response = self.client.get(url)
+        self.assertContains(response, "Post 3")
+
+        response = self.client.post(url, {"digest": "on", "subject": "News"})
+
+        self.assertEqual(response.status_code, 302)
+        job = BackgroundJob.objects.get(task=SEND_NEWSLETTER_BATCH)
+        # The home page isn't a blog post
+        self.assertEqual(
+            job.payload,
+            {"page_ids": self.page_ids, "digest": True, "subject": "News"},
+        )
+
+
+class AdminMenuTest(WagtailPageTestCase):
+    """Tests for the cached "New Blog Post" admin menu item."""
+
+    def setUp(self):
+        cache.clear()
+        root_page = Page.get_first_root_node()
+        self.homepage = HomePage(title="Home", body="<p>Welcome</p>")
+        root_page.add_child(instance=self.homepage)
+        Site.objects.create(
+            hostname="testserver", root_page=self.homepage,
+            is_default_site=True,
+        )
+        user = get_user_model().objects.create_superuser(
+            "editor", "editor@example.com", "password"
+        )
+        self.client.force_login(user)
+
+    def add_url(self, page):
+        return f"/admin/pages/add/blog/blogpage/{page.pk}/"
+
+    def test_dashboard_query_count(self):
+        self.client.get("/admin/")
+
+        # Session, user, Wagtail's own panels, the menu item adds none
+        with self.assertNumQueries(16):
+            response = self.client.get("/admin/")
+
+        self.assertContains(response, self.add_url(self.homepage))
+
+    def test_looks_up_home_page_once(self):
+        with patch(
+            "blog.admin_menu.find_new_post_parent",
+            return_value=self.homepage.pk,
+        ) as find:
+            self.client.get("/admin/")
+            self.client.get("/admin/pages/")
+
+        find.assert_called_once()
+
+    def test_top_level_changes_invalidate(self):
+        self.client.get("/admin/")
+        self.homepage.delete()
+
+        response = self.client.get("/admin/")
+        self.assertNotContains(response, self.add_url(self.homepage))
+
+        homepage = HomePage(title="Home again", body="<p>Welcome</p>")
+        Page.get_first_root_node().add_child(instance=homepage)
+        # Deleting the home page deleted its site as well
+        Site.objects.create(hostname="testserver", root_page=homepage)
+
+        response = self.client.get("/admin/")
+        self.assertContains(response, self.add_url(homepage))
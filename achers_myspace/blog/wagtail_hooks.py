@@ -1,32 +1,140 @@
+from django import forms
 from wagtail import hooks
-from wagtail.admin.menu import MenuItem
-from wagtail.models import Page
-from django.urls import reverse
+from wagtail.admin.panels import FieldPanel
+from wagtail.admin.views.pages.bulk_actions.page_bulk_action import (
+    PageBulkAction,
+)
+from wagtail.snippets.models import register_snippet
+from wagtail.snippets.views.snippets import SnippetViewSet
 
-from blog.models import BlogPage
+from achers_myspace import instrumentation, page_cache
+from blog.admin_menu import NewBlogPostMenuItem
+from blog.models import BackgroundJob, BlogPage
+from blog.tasks import queue_export, queue_newsletter, queue_newsletter_batch
+from home.models import HomePage
+
+
+@hooks.register("before_serve_page")
+def allow_page_cache(page, request, serve_args, serve_kwargs):
+    """Let anonymous responses of the wall and of posts be cached."""
+    if isinstance(page, (HomePage, BlogPage)):
+        page_cache.allow(request)
+
+
+@hooks.register("before_serve_page")
+def account_request_to_page(page, request, serve_args, serve_kwargs):
+    """Label the request stats with the page type and its query budget."""
+    instrumentation.set_page(request, page)
+
+
+@hooks.register("after_publish_page")
+def purge_page_cache_on_publish(request, page):
+    """Drop the cached responses a publish makes stale, and re-export them."""
+    if isinstance(page, BlogPage):
+        queue_export(page_cache.purge_post(page))
+    elif isinstance(page, HomePage):
+        # The home page body shows up on every page of the wall
+        page_cache.purge_all()
+        queue_export()
+
+
+@hooks.register("after_unpublish_page")
+def purge_page_cache_on_unpublish(request, page):
+    """Drop the cached responses showing an unpublished post."""
+    if isinstance(page, BlogPage):
+        queue_export(page_cache.purge_post(page))
+
+
+@hooks.register("after_delete_page")
+def purge_page_cache_on_delete(request, page):
+    """Drop the cached responses showing a deleted post."""
+    if isinstance(page, BlogPage):
+        queue_export(page_cache.purge_post(page))
 
 
 @hooks.register("after_publish_page")
-def send_newsletter_on_publish(request, page) -> bool:
-    """Send newsletter when a blog post is published."""
+def send_newsletter_on_publish(request, page):
+    """Queue the newsletter when a blog post is published."""
     if isinstance(page, BlogPage) and page.send_email:
-        if page.send_newsletter():
-            BlogPage.objects.filter(pk=page.pk).update(send_email=False)
+        page.refresh_from_db(fields=["live_revision"])
+        queue_newsletter(page)
+        BlogPage.objects.filter(pk=page.pk).update(send_email=False)
+
+
+class NewsletterBatchForm(forms.Form):
+    digest = forms.BooleanField(
+        required=False,
+        label="Send one digest",
+        help_text="One campaign listing all the posts instead of one each.",
+    )
+    subject = forms.CharField(
+        required=False,
+        max_length=255,
+        help_text="Subject of the digest, the newest post's title if empty.",
+    )
+
+
+@hooks.register("register_bulk_action")
+class SendNewsletterBulkAction(PageBulkAction):
+    """Queue newsletters for the published blog posts selected in a listing."""
+    display_name = "Send newsletter"
+    action_type = "send_newsletter"
+    aria_label = "Send newsletters for the selected posts"
+    template_name = "blog/bulk_actions/confirm_bulk_newsletter.html"
+    action_priority = 80
+    form_class = NewsletterBatchForm
+
+    def check_perm(self, page):
+        return (
+            page.specific_class is BlogPage
+            and page.live
+            and page.permissions_for_user(self.request.user).can_publish()
+        )
+
+    def get_execution_context(self):
+        return {**self.cleaned_form.cleaned_data}
+
+    @classmethod
+    def execute_action(cls, objects, digest=False, subject="", **kwargs):
+        page_ids = [page.pk for page in objects]
+        if page_ids:
+            queue_newsletter_batch(page_ids, digest=digest, subject=subject)
+        return len(page_ids), 0
+
+    def get_success_message(self, num_parent_objects, num_child_objects):
+        return (
+            f"Newsletters for {num_parent_objects} post(s) have been queued, "
+            "see Settings → Background jobs."
+        )
+
+
+class BackgroundJobViewSet(SnippetViewSet):
+    model = BackgroundJob
+    icon = "time"
+    menu_label = "Background jobs"
+    add_to_settings_menu = True
+    inspect_view_enabled = True
+    copy_view_enabled = False
+    list_display = [
+        "key", "task", "status", "attempts", "run_after", "updated_at",
+    ]
+    list_filter = ["status", "task"]
+    panels = [
+        FieldPanel("status"),
+        FieldPanel("run_after"),
+        FieldPanel("max_attempts"),
+    ]
+
+
+register_snippet(BackgroundJobViewSet)
 
 
-@hooks.register('register_admin_menu_item')
+@hooks.register("register_admin_menu_item")
 def register_blog_post_menu_item():
-    """Add a quick 'Add Blog Post' button to the admin menu."""
-    # Get the HomePage instance
-    try:
-        homepage = Page.objects.type(Page).filter(depth=2).first()
-        if homepage:
-            return MenuItem(
-                'New Blog Post', 
-                reverse('wagtailadmin_pages:add', args=['blog', 'blogpage', homepage.id]),
-                icon_name='doc-empty-inverse',
-                order=200
-            )
-    except:
-        pass
-    return None
+    """Add a quick 'New Blog Post' button to the admin menu."""
+    return NewBlogPostMenuItem(
+        "New Blog Post",
+        url="",
+        icon_name="doc-empty-inverse",
+        order=200,
+    )
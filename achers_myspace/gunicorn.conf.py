@@ -0,0 +1,73 @@
+"""Gunicorn configuration, picked up from the working directory.
+
+Runs the WSGI app on threaded workers by default. With ``ACHERS_ASGI=True``
+it runs the ASGI app on uvicorn workers instead, where the search view and
+page cache hits are served asynchronously. Worker and thread counts scale
+with the CPUs and can be set with ``ACHERS_WEB_WORKERS`` and
+``ACHERS_WEB_THREADS``. Workers share their metrics through files in
+``PROMETHEUS_MULTIPROC_DIR``, see achers_myspace.metrics.
+"""
+import multiprocessing
+import os
+
+
+def env_int(name: str, default: int) -> int:
+    value = os.environ.get(name, "")
+    return int(value) if value else default
+
+
+def env_bool(name: str) -> bool:
+    return os.environ.get(name, "").lower() in ("1", "true", "yes", "on")
+
+
+cpus = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8100')}"
+
+if env_bool("ACHERS_ASGI"):
+    wsgi_app = "achers_myspace.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+    # One event loop per CPU, waiting on the database doesn't block it
+    workers = env_int("ACHERS_WEB_WORKERS", cpus + 1)
+else:
+    wsgi_app = "achers_myspace.wsgi:application"
+    worker_class = "gthread"
+    # Threads overlap the time requests spend waiting on the database,
+    # MailerLite or the cache; processes use the CPUs
+    workers = env_int("ACHERS_WEB_WORKERS", min(cpus * 2 + 1, 12))
+    threads = env_int("ACHERS_WEB_THREADS", 4)
+
+# Recycle workers now and then so a leak can't grow without bound, with
+# jitter so they don't all restart at once
+max_requests = env_int("ACHERS_WEB_MAX_REQUESTS", 2000)
+max_requests_jitter = max_requests // 10
+
+timeout = env_int("ACHERS_WEB_TIMEOUT", 30)
+graceful_timeout = 30
+# nginx keeps connections to the app open between requests
+keepalive = 5
+
+accesslog = None
+errorlog = "-"
+loglevel = os.environ.get("ACHERS_WEB_LOG_LEVEL", "info")
+
+# Workers keep their metrics here for /metrics to add up, the environment
+# is passed on to them. prometheus_client reads it when it's imported.
+metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", "/tmp/achers_metrics"
+)
+
+
+def on_starting(server):
+    from achers_myspace import metrics
+
+    # Counters start over with the server, as Prometheus expects. The
+    # run_jobs worker keeps its files in a subdirectory, which stays
+    metrics.clear_directory(metrics_dir)
+
+
+def child_exit(server, worker):
+    from achers_myspace import metrics
+
+    # The gauges of the worker go, its counters keep counting
+    metrics.mark_process_dead(worker.pid, metrics_dir)
@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from achers_myspace import metrics, static_export
+
+
+class Command(BaseCommand):
+    help = (
+        "Renders the wall, the posts and the feeds to static files for nginx "
+        "to serve, removing the files of pages that are gone."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            default=settings.STATIC_EXPORT_ROOT,
+            help="Directory to export to (default: STATIC_EXPORT_ROOT).",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Processes rendering pages (default: one per CPU).",
+        )
+
+    def handle(self, *args, **options):
+        if not options["output"]:
+            raise CommandError(
+                "Set ACHERS_STATIC_EXPORT_ROOT or pass --output."
+            )
+        # Apart from gunicorn's, as are the processes rendering the pages
+        metrics.set_process_group("export")
+        started = time.perf_counter()
+        result = static_export.export(
+            root=options["output"], workers=options["workers"]
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {result['written']} file(s) to {options['output']} "
+            f"with {result['workers']} worker(s) in "
+            f"{time.perf_counter() - started:.1f}s, removed {result['removed']}."
+        ))
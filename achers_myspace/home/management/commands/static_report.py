@@ -0,0 +1,61 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def format_bytes(size: int) -> str:
+    return f"{size / 1024:.1f} KB"
+
+
+class Command(BaseCommand):
+    help = "Reports the bytes saved by the last collectstatic run."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=10,
+            help="Number of compressed files to list, largest saving first.",
+        )
+
+    def handle(self, *args, **options):
+        path = settings.STATIC_REPORT_PATH
+        try:
+            with open(path) as f:
+                report = json.load(f)
+        except (OSError, TypeError):
+            raise CommandError(
+                f"No report at {path!r}, run collectstatic with the "
+                "production settings first."
+            )
+
+        for item in report["converted"]:
+            self.stdout.write(
+                f"{item['original']} -> {item['name']}: "
+                f"{format_bytes(item['original_bytes'])} -> "
+                f"{format_bytes(item['bytes'])}"
+            )
+
+        compressed = sorted(
+            report["compressed"],
+            key=lambda item: item["bytes"] - item.get("gz_bytes", item["bytes"]),
+            reverse=True,
+        )
+        for item in compressed[:options["top"]]:
+            sizes = [f"{format_bytes(item['bytes'])}"]
+            for encoding in ("gz", "br"):
+                if f"{encoding}_bytes" in item:
+                    sizes.append(
+                        f"{encoding} {format_bytes(item[f'{encoding}_bytes'])}"
+                    )
+            self.stdout.write(f"{item['name']}: {', '.join(sizes)}")
+
+        totals = report["totals"]
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved {format_bytes(totals['converted_saved_bytes'])} by "
+            f"converting fonts and icons, "
+            f"{format_bytes(totals['gzip_saved_bytes'])} with gzip and "
+            f"{format_bytes(totals['brotli_saved_bytes'])} with brotli "
+            f"across {len(report['compressed'])} compressed file(s)."
+        ))
@@ -0,0 +1,64 @@
+# Generated by Django 6.1.2 on 2026-10-17 13:53
+
+import wagtail.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0003_homepage_body'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='homepage',
+            name='bandcamp_album_title',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='homepage',
+            name='bandcamp_album_url',
+            field=models.URLField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='homepage',
+            name='bandcamp_player_url',
+            field=models.URLField(blank=True, help_text='https://bandcamp.com/EmbeddedPlayer/album=…/', max_length=500),
+        ),
+        migrations.AddField(
+            model_name='homepage',
+            name='instagram_url',
+            field=models.URLField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='homepage',
+            name='links',
+            field=wagtail.fields.StreamField([('link', 2)], blank=True, block_lookup={0: ('wagtail.blocks.CharBlock', (), {'max_length': 50}), 1: ('wagtail.blocks.URLBlock', (), {}), 2: ('wagtail.blocks.StructBlock', [[('label', 0), ('url', 1)]], {})}, help_text='Links under the title, two to a row.'),
+        ),
+        migrations.AddField(
+            model_name='homepage',
+            name='signup_form_url',
+            field=models.URLField(blank=True, help_text='The action of the Mailchimp embedded form, https://….list-manage.com/subscribe/post?u=…&id=…', max_length=500, verbose_name='sign-up form URL'),
+        ),
+        migrations.AddField(
+            model_name='homepage',
+            name='signup_heading',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='homepage',
+            name='tiktok_url',
+            field=models.URLField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='homepage',
+            name='videos',
+            field=wagtail.fields.StreamField([('video', 0)], blank=True, block_lookup={0: ('wagtail.blocks.URLBlock', (), {'help_text': 'A YouTube player URL, https://www.youtube.com/embed/…'})}),
+        ),
+        migrations.AddField(
+            model_name='homepage',
+            name='youtube_url',
+            field=models.URLField(blank=True),
+        ),
+    ]
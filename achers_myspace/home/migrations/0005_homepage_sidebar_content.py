@@ -0,0 +1,70 @@
+import json
+import uuid
+
+from django.db import migrations
+
+# What home_page.html showed before the sidebar was editable
+LINKS = [
+    ("LISTEN", "https://bfan.link/bottom-of-the-hill-EP"),
+    ("TOUR", "https://www.bandsintown.com/a/15606397-achers?came_from=209&utm_medium=web&utm_source=artist_event_page&utm_campaign=artist&noindex=1"),
+    ("MERCH", "https://achersldn.bandcamp.com"),
+    ("SIGN UP", "http://eepurl.com/jwjzQw"),
+]
+VIDEOS = [
+    "https://www.youtube.com/embed/IDH14khQ9rU?si=CUFkiBglfkYg5GIL",
+    "https://www.youtube.com/embed/YT0IWNAp3Uw?si=4A3tbyvy67OipIDU",
+]
+FIELDS = {
+    "signup_heading": "Be the first to hear about new music, tour dates and more...",
+    "signup_form_url": "https://achers.us22.list-manage.com/subscribe/post?u=3b292f4435166aeefc4b9b1aa&id=017b79dccc&f_id=0057c2e1f0",
+    "bandcamp_player_url": "https://bandcamp.com/EmbeddedPlayer/album=2152755717/size=large/bgcol=333333/linkcol=0f91ff/tracklist=false/artwork=small/transparent=true/",
+    "bandcamp_album_url": "https://achersldn.bandcamp.com/album/bottom-of-the-hill",
+    "bandcamp_album_title": "Bottom of the Hill by Achers",
+    "instagram_url": "https://www.instagram.com/achersband/",
+    "tiktok_url": "https://www.tiktok.com/@achersband",
+    "youtube_url": "https://www.youtube.com/@achersband",
+}
+
+
+def sidebar_content():
+    return {
+        **FIELDS,
+        "links": json.dumps([
+            {
+                "type": "link",
+                "value": {"label": label, "url": url},
+                "id": str(uuid.uuid4()),
+            }
+            for label, url in LINKS
+        ]),
+        "videos": json.dumps([
+            {"type": "video", "value": url, "id": str(uuid.uuid4())}
+            for url in VIDEOS
+        ]),
+    }
+
+
+def fill_sidebar(apps, schema_editor):
+    HomePage = apps.get_model("home.HomePage")
+    Revision = apps.get_model("wagtailcore.Revision")
+
+    for page in HomePage.objects.all():
+        content = sidebar_content()
+        HomePage.objects.filter(pk=page.pk).update(**content)
+        # The editor and the next publish start from the revisions
+        revision_ids = {page.latest_revision_id, page.live_revision_id}
+        for revision in Revision.objects.filter(pk__in=revision_ids - {None}):
+            revision.content.update(content)
+            revision.save(update_fields=["content"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("home", "0004_homepage_sidebar"),
+        ("wagtailcore", "0070_rename_pagerevision_revision"),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_sidebar, migrations.RunPython.noop),
+    ]
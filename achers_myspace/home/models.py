@@ -1,10 +1,61 @@
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+import bisect
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from django.conf import settings
+from django.db import models
+from django.shortcuts import redirect
+from wagtail import blocks
+from wagtail.admin.panels import MultiFieldPanel
 from wagtail.models import Page
-from wagtail.fields import RichTextField
+from wagtail.fields import RichTextField, StreamField
+
+from achers_myspace import page_cache, pagination
+from achers_myspace.conditional import ConditionalGetMixin, make_etag
+from home import wall
+
 
+class SidebarLinkBlock(blocks.StructBlock):
+    label = blocks.CharBlock(max_length=50)
+    url = blocks.URLBlock()
 
-class HomePage(Page):
+    class Meta:
+        icon = "link"
+
+
+class HomePage(ConditionalGetMixin, Page):
+    # The sidebar, rendered once per live revision, see home.sidebar
+    links = StreamField(
+        [("link", SidebarLinkBlock())],
+        blank=True,
+        help_text="Links under the title, two to a row.",
+    )
     body = RichTextField()
+    signup_heading = models.CharField(max_length=255, blank=True)
+    signup_form_url = models.URLField(
+        "sign-up form URL",
+        max_length=500,
+        blank=True,
+        help_text=(
+            "The action of the Mailchimp embedded form, "
+            "https://….list-manage.com/subscribe/post?u=…&id=…"
+        ),
+    )
+    videos = StreamField(
+        [("video", blocks.URLBlock(
+            help_text="A YouTube player URL, https://www.youtube.com/embed/…"
+        ))],
+        blank=True,
+    )
+    bandcamp_player_url = models.URLField(
+        max_length=500,
+        blank=True,
+        help_text="https://bandcamp.com/EmbeddedPlayer/album=…/",
+    )
+    bandcamp_album_url = models.URLField(blank=True)
+    bandcamp_album_title = models.CharField(max_length=255, blank=True)
+    instagram_url = models.URLField(blank=True)
+    tiktok_url = models.URLField(blank=True)
+    youtube_url = models.URLField(blank=True)
 
     # Only one HomePage allowed (at root)
     parent_page_types = ['wagtailcore.Page']
@@ -15,33 +66,107 @@ class HomePage(Page):
     # Limit to one instance
     max_count = 1
 
+    posts_per_page = 10
+    # Queries a render of the wall may run, including a rebuild of the wall
+    # index, see achers_myspace.testing
+    query_budget = 8
+
     content_panels = Page.content_panels + [
+        "links",
         "body",
+        MultiFieldPanel(
+            ["signup_heading", "signup_form_url"], heading="Sign-up form"
+        ),
+        "videos",
+        MultiFieldPanel(
+            [
+                "bandcamp_player_url",
+                "bandcamp_album_url",
+                "bandcamp_album_title",
+            ],
+            heading="Bandcamp player",
+        ),
+        MultiFieldPanel(
+            ["instagram_url", "tiktok_url", "youtube_url"],
+            heading="Social links",
+        ),
     ]
 
-    def get_context(self, request):
-        context = super().get_context(request)
+    @property
+    def signup_honeypot_name(self) -> str:
+        """Returns the name of the field Mailchimp expects bots to fill in."""
+        params = parse_qs(urlsplit(self.signup_form_url).query)
+        return "b_{}_{}".format(
+            params.get("u", [""])[0], params.get("id", [""])[0]
+        )
 
-        # Get blog entries, sorted by top first, then by date descending
-        posts = self.get_children().live().specific().order_by(
-            '-blogpage__top', '-blogpage__date'
+    def serve(self, request, *args, **kwargs):
+        # Old ?page=N links go to the cursor of the same position. Positions
+        # move as posts are published, so the redirect is temporary.
+        if 'page' in request.GET:
+            return redirect(self.page_number_url(request))
+        return super().serve(request, *args, **kwargs)
+
+    def get_etag(self, request):
+        # The wall index records every publish, unpublish and delete of a
+        # post, so its change time stands for the posts and tags shown
+        return make_etag(
+            "wall", self.live_revision_id, wall.modified(self.pk),
+            settings.WALL_MODE, sorted(request.GET.lists()),
         )
 
-        # Filter by tag
+    def get_last_modified(self, request):
+        modified = wall.modified(self.pk)
+        if self.last_published_at:
+            return max(modified, self.last_published_at)
+        return modified
+
+    def page_number_url(self, request):
+        """Returns the cursor URL of an old ``?page=`` request."""
         tag = request.GET.get('tag')
+        keys = wall.get_post_keys(self.pk, tag)
+        params = {}
+        cursor = pagination.page_number_cursor(
+            keys, self.posts_per_page, request.GET.get('page')
+        )
+        if cursor:
+            params['after'] = cursor
         if tag:
-            posts = posts.filter(blogpage__tagged_items__tag__name=tag)
-
-        # Pagination
-        paginator = Paginator(posts, 10)
-        page_number = request.GET.get('page')
-        try:
-            posts = paginator.page(page_number)
-        except PageNotAnInteger:
-            posts = paginator.page(1)
-        except EmptyPage:
-            posts = paginator.page(paginator.num_pages)
+            params['tag'] = tag
+        query = urlencode(params)
+        return f"{request.path}?{query}" if query else request.path
+
+    def get_context(self, request):
+        context = super().get_context(request)
+
+        # Blog entry keys come from the cached wall index, sorted by top
+        # first, then by date descending
+        tag = request.GET.get('tag')
+        keys = wall.get_post_keys(self.pk, tag)
+
+        # Keyset pagination, a cursor holds the key next to the page. Pages
+        # show no total or position, both change with every new post and
+        # would leave cached pages stale.
+        after = pagination.decode_cursor(request.GET.get('after'))
+        before = pagination.decode_cursor(request.GET.get('before'))
+        cursor = after if after is not None else before
+        if cursor is not None:
+            position = bisect.bisect_left(keys, cursor)
+            if position == len(keys) or keys[position] != cursor:
+                # Pages next to keys that aren't on the wall would never be
+                # purged from the page cache
+                page_cache.skip(request)
+        posts = pagination.paginate_keys(
+            keys, self.posts_per_page, after=after, before=before
+        )
+
+        # One bulk fetch for the posts on this page of the wall
+        posts.object_list = wall.fetch_posts(
+            [wall.key_post_id(key) for key in posts.object_list]
+        )
 
         context['posts'] = posts
+        context['excerpts'] = settings.WALL_MODE == "excerpt"
         context['current_tag'] = tag
+        context['tag_counts'] = wall.tag_counts(self.pk)
         return context
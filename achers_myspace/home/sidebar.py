@@ -0,0 +1,45 @@
+"""The sidebar of the HomePage.
+
+The left column (links, text, sign-up form, players and social links) is
+the same on every page of the wall and for every tag, so it is rendered
+once per live revision of the HomePage and kept in the cache as HTML. A
+new revision gets a new key, nothing has to be purged. Previews, and home
+pages that were never published from the admin, are rendered each time.
+"""
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from achers_myspace import instrumentation
+
+SIDEBAR_CACHE_KEY = "home:sidebar:{home_id}:{revision_id}"
+SIDEBAR_TEMPLATE = "home/_sidebar.html"
+
+# Bounds the age of what changes without a revision: static asset URLs
+# after a deploy and links to other pages in the body
+SIDEBAR_TIMEOUT = 60 * 60
+
+
+def cache_key(page, request) -> str | None:
+    """Returns the cache key of the page's sidebar, or None if it can't be
+    cached."""
+    if getattr(request, "is_preview", False) or not page.live_revision_id:
+        return None
+    return SIDEBAR_CACHE_KEY.format(
+        home_id=page.pk, revision_id=page.live_revision_id
+    )
+
+
+def render(page, request) -> str:
+    """Returns the HTML of the sidebar of a HomePage."""
+    key = cache_key(page, request)
+    if key is not None:
+        html = cache.get(key)
+        if html is not None:
+            instrumentation.cache_hit("sidebar")
+            return mark_safe(html)
+        instrumentation.cache_miss("sidebar")
+    html = render_to_string(SIDEBAR_TEMPLATE, {"page": page}, request=request)
+    if key is not None:
+        cache.set(key, html, SIDEBAR_TIMEOUT)
+    return mark_safe(html)
@@ -0,0 +1,32 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from wagtail.models import Page
+from wagtail.signals import page_published, page_unpublished
+
+from blog.models import BlogPage
+from home import wall
+
+
+@receiver(page_published, sender=BlogPage)
+def update_wall_on_publish(sender, instance, **kwargs):
+    """Move a freshly published post into its place on the wall."""
+    wall.update_post(instance)
+
+
+@receiver(page_unpublished, sender=BlogPage)
+def update_wall_on_unpublish(sender, instance, **kwargs):
+    """Take an unpublished post off the wall.
+
+    Wagtail also sends ``page_unpublished`` before deleting a live page.
+    """
+    wall.remove_post(instance)
+
+
+@receiver(post_delete, sender=BlogPage)
+def update_wall_on_delete(sender, instance, **kwargs):
+    """Make sure a deleted post is gone from the wall."""
+    try:
+        wall.remove_post(instance)
+    except Page.DoesNotExist:
+        # The whole home page is being deleted along with its posts.
+        pass
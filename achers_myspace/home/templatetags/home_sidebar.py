@@ -0,0 +1,11 @@
+from django import template
+
+from home import sidebar
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def home_sidebar(context, page):
+    """Renders the sidebar of a HomePage, cached per revision."""
+    return sidebar.render(page, context.get("request"))
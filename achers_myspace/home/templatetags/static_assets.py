@@ -0,0 +1,54 @@
+import functools
+import posixpath
+
+from django import template
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import (
+    ManifestFilesMixin,
+    staticfiles_storage,
+)
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+# Most compact first, browsers take the first type they support
+PICTURE_VARIANTS = (
+    (".avif", "image/avif"),
+    (".webp", "image/webp"),
+)
+
+
+@functools.cache
+def variant_url(path: str, extension: str) -> str | None:
+    """Returns the URL of a converted copy of a static image, if there is one.
+
+    The copies are written by collectstatic (see ``achers_myspace.storage``),
+    and only when smaller than the original.
+    """
+    name = posixpath.splitext(path)[0] + extension
+    if isinstance(staticfiles_storage, ManifestFilesMixin):
+        try:
+            return staticfiles_storage.url(name)
+        except ValueError:
+            return None
+    if finders.find(name) is None:
+        return None
+    return staticfiles_storage.url(name)
+
+
+@register.simple_tag
+def static_picture(path, alt="", **attrs):
+    """Renders a static image as a <picture> with its AVIF/WebP copies."""
+    sources = [
+        (url, mime_type)
+        for extension, mime_type in PICTURE_VARIANTS
+        if (url := variant_url(path, extension))
+    ]
+    img_attrs = {"src": staticfiles_storage.url(path), "alt": alt, **attrs}
+    return format_html(
+        "<picture>{}<img{}></picture>",
+        format_html_join(
+            "", '<source srcset="{}" type="{}">', sources
+        ),
+        format_html_join("", ' {}="{}"', img_attrs.items()),
+    )
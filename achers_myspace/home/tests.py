@@ -1,3 +1,37 @@
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import QueryDict
+from django.conf import settings
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from achers_myspace import (
+    instrumentation,
+    metrics,
+    page_cache,
+    pagination,
+    static_export,
+)
+from achers_myspace.storage import OptimizedManifestStaticFilesStorage
+from achers_myspace.testing import QueryBudgetMixin, metric_value
+from blog.jobs import run_pending
+from blog.models import BackgroundJob, BlogPage, BlogTag
+from blog.tasks import EXPORT_SITE
+from blog.wagtail_hooks import (
+    purge_page_cache_on_publish,
+    purge_page_cache_on_unpublish,
+)
+from home import sidebar, wall
 from home.models import HomePage
 
 from wagtail.models import Page, Site
@@ -29,6 +63,8 @@ class HomeTests(WagtailPageTestCase):
         """
         Create a homepage instance for testing.
         """
+        cache.clear()
+        page_cache.purge_all()
         root_page = Page.get_first_root_node()
         Site.objects.create(
             hostname="testsite",
@@ -44,3 +80,1177 @@ class HomeTests(WagtailPageTestCase):
     def test_homepage_template_used(self):
         response = self.client.get(self.homepage.url)
         self.assertTemplateUsed(response, "home/home_page.html")
+
+    def test_players_load_on_click(self):
+        self.homepage.videos = [
+            ("video", "https://www.youtube.com/embed/IDH14khQ9rU"),
+            ("video", "https://www.youtube.com/embed/YT0IWNAp3Uw"),
+        ]
+        self.homepage.bandcamp_player_url = (
+            "https://bandcamp.com/EmbeddedPlayer/album=2152755717/size=large/"
+        )
+        self.homepage.bandcamp_album_url = (
+            "https://achersldn.bandcamp.com/album/bottom-of-the-hill"
+        )
+        self.homepage.save()
+
+        response = self.client.get(self.homepage.url)
+
+        self.assertContains(response, 'class="embed-facade embed-facade-youtube"', 2)
+        self.assertContains(response, 'class="embed-facade embed-facade-bandcamp"', 1)
+        # Every player iframe waits in its facade's template
+        self.assertEqual(
+            response.content.count(b"<iframe"),
+            response.content.count(b"<template><iframe"),
+        )
+
+
+class SidebarTests(WagtailPageTestCase):
+    """
+    Tests for the editable sidebar of the homepage and its cached fragment.
+    """
+
+    def setUp(self):
+        cache.clear()
+        page_cache.purge_all()
+        root_page = Page.get_first_root_node()
+        self.homepage = HomePage(
+            title="Home",
+            body="<p>Welcome</p>",
+            links=[
+                ("link", {"label": "LISTEN", "url": "https://example.com/a"}),
+                ("link", {"label": "TOUR", "url": "https://example.com/b"}),
+                ("link", {"label": "MERCH", "url": "https://example.com/c"}),
+            ],
+            signup_heading="Hear it first",
+            signup_form_url=(
+                "https://x.list-manage.com/subscribe/post?u=abc&id=def"
+            ),
+            instagram_url="https://www.instagram.com/achersband/",
+        )
+        root_page.add_child(instance=self.homepage)
+        Site.objects.create(
+            hostname="testserver",
+            root_page=self.homepage,
+            is_default_site=True
+        )
+        self.homepage.save_revision().publish()
+        self.homepage.refresh_from_db()
+
+    def publish(self, **fields):
+        for name, value in fields.items():
+            setattr(self.homepage, name, value)
+        self.homepage.save_revision().publish()
+        self.homepage.refresh_from_db()
+
+    def test_renders_fields(self):
+        response = self.client.get("/")
+
+        self.assertContains(response, 'class="bio-links-row"', 2)
+        self.assertContains(response, '<a href="https://example.com/c">MERCH</a>')
+        self.assertContains(response, "Hear it first")
+        self.assertContains(response, 'name="b_abc_def"')
+        self.assertContains(response, "https://www.instagram.com/achersband/")
+        self.assertNotContains(response, "tiktok")
+        self.assertNotContains(response, "player-embed")
+
+    def test_renders_once_per_revision(self):
+        hits = metric_value(
+            instrumentation.CACHE_LOOKUPS, cache="sidebar", outcome="hit"
+        )
+        self.client.get("/")
+
+        with patch("home.sidebar.render_to_string") as render_to_string:
+            response = self.client.get("/?tag=live")
+
+        render_to_string.assert_not_called()
+        self.assertContains(response, "Hear it first")
+        self.assertEqual(metric_value(
+            instrumentation.CACHE_LOOKUPS, cache="sidebar", outcome="hit"
+        ), hits + 1)
+
+    def test_new_revision_is_rendered(self):
+        self.client.get("/")
+
+        self.publish(signup_heading="New dates announced")
+        page_cache.purge_all()
+        response = self.client.get("/")
+
+        self.assertContains(response, "New dates announced")
+        self.assertNotContains(response, "Hear it first")
+
+    def test_preview_is_not_cached(self):
+        self.client.get("/")
+        self.homepage.signup_heading = "Draft heading"
+        request = RequestFactory().get("/")
+        request.is_preview = True
+
+        html = sidebar.render(self.homepage, request)
+
+        self.assertIn("Draft heading", html)
+        self.assertIsNone(sidebar.cache_key(self.homepage, request))
+
+
+class PostWallTests(WagtailPageTestCase):
+    """
+    Tests for the cached post wall index behind the homepage.
+    """
+
+    def setUp(self):
+        cache.clear()
+        root_page = Page.get_first_root_node()
+        Site.objects.create(
+            hostname="testsite",
+            root_page=root_page,
+            is_default_site=True
+        )
+        self.homepage = HomePage(title="Home", body="<p>Welcome</p>")
+        root_page.add_child(instance=self.homepage)
+
+    def add_post(self, title, date, top=False, tags=()):
+        post = BlogPage(title=title, date=date, top=top, live=False)
+        self.homepage.add_child(instance=post)
+        post.tags.add(*tags)
+        post.save_revision().publish()
+        post.refresh_from_db()
+        return post
+
+    def test_orders_pinned_first_then_by_date(self):
+        old = self.add_post("Old", datetime.date(2024, 1, 1))
+        new = self.add_post("New", datetime.date(2025, 1, 1))
+        pinned = self.add_post("Pinned", datetime.date(2023, 1, 1), top=True)
+
+        self.assertEqual(
+            wall.get_post_ids(self.homepage.pk),
+            [pinned.pk, new.pk, old.pk],
+        )
+
+    def test_matches_database_rebuild(self):
+        self.add_post("A", datetime.date(2024, 1, 1), tags=["music"])
+        self.add_post("B", datetime.date(2024, 1, 1), tags=["gigs"])
+        self.add_post("C", datetime.date(2024, 2, 1), tags=["music"])
+
+        index = wall.get_index(self.homepage.pk)
+        rebuilt = wall.build_index(self.homepage.pk)
+        self.assertEqual(index["posts"], rebuilt["posts"])
+        self.assertEqual(index["lists"], rebuilt["lists"])
+
+    @override_settings(WALL_EXCERPT_WORDS=3)
+    def test_shows_excerpts(self):
+        post = BlogPage(
+            title="Long", date=datetime.date(2024, 1, 1), live=False,
+            body="<p>One two three four five</p>",
+        )
+        self.homepage.add_child(instance=post)
+        post.save_revision().publish()
+        page_cache.purge_all()
+
+        response = self.client.get(self.homepage.url)
+
+        self.assertContains(response, "One two three…")
+        self.assertNotContains(response, "four five")
+        self.assertContains(response, 'class="read-more"')
+
+        page_cache.purge_all()
+        with override_settings(WALL_MODE="full"):
+            response = self.client.get(self.homepage.url)
+
+        self.assertContains(response, "One two three four five")
+        self.assertNotContains(response, 'class="read-more"')
+
+    def test_keeps_per_tag_lists(self):
+        music = self.add_post("Music", datetime.date(2024, 1, 1), tags=["music"])
+        self.add_post("Gig", datetime.date(2024, 2, 1), tags=["gigs"])
+
+        self.assertEqual(wall.get_post_ids(self.homepage.pk, "music"), [music.pk])
+        self.assertEqual(wall.get_post_ids(self.homepage.pk, "nope"), [])
+
+    def test_unpublish_removes_post(self):
+        post = self.add_post("Post", datetime.date(2024, 1, 1), tags=["music"])
+        wall.get_index(self.homepage.pk)
+
+        post.unpublish()
+
+        self.assertEqual(wall.get_post_ids(self.homepage.pk), [])
+        self.assertEqual(wall.get_post_ids(self.homepage.pk, "music"), [])
+
+    def test_delete_removes_post(self):
+        post = self.add_post("Post", datetime.date(2024, 1, 1))
+        wall.get_index(self.homepage.pk)
+
+        post.delete()
+
+        self.assertEqual(wall.get_post_ids(self.homepage.pk), [])
+
+    def test_republish_moves_post(self):
+        first = self.add_post("First", datetime.date(2024, 1, 1))
+        second = self.add_post("Second", datetime.date(2024, 2, 1))
+
+        first.top = True
+        first.save_revision().publish()
+
+        self.assertEqual(
+            wall.get_post_ids(self.homepage.pk), [first.pk, second.pk]
+        )
+
+    def test_update_releases_lock(self):
+        first = self.add_post("First", datetime.date(2024, 1, 1))
+        wall.get_index(self.homepage.pk)
+
+        second = self.add_post("Second", datetime.date(2024, 2, 1))
+
+        self.assertEqual(
+            wall.get_post_ids(self.homepage.pk), [second.pk, first.pk]
+        )
+        self.assertIsNone(
+            cache.get(wall.WALL_LOCK_KEY.format(home_id=self.homepage.pk))
+        )
+
+    @patch.object(wall, "WALL_LOCK_WAIT", 0)
+    def test_update_drops_index_when_locked(self):
+        first = self.add_post("First", datetime.date(2024, 1, 1))
+        wall.get_index(self.homepage.pk)
+        # Another process is updating the index
+        cache.add(wall.WALL_LOCK_KEY.format(home_id=self.homepage.pk), True)
+
+        second = self.add_post("Second", datetime.date(2024, 2, 1))
+
+        self.assertIsNone(
+            cache.get(wall.WALL_CACHE_KEY.format(home_id=self.homepage.pk))
+        )
+        self.assertEqual(
+            wall.pop_changes(second.pk)[wall.ALL_POSTS], {"all": True}
+        )
+        self.assertEqual(
+            wall.get_post_ids(self.homepage.pk), [second.pk, first.pk]
+        )
+
+    def test_context_paginates_wall(self):
+        for day in range(1, 13):
+            self.add_post(f"Post {day}", datetime.date(2024, 1, day))
+        first = self.homepage.get_context(RequestFactory().get("/"))["posts"]
+        request = RequestFactory().get("/", {"after": first.next_cursor})
+
+        posts = self.homepage.get_context(request)["posts"]
+
+        self.assertEqual([post.title for post in posts], ["Post 2", "Post 1"])
+        self.assertFalse(posts.has_next())
+        # The page before the second one is the first, linked without cursor
+        self.assertTrue(posts.has_previous())
+        self.assertIsNone(posts.previous_cursor)
+
+    def test_context_pages_back_with_before_cursor(self):
+        for day in range(1, 26):
+            self.add_post(f"Post {day}", datetime.date(2024, 1, day))
+        keys = wall.get_post_keys(self.homepage.pk)
+        request = RequestFactory().get(
+            "/", {"before": pagination.encode_cursor(keys[22])}
+        )
+
+        posts = self.homepage.get_context(request)["posts"]
+
+        self.assertEqual(posts[0].title, "Post 13")
+        self.assertEqual(posts[9].title, "Post 4")
+        self.assertEqual(
+            posts.previous_cursor, pagination.encode_cursor(keys[12])
+        )
+
+    def test_old_page_links_redirect_to_cursor(self):
+        for day in range(1, 13):
+            self.add_post(f"Post {day}", datetime.date(2024, 1, day),
+                          tags=["music"])
+        keys = wall.get_post_keys(self.homepage.pk, "music")
+
+        factory = RequestFactory()
+
+        response = self.homepage.serve(factory.get("/?page=2&tag=music"))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            response["Location"],
+            f"/?after={pagination.encode_cursor(keys[9])}&tag=music",
+        )
+        response = self.homepage.serve(factory.get("/?page=1"))
+        self.assertEqual(response["Location"], "/")
+
+    def test_context_fetches_posts_in_one_query(self):
+        for day in range(1, 4):
+            self.add_post(f"Post {day}", datetime.date(2024, 1, day),
+                          tags=["music"])
+        wall.get_index(self.homepage.pk)
+        request = RequestFactory().get("/", {"tag": "music"})
+
+        with self.assertNumQueries(1):
+            context = self.homepage.get_context(request)
+            titles = [post.specific.title for post in context["posts"]]
+            tags = [post.specific.tag_names for post in context["posts"]]
+
+        self.assertEqual(titles, ["Post 3", "Post 2", "Post 1"])
+        self.assertEqual(tags, [["music"]] * 3)
+
+    def test_counts_posts_per_tag(self):
+        self.add_post("A", datetime.date(2024, 1, 1), tags=["music", "gigs"])
+        self.add_post("B", datetime.date(2024, 1, 2), tags=["music"])
+        wall.get_index(self.homepage.pk)
+
+        with self.assertNumQueries(0):
+            counts = wall.tag_counts(self.homepage.pk)
+
+        self.assertEqual(counts, {"gigs": 1, "music": 2})
+
+    def test_builds_tag_lists_without_joining_tags(self):
+        self.add_post("A", datetime.date(2024, 1, 1), tags=["music"])
+        cache.clear()
+
+        # The home page, then the posts with their stored tag names
+        with self.assertNumQueries(2):
+            index = wall.get_index(self.homepage.pk)
+
+        self.assertEqual(len(index["lists"]["tag:music"]), 1)
+
+
+class PageCacheTests(WagtailPageTestCase):
+    """
+    Tests for the full-response cache of anonymous page views.
+    """
+
+    def setUp(self):
+        cache.clear()
+        page_cache.purge_all()
+        root_page = Page.get_first_root_node()
+        self.homepage = HomePage(title="Home", body="<p>Welcome</p>")
+        root_page.add_child(instance=self.homepage)
+        Site.objects.create(
+            hostname="testsite",
+            root_page=self.homepage,
+            is_default_site=True
+        )
+
+    def add_post(self, title, date):
+        post = BlogPage(title=title, date=date, live=False)
+        self.homepage.add_child(instance=post)
+        post.save_revision().publish()
+        post.refresh_from_db()
+        return post
+
+    def page_url(self, position, direction="after"):
+        key = wall.get_post_keys(self.homepage.pk)[position]
+        return f"/?{direction}={pagination.encode_cursor(key)}"
+
+    def test_normalizes_query(self):
+        cursor = pagination.encode_cursor((False, -739000, -5))
+        self.assertEqual(
+            page_cache.normalize_query(QueryDict(f"tag=music&after={cursor}=")),
+            f"after={cursor}&tag=music",
+        )
+        self.assertEqual(
+            page_cache.normalize_query(QueryDict("tag=music&before=")),
+            "tag=music",
+        )
+        self.assertIsNone(page_cache.normalize_query(QueryDict("utm=x")))
+        self.assertIsNone(page_cache.normalize_query(QueryDict("page=2")))
+        self.assertIsNone(page_cache.normalize_query(QueryDict("after=x")))
+        self.assertIsNone(page_cache.normalize_query(
+            QueryDict(f"after={cursor}&before={cursor}")
+        ))
+
+    def test_serves_anonymous_repeat_from_cache(self):
+        first = self.client.get("/")
+        with self.assertNumQueries(0):
+            second = self.client.get("/")
+
+        self.assertEqual(first["X-Page-Cache"], "MISS")
+        self.assertEqual(second["X-Page-Cache"], "HIT")
+        self.assertEqual(first.content, second.content)
+
+    async def test_serves_cached_page_under_asgi(self):
+        first = await self.async_client.get("/")
+        second = await self.async_client.get("/")
+
+        self.assertEqual(first["X-Page-Cache"], "MISS")
+        self.assertEqual(second["X-Page-Cache"], "HIT")
+        self.assertEqual(second.request_stats.queries, 0)
+        self.assertEqual(first.content, second.content)
+
+    def test_does_not_cache_logged_in_users(self):
+        user = get_user_model().objects.create_user("editor", password="pw")
+        self.client.force_login(user)
+
+        # The userbar costs queries the budget isn't meant for
+        with patch.object(HomePage, "query_budget", None):
+            with self.assertNoLogs("achers_myspace.requests", "WARNING"):
+                self.client.get("/")
+            response = self.client.get("/")
+
+        self.assertNotIn("X-Page-Cache", response)
+
+    def test_does_not_cache_unknown_query(self):
+        self.client.get("/?utm_source=x")
+        response = self.client.get("/?utm_source=x")
+
+        self.assertNotIn("X-Page-Cache", response)
+
+    def test_does_not_cache_cursor_off_the_wall(self):
+        cursor = pagination.encode_cursor((True, -1, -999))
+        self.client.get(f"/?after={cursor}")
+        response = self.client.get(f"/?after={cursor}")
+
+        self.assertNotIn("X-Page-Cache", response)
+
+    def test_publish_purges_post_and_changed_wall_pages(self):
+        posts = [
+            self.add_post(f"Post {day}", datetime.date(2024, 1, day))
+            for day in range(1, 13)
+        ]
+        oldest = posts[0]
+        second_page = self.page_url(9)
+        for url in ("/", second_page, oldest.url):
+            self.client.get(url)
+
+        # The oldest post stays last on the wall, only page two changes
+        oldest.title = "Oldest"
+        oldest.save_revision().publish()
+        purge_page_cache_on_publish(None, oldest)
+
+        self.assertEqual(self.client.get("/")["X-Page-Cache"], "HIT")
+        self.assertEqual(self.client.get(second_page)["X-Page-Cache"], "MISS")
+        self.assertEqual(self.client.get(oldest.url)["X-Page-Cache"], "MISS")
+
+    def test_new_post_only_purges_pages_next_to_it(self):
+        for day in range(1, 31):
+            self.add_post(f"Post {day}", datetime.date(2024, 1, day))
+        second_page, third_page = self.page_url(9), self.page_url(19)
+        for url in ("/", second_page, third_page):
+            self.client.get(url)
+
+        newest = self.add_post("Newest", datetime.date(2025, 1, 1))
+        purge_page_cache_on_publish(None, newest)
+
+        # Pages after a cursor key keep their posts, deep pages stay cached
+        self.assertEqual(self.client.get("/")["X-Page-Cache"], "MISS")
+        self.assertEqual(self.client.get(second_page)["X-Page-Cache"], "HIT")
+        self.assertEqual(self.client.get(third_page)["X-Page-Cache"], "HIT")
+
+    def test_new_tag_purges_every_page(self):
+        posts = [
+            self.add_post(f"Post {day}", datetime.date(2024, 1, day))
+            for day in range(1, 31)
+        ]
+        third_page = self.page_url(19)
+        self.client.get(third_page)
+
+        # The tag list on every page gains the new tag
+        posts[-1].tags.add("music")
+        posts[-1].save_revision().publish()
+        purge_page_cache_on_publish(None, posts[-1])
+
+        self.assertEqual(self.client.get(third_page)["X-Page-Cache"], "MISS")
+
+    def test_unpublish_purges_pages_around_post(self):
+        posts = [
+            self.add_post(f"Post {day}", datetime.date(2024, 1, day))
+            for day in range(1, 31)
+        ]
+        # Post 15 sits at position 15 of the wall, shown on the second page
+        second_page, third_page = self.page_url(9), self.page_url(19)
+        previous_page = self.page_url(20, "before")
+        for url in ("/", second_page, third_page, previous_page):
+            self.client.get(url)
+
+        posts[14].unpublish()
+        purge_page_cache_on_publish(None, posts[14])
+
+        self.assertEqual(self.client.get("/")["X-Page-Cache"], "HIT")
+        self.assertEqual(self.client.get(second_page)["X-Page-Cache"], "MISS")
+        self.assertEqual(self.client.get(third_page)["X-Page-Cache"], "HIT")
+        self.assertEqual(
+            self.client.get(previous_page)["X-Page-Cache"], "MISS"
+        )
+
+    def test_publish_without_wall_index_purges_every_page(self):
+        posts = [
+            self.add_post(f"Post {day}", datetime.date(2024, 1, day))
+            for day in range(1, 31)
+        ]
+        third_page = self.page_url(19)
+        self.client.get(third_page)
+        cache.clear()
+
+        # Pinned, the post leaves the third page, which the rebuilt index
+        # can't tell
+        posts[5].top = True
+        posts[5].save_revision().publish()
+        purge_page_cache_on_publish(None, posts[5])
+
+        self.assertEqual(self.client.get(third_page)["X-Page-Cache"], "MISS")
+        self.assertEqual(wall.get_post_ids(self.homepage.pk)[0], posts[5].pk)
+
+
+class ConditionalGetTests(WagtailPageTestCase):
+    """
+    Tests for the ETag and Last-Modified validators of the wall and posts.
+    """
+
+    def setUp(self):
+        cache.clear()
+        page_cache.purge_all()
+        root_page = Page.get_first_root_node()
+        self.homepage = HomePage(title="Home", body="<p>Welcome</p>")
+        root_page.add_child(instance=self.homepage)
+        Site.objects.create(
+            hostname="testsite",
+            root_page=self.homepage,
+            is_default_site=True
+        )
+        self.post = self.add_post("First", datetime.date(2024, 1, 1))
+
+    def add_post(self, title, date):
+        post = BlogPage(title=title, date=date, live=False)
+        self.homepage.add_child(instance=post)
+        post.save_revision().publish()
+        post.refresh_from_db()
+        return post
+
+    def test_wall_not_modified_before_rendering(self):
+        first = self.client.get("/")
+        page_cache.purge_all()
+
+        with patch.object(HomePage, "get_context") as get_context:
+            response = self.client.get(
+                "/", HTTP_IF_NONE_MATCH=first["ETag"]
+            )
+
+        self.assertTrue(first["ETag"].startswith('"'))
+        self.assertIn("Last-Modified", first)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], first["ETag"])
+        get_context.assert_not_called()
+
+    def test_wall_not_modified_since(self):
+        first = self.client.get("/")
+        page_cache.purge_all()
+
+        response = self.client.get(
+            "/", HTTP_IF_MODIFIED_SINCE=first["Last-Modified"]
+        )
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_wall_etag_varies_with_tag_and_publishing(self):
+        wall_etag = self.client.get("/")["ETag"]
+        tag_etag = self.client.get("/?tag=music")["ETag"]
+        self.add_post("Second", datetime.date(2024, 2, 1))
+        page_cache.purge_all()
+
+        response = self.client.get("/", HTTP_IF_NONE_MATCH=wall_etag)
+
+        self.assertNotEqual(wall_etag, tag_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], wall_etag)
+
+    def test_wall_etag_changes_when_a_post_is_unpublished(self):
+        etag = self.client.get("/")["ETag"]
+        self.post.unpublish()
+        page_cache.purge_all()
+
+        response = self.client.get("/", HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_etag_follows_revision_and_body(self):
+        url = self.post.url
+        etag = self.client.get(url)["ETag"]
+        page_cache.purge_all()
+
+        with patch.object(BlogPage, "get_context") as get_context:
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        get_context.assert_not_called()
+        self.assertEqual(not_modified.status_code, 304)
+
+        BlogPage.objects.filter(pk=self.post.pk).update(body_html="<p>New</p>")
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+
+    def test_post_etag_follows_tag_rename(self):
+        self.post.tags.add("music")
+        self.post.save_revision().publish()
+        url = self.post.url
+        etag = self.client.get(url)["ETag"]
+
+        tag = BlogTag.objects.get(name="music")
+        tag.name = "songs"
+        tag.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "songs")
+
+    def test_cached_page_answers_conditional_request(self):
+        etag = self.client.get("/")["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/", HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_editors_get_no_validators(self):
+        user = get_user_model().objects.create_superuser(
+            "editor", "editor@example.com", "password"
+        )
+        self.client.force_login(user)
+
+        # The userbar costs queries the budget isn't meant for
+        with patch.object(HomePage, "query_budget", None):
+            response = self.client.get("/")
+
+        self.assertNotIn("Last-Modified", response)
+
+    def test_search_sends_etag(self):
+        first = self.client.get("/search/", {"query": "first"})
+        second = self.client.get(
+            "/search/", {"query": "first"}, HTTP_IF_NONE_MATCH=first["ETag"]
+        )
+
+        self.assertEqual(second.status_code, 304)
+
+
+class InstrumentationTests(QueryBudgetMixin, WagtailPageTestCase):
+    """
+    Tests for the per-request query and timing instrumentation.
+    """
+
+    def setUp(self):
+        cache.clear()
+        page_cache.purge_all()
+        root_page = Page.get_first_root_node()
+        self.homepage = HomePage(title="Home", body="<p>Welcome</p>")
+        root_page.add_child(instance=self.homepage)
+        Site.objects.create(
+            hostname="testsite",
+            root_page=self.homepage,
+            is_default_site=True
+        )
+        for day in range(1, 13):
+            post = BlogPage(
+                title=f"Post {day}", date=datetime.date(2024, 1, day),
+                live=False,
+            )
+            self.homepage.add_child(instance=post)
+            post.tags.add("music")
+            post.save_revision().publish()
+
+    def test_wall_stays_within_query_budget(self):
+        # Cold caches, the wall index is built during the request
+        self.assertWithinQueryBudget("/")
+        page_cache.purge_all()
+        self.assertWithinQueryBudget("/", {"tag": "music"})
+
+    def test_wall_query_count_does_not_grow_with_posts(self):
+        self.client.get("/?tag=nope")
+        page_cache.purge_all()
+        empty = self.client.get("/?tag=nope").request_stats.queries
+        page_cache.purge_all()
+        full = self.client.get("/").request_stats.queries
+
+        self.assertEqual(full, empty + 1)
+
+    def test_labels_request_with_page_type(self):
+        first = self.client.get("/")
+        second = self.client.get("/")
+
+        self.assertEqual(first.request_stats.label, "HomePage")
+        self.assertEqual(first.request_stats.query_budget,
+                         HomePage.query_budget)
+        self.assertGreater(first.request_stats.render_time, 0)
+        self.assertEqual(second.request_stats.label, "cached")
+        self.assertEqual(second.request_stats.queries, 0)
+        self.assertEqual(second.request_stats.cache_hits, 1)
+
+    @override_settings(SERVER_TIMING=True)
+    def test_sends_server_timing(self):
+        response = self.client.get("/")
+
+        timing = response["Server-Timing"]
+        stats = response.request_stats
+        self.assertIn("db;dur=", timing)
+        self.assertIn(f'desc="{stats.queries} queries"', timing)
+        self.assertIn("render;dur=", timing)
+        self.assertIn(
+            f'cache;desc="{stats.cache_hits} hits, '
+            f'{stats.cache_misses} misses"',
+            timing,
+        )
+
+    @override_settings(SERVER_TIMING=False)
+    def test_server_timing_can_be_turned_off(self):
+        self.assertNotIn("Server-Timing", self.client.get("/"))
+
+    def test_logs_requests_over_budget(self):
+        with patch.object(HomePage, "query_budget", 0):
+            with self.assertLogs("achers_myspace.requests", "WARNING") as logs:
+                self.client.get("/")
+
+        self.assertIn("over the budget of 0", logs.output[0])
+        self.assertEqual(logs.records[0].request_stats["label"], "HomePage")
+
+    def test_budget_failure_lists_queries(self):
+        with patch.object(HomePage, "query_budget", 0):
+            with self.assertRaises(AssertionError) as failure, \
+                    self.assertLogs("achers_myspace.requests", "WARNING"):
+                self.assertWithinQueryBudget("/")
+
+        self.assertIn("over its budget of 0", str(failure.exception))
+        self.assertIn("SELECT", str(failure.exception))
+
+    def test_collects_connection_pool_stats(self):
+        class FakePool:
+            stats = {
+                "pool_min": 1, "pool_max": 4, "pool_size": 3,
+                "pool_available": 1, "requests_waiting": 2,
+                "requests_num": 10, "requests_queued": 4,
+                "requests_wait_ms": 250, "connections_num": 3,
+                "connections_ms": 30,
+            }
+
+            def pop_stats(self):
+                return dict(self.stats)
+
+        pool_metrics = [
+            instrumentation.DB_POOL_CONNECTIONS,
+            instrumentation.DB_POOL_WAITING,
+            instrumentation.DB_POOL_REQUESTS,
+            instrumentation.DB_POOL_WAIT,
+            instrumentation.DB_POOL_ERRORS,
+        ]
+        for metric in pool_metrics:
+            metric.clear()
+        with patch.object(instrumentation, "connection_pools",
+                          return_value={"default": FakePool()}):
+            instrumentation.record_pool_stats()
+            instrumentation.record_pool_stats()
+
+        labels = {"alias": "default"}
+        self.assertEqual(metric_value(
+            instrumentation.DB_POOL_CONNECTIONS, state="open", **labels), 3)
+        self.assertEqual(metric_value(
+            instrumentation.DB_POOL_CONNECTIONS, state="idle", **labels), 1)
+        self.assertEqual(
+            metric_value(instrumentation.DB_POOL_WAITING, **labels), 2
+        )
+        # Counters add up what each request popped
+        self.assertEqual(
+            metric_value(instrumentation.DB_POOL_REQUESTS, **labels), 20
+        )
+        self.assertEqual(
+            metric_value(instrumentation.DB_POOL_WAIT, **labels), 0.5
+        )
+        self.assertEqual(
+            metric_value(instrumentation.DB_POOL_ERRORS, **labels), 0
+        )
+
+    def test_no_connection_pools_with_sqlite(self):
+        self.assertEqual(instrumentation.connection_pools(), {})
+
+
+# Metrics of the processes run by MetricsTests.run_process()
+PROCESS_METRICS = """
+import os
+from prometheus_client import Counter, Gauge, Histogram
+hits = Counter("hits", "Test metric.", ["label"])
+seconds = Histogram("seconds", "Test metric.", ["label"], buckets=[0.1, 1])
+busy = Gauge("busy", "Test metric.", ["label"], multiprocess_mode="liveall")
+"""
+PRINT_PID = """
+print(os.getpid())
+"""
+
+
+class MetricsTests(WagtailPageTestCase):
+    """
+    Tests for the metrics of requests and the /metrics endpoint.
+    """
+
+    def setUp(self):
+        cache.clear()
+        page_cache.purge_all()
+        root_page = Page.get_first_root_node()
+        self.homepage = HomePage(title="Home", body="<p>Welcome</p>")
+        root_page.add_child(instance=self.homepage)
+        Site.objects.create(
+            hostname="testserver",
+            root_page=self.homepage,
+            is_default_site=True
+        )
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def run_process(self, code, directory=None):
+        """Updates metrics in another process, as a gunicorn worker would,
+        and returns its pid."""
+        env = {**os.environ, metrics.DIRECTORY_ENV: directory or self.directory}
+        env.pop(metrics.GROUP_ENV, None)
+        result = subprocess.run(
+            [sys.executable, "-c", PROCESS_METRICS + code + PRINT_PID],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        return int(result.stdout)
+
+    def test_records_requests(self):
+        labels = {"label": "HomePage", "method": "GET", "status": "2xx"}
+        requests = metric_value(
+            instrumentation.REQUEST_DURATION, "count", **labels
+        )
+        queries = metric_value(
+            instrumentation.REQUEST_QUERIES, label="HomePage"
+        )
+        misses = metric_value(
+            instrumentation.CACHE_LOOKUPS, cache="page", outcome="miss"
+        )
+        hits = metric_value(
+            instrumentation.CACHE_LOOKUPS, cache="page", outcome="hit"
+        )
+
+        response = self.client.get("/")
+        self.client.get("/")
+
+        self.assertEqual(
+            metric_value(instrumentation.REQUEST_DURATION, "count", **labels),
+            requests + 1,
+        )
+        self.assertEqual(
+            metric_value(instrumentation.REQUEST_QUERIES, label="HomePage"),
+            queries + response.request_stats.queries,
+        )
+        self.assertEqual(metric_value(
+            instrumentation.CACHE_LOOKUPS, cache="page", outcome="miss"
+        ), misses + 1)
+        self.assertEqual(metric_value(
+            instrumentation.CACHE_LOOKUPS, cache="page", outcome="hit"
+        ), hits + 1)
+
+    @override_settings(METRICS_TOKEN="")
+    def test_endpoint_serves_text_format(self):
+        self.client.get("/")
+
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        self.assertIn("no-cache", response["Cache-Control"])
+        text = response.content.decode()
+        self.assertIn("# TYPE http_request_duration_seconds histogram", text)
+        self.assertIn(
+            'http_request_duration_seconds_bucket{label="HomePage",'
+            'le="+Inf",method="GET",status="2xx"}',
+            text,
+        )
+        self.assertIn("# TYPE cache_lookups_total counter", text)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_endpoint_requires_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        response = self.client.get(
+            "/metrics", headers={"Authorization": "Bearer secret"}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_adds_up_processes(self):
+        first = self.run_process("""
+hits.labels("a").inc(2)
+seconds.labels("a").observe(0.05)
+seconds.labels("a").observe(0.5)
+busy.labels("a").set(1)
+""")
+        second = self.run_process("""
+hits.labels("a").inc(3)
+hits.labels("b").inc()
+seconds.labels("a").observe(2)
+""")
+
+        text = metrics.exposition(self.directory).decode()
+
+        self.assertIn('hits_total{label="a"} 5.0', text)
+        self.assertIn('hits_total{label="b"} 1.0', text)
+        self.assertIn('seconds_bucket{label="a",le="0.1"} 1.0', text)
+        self.assertIn('seconds_bucket{label="a",le="1.0"} 2.0', text)
+        self.assertIn('seconds_bucket{label="a",le="+Inf"} 3.0', text)
+        self.assertIn('seconds_sum{label="a"} 2.55', text)
+        self.assertIn(f'busy{{label="a",pid="{first}"}} 1.0', text)
+        self.assertNotIn(f'pid="{second}"', text)
+
+    @patch.dict(os.environ)
+    def test_exposition_without_directory_shows_this_process(self):
+        os.environ.pop(metrics.DIRECTORY_ENV, None)
+        instrumentation.cache_hit("wall")
+
+        text = metrics.exposition().decode()
+
+        self.assertIn('cache_lookups_total{cache="wall",outcome="hit"}', text)
+
+    def test_dead_process_keeps_counters(self):
+        pid = self.run_process("""
+hits.labels("a").inc(2)
+busy.labels("a").set(1)
+""")
+
+        metrics.mark_process_dead(pid, self.directory)
+
+        text = metrics.exposition(self.directory).decode()
+        self.assertIn('hits_total{label="a"} 2.0', text)
+        self.assertNotIn("busy{", text)
+
+    def test_process_groups_are_added_up_and_kept(self):
+        group = Path(self.directory, "jobs")
+        group.mkdir()
+        self.run_process('hits.labels("a").inc(2)')
+        self.run_process('hits.labels("a").inc(3)', directory=str(group))
+
+        text = metrics.exposition(self.directory).decode()
+        metrics.clear_directory(self.directory)
+
+        self.assertIn('hits_total{label="a"} 5.0', text)
+        self.assertEqual(list(Path(self.directory).glob("*.db")), [])
+        self.assertTrue(list(group.glob("*.db")))
+
+    @patch.dict(os.environ)
+    def test_process_group_has_its_own_directory(self):
+        os.environ[metrics.DIRECTORY_ENV] = self.directory
+        os.environ.pop(metrics.GROUP_ENV, None)
+
+        with patch.object(metrics.atexit, "register") as register:
+            metrics.set_process_group("jobs")
+            metrics.set_process_group("export")
+
+        group = str(Path(self.directory, "jobs"))
+        self.assertEqual(metrics.metrics_dir(), group)
+        self.assertEqual(metrics.shared_dir(), self.directory)
+        self.assertTrue(Path(group).is_dir())
+        register.assert_called_once_with(
+            metrics.mark_process_dead, os.getpid(), group
+        )
+
+
+class StaticExportTests(WagtailPageTestCase):
+    """
+    Tests for the static export of the wall, the posts and the feeds.
+    """
+
+    def setUp(self):
+        cache.clear()
+        page_cache.purge_all()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        root_page = Page.get_first_root_node()
+        self.homepage = HomePage(title="Home", body="<p>Welcome</p>")
+        root_page.add_child(instance=self.homepage)
+        Site.objects.create(
+            hostname="testserver",
+            root_page=self.homepage,
+            is_default_site=True
+        )
+        for day in range(1, 13):
+            self.post = BlogPage(
+                title=f"Post {day}", date=datetime.date(2024, 1, day),
+                live=False,
+            )
+            self.homepage.add_child(instance=self.post)
+            self.post.tags.add("hip hop")
+            self.post.save_revision().publish()
+        self.post.refresh_from_db()
+        self.site_root = Path(self.root, "testserver")
+
+    def exported(self, name):
+        return (self.site_root / name).read_bytes()
+
+    def test_exports_every_page(self):
+        result = static_export.export(root=self.root)
+
+        keys = wall.get_post_keys(self.homepage.pk)
+        after = pagination.encode_cursor(keys[9])
+        self.assertEqual(self.exported("index.html"),
+                         self.client.get("/").content)
+        self.assertEqual(
+            self.exported(f"index?after={after}.html"),
+            self.client.get(f"/?after={after}").content,
+        )
+        # As the tag links of the templates escape it
+        self.assertTrue((self.site_root / "index?tag=hip%20hop.html").exists())
+        self.assertTrue(
+            (self.site_root / f"index?after={after}&tag=hip%20hop.html").exists()
+        )
+        self.assertTrue((self.site_root / "post-12/index.html").exists())
+        self.assertTrue((self.site_root / "feeds/rss/index.rss").exists())
+        self.assertTrue((self.site_root / "feeds/json/index.json").exists())
+        # Wall, next and previous pages for the wall and the tag, 12
+        # posts, 3 feeds each
+        files = [path for path in self.site_root.rglob("*") if path.is_file()]
+        self.assertEqual(len(files), 2 * 2 + 12 + 6)
+        # The site the migrations create has its own directory
+        self.assertTrue(Path(self.root, "localhost", "index.html").exists())
+        self.assertEqual(result["written"], len(files) + 4)
+
+    def test_renders_are_not_recorded(self):
+        labels = {"label": "HomePage", "method": "GET", "status": "2xx"}
+        requests = metric_value(
+            instrumentation.REQUEST_DURATION, "count", **labels
+        )
+        hits = metric_value(
+            instrumentation.CACHE_LOOKUPS, cache="page", outcome="hit"
+        )
+        self.client.get("/")
+
+        static_export.render("http://testserver", [("/", "")], self.root)
+
+        self.assertEqual(
+            metric_value(instrumentation.REQUEST_DURATION, "count", **labels),
+            requests + 1,
+        )
+        self.assertEqual(
+            metric_value(
+                instrumentation.CACHE_LOOKUPS, cache="page", outcome="hit"
+            ),
+            hits,
+        )
+
+    def test_full_export_removes_pages_that_are_gone(self):
+        stale = Path(self.site_root, "gone", "index.html")
+        stale.parent.mkdir(parents=True)
+        stale.write_text("gone")
+        other = Path(self.root, "robots.txt")
+        other.write_text("kept")
+
+        result = static_export.export(root=self.root)
+
+        self.assertFalse(stale.exists())
+        self.assertTrue(other.exists())
+        self.assertEqual(result["removed"], 1)
+
+    def test_publish_exports_the_pages_it_changed(self):
+        static_export.export(root=self.root)
+        post = BlogPage(
+            title="Newest", date=datetime.date(2024, 2, 1), live=False
+        )
+        self.homepage.add_child(instance=post)
+        post.tags.add("hip hop")
+        post.save_revision().publish()
+
+        with override_settings(STATIC_EXPORT_ROOT=self.root):
+            purge_page_cache_on_publish(None, post)
+            job = BackgroundJob.objects.get(task=EXPORT_SITE)
+            run_pending()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, BackgroundJob.Status.SUCCEEDED)
+        self.assertIn(b"Newest", self.exported("newest/index.html"))
+        self.assertIn(b"Newest", self.exported("index.html"))
+        self.assertIn(b"Newest", self.exported("index?tag=hip%20hop.html"))
+        self.assertIn(b"Newest", self.exported("feeds/rss/index.rss"))
+        # Only the pages next to the change were rendered
+        self.assertLess(job.result["written"], 22)
+
+    def test_unpublish_removes_the_post(self):
+        static_export.export(root=self.root)
+        self.post.unpublish()
+
+        with override_settings(STATIC_EXPORT_ROOT=self.root):
+            purge_page_cache_on_unpublish(None, self.post)
+            run_pending()
+
+        self.assertFalse((self.site_root / "post-12/index.html").exists())
+        self.assertNotIn(b"Post 12", self.exported("index.html"))
+
+    def test_tag_rename_exports_the_site(self):
+        static_export.export(root=self.root)
+
+        with override_settings(STATIC_EXPORT_ROOT=self.root):
+            tag = BlogTag.objects.get(name="hip hop")
+            tag.name = "rap"
+            tag.save()
+            run_pending()
+
+        self.assertFalse((self.site_root / "index?tag=hip%20hop.html").exists())
+        self.assertIn(b"Post 12", self.exported("index?tag=rap.html"))
+        self.assertIn(b"rap", self.exported("post-12/index.html"))
+
+    def test_nothing_queued_without_export_root(self):
+        purge_page_cache_on_publish(None, self.post)
+
+        self.assertFalse(BackgroundJob.objects.filter(task=EXPORT_SITE).exists())
+
+
+class StaticAssetsTests(SimpleTestCase):
+    """
+    Tests for the optimizing static files storage and its template tag.
+    """
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+        source = Path(settings.PROJECT_DIR) / "static"
+        (self.root / "fonts").mkdir()
+        (self.root / "css").mkdir()
+        shutil.copy(source / "fonts" / "dk-compagnon.otf", self.root / "fonts")
+        shutil.copy(source / "insta.png", self.root)
+        (self.root / "css" / "site.css").write_text(
+            "@font-face { src: url('../fonts/dk-compagnon.woff2'); }\n"
+            + "body { color: black; }\n" * 50
+        )
+        self.storage = OptimizedManifestStaticFilesStorage(
+            location=self.root, base_url="/static/"
+        )
+        self.report = Path(tempfile.mkdtemp()) / "static-report.json"
+        self.addCleanup(shutil.rmtree, self.report.parent)
+        settings_override = override_settings(STATIC_REPORT_PATH=self.report)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def collect(self):
+        paths = {
+            name: (self.storage, name)
+            for name in ("css/site.css", "fonts/dk-compagnon.otf", "insta.png")
+        }
+        for name, hashed_name, processed in self.storage.post_process(paths):
+            if isinstance(processed, Exception):
+                raise processed
+        self.storage.save_manifest()
+
+    def test_converts_fonts_and_icons_before_hashing(self):
+        self.collect()
+
+        woff2 = self.storage.stored_name("fonts/dk-compagnon.woff2")
+        self.assertTrue((self.root / woff2).read_bytes().startswith(b"wOF2"))
+        css = (self.root / self.storage.stored_name("css/site.css")).read_text()
+        self.assertIn(woff2.removeprefix("fonts/"), css)
+        for extension in (".webp", ".avif"):
+            converted = self.root / self.storage.stored_name(f"insta{extension}")
+            self.assertLess(
+                converted.stat().st_size, (self.root / "insta.png").stat().st_size
+            )
+
+    def test_writes_compressed_copies_and_report(self):
+        self.collect()
+
+        hashed_css = self.storage.stored_name("css/site.css")
+        self.assertTrue((self.root / f"{hashed_css}.gz").exists())
+        self.assertTrue((self.root / "css/site.css.gz").exists())
+        # PNGs are already compressed
+        self.assertFalse((self.root / "insta.png.gz").exists())
+
+        report = json.loads(self.report.read_text())
+        # STATIC_ROOT is public
+        self.assertFalse((self.root / "static-report.json").exists())
+        self.assertIn(hashed_css, [item["name"] for item in report["compressed"]])
+        self.assertGreater(report["totals"]["gzip_saved_bytes"], 0)
+        self.assertGreater(report["totals"]["converted_saved_bytes"], 0)
+
+    def test_picture_falls_back_to_original_without_copies(self):
+        html = Template(
+            "{% load static_assets %}{% static_picture 'insta.png' alt='Insta' %}"
+        ).render(Context())
+
+        self.assertEqual(
+            html,
+            '<picture><img src="/static/insta.png" alt="Insta"></picture>',
+        )
@@ -0,0 +1,313 @@
+"""Materialized "post wall" index for the HomePage.
+
+The wall is an ordered list of live BlogPage ids (pinned posts first, then by
+date, newest first), plus one list per tag. It lives in the cache and is
+updated incrementally from the publish/unpublish/delete signals, so serving a
+page of the wall costs no queries to get the ids and one bulk fetch for the
+posts themselves.
+
+The index also records when it last changed, for the validators of the wall
+pages. The cache is shared by the processes that publish posts, so updates
+read, change and write the index under a lock in the cache.
+"""
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from achers_myspace import instrumentation
+
+logger = logging.getLogger(__name__)
+
+# Versioned, indexes of an older layout are left to expire
+WALL_CACHE_KEY = "home:wall:v2:{home_id}"
+WALL_CHANGES_KEY = "home:wall-changes:{post_id}"
+WALL_LOCK_KEY = "home:wall-lock:{home_id}"
+
+# The index is kept up to date by signals, the timeout is only a safety net
+# against drift (e.g. pages edited directly in the database).
+WALL_TIMEOUT = 60 * 60 * 24
+# Changes are picked up by the page cache purge right after publishing.
+WALL_CHANGES_TIMEOUT = 60 * 5
+# Updates of the index take milliseconds. The timeout frees the lock of a
+# process that died holding it, an update still waiting after
+# WALL_LOCK_WAIT seconds drops the index instead.
+WALL_LOCK_TIMEOUT = 10
+WALL_LOCK_WAIT = 2
+
+ALL_POSTS = "all"
+# Set in the changes when a tag got its first post or lost its last one
+TAGS_CHANGED = "tags-changed"
+
+
+def tag_list_name(tag: str) -> str:
+    """Returns the name of the wall list for the given tag."""
+    return f"tag:{tag}"
+
+
+def list_tag(name: str) -> str | None:
+    """Returns the tag of a wall list name, or None for the full wall."""
+    if name == ALL_POSTS:
+        return None
+    return name.removeprefix("tag:")
+
+
+def sort_key(post_id: int, top: bool, date) -> tuple:
+    """Returns the ascending sort key for a post on the wall.
+
+    Matches ``order_by('-top', '-date', '-id')``.
+    """
+    return (not top, -date.toordinal(), -post_id)
+
+
+def key_post_id(key: tuple) -> int:
+    """Returns the BlogPage id of a wall sort key."""
+    return -key[2]
+
+
+def _page_size() -> int:
+    from home.models import HomePage
+
+    return HomePage.posts_per_page
+
+
+def build_index(home_id: int) -> dict:
+    """Builds the wall index for the given HomePage from the database."""
+    from blog.models import BlogPage
+    from home.models import HomePage
+
+    home = HomePage.objects.get(pk=home_id)
+    rows = BlogPage.objects.live().child_of(home).values_list(
+        "pk", "top", "date", "tag_names"
+    )
+    posts = {
+        pk: {"key": sort_key(pk, top, date), "tags": list(tags)}
+        for pk, top, date, tags in rows
+    }
+
+    lists = {ALL_POSTS: []}
+    for post in posts.values():
+        lists[ALL_POSTS].append(post["key"])
+        for tag in post["tags"]:
+            lists.setdefault(tag_list_name(tag), []).append(post["key"])
+    for entries in lists.values():
+        entries.sort()
+
+    # What changed before the build isn't known, so it counts as a change
+    return {"posts": posts, "lists": lists, "modified": timezone.now()}
+
+
+def get_index(home_id: int) -> dict:
+    """Returns the cached wall index, building it on a cache miss."""
+    key = WALL_CACHE_KEY.format(home_id=home_id)
+    index = cache.get(key)
+    if index is None:
+        instrumentation.cache_miss("wall")
+        index = build_index(home_id)
+        cache.set(key, index, WALL_TIMEOUT)
+    else:
+        instrumentation.cache_hit("wall")
+    return index
+
+
+def get_post_keys(home_id: int, tag: str | None = None) -> list[tuple]:
+    """Returns the sorted wall keys, optionally for a tag."""
+    index = get_index(home_id)
+    name = tag_list_name(tag) if tag else ALL_POSTS
+    return index["lists"].get(name, [])
+
+
+def get_post_ids(home_id: int, tag: str | None = None) -> list[int]:
+    """Returns the ordered BlogPage ids on the wall, optionally for a tag."""
+    return [key_post_id(key) for key in get_post_keys(home_id, tag)]
+
+
+def modified(home_id: int):
+    """Returns when the wall last changed, or was last rebuilt."""
+    return get_index(home_id)["modified"]
+
+
+def tag_counts(home_id: int) -> dict:
+    """Returns a mapping of tag name to the number of live posts, by name."""
+    index = get_index(home_id)
+    counts = {
+        list_tag(name): len(keys)
+        for name, keys in index["lists"].items()
+        if name != ALL_POSTS
+    }
+    return dict(sorted(counts.items()))
+
+
+def fetch_posts(post_ids) -> list:
+    """Fetches live BlogPages for ``post_ids`` in one query, keeping order."""
+    from blog.models import BlogPage
+
+    posts = BlogPage.objects.live().in_bulk(post_ids)
+    return [posts[pk] for pk in post_ids if pk in posts]
+
+
+async def afetch_posts(post_ids) -> list:
+    """Async ``fetch_posts``."""
+    from blog.models import BlogPage
+
+    posts = await BlogPage.objects.live().ain_bulk(post_ids)
+    return [posts[pk] for pk in post_ids if pk in posts]
+
+
+def _record(changes: dict, name: str, entries: list, position: int) -> None:
+    """Records the wall pages a change at ``position`` of ``entries`` touches.
+
+    A page shows the ``per_page`` keys after (or before) its cursor key, so
+    only the first page and the pages whose cursor is one of the
+    ``per_page`` keys on either side of the change are affected.
+    """
+    per_page = _page_size()
+    change = changes.setdefault(
+        name, {"first_page": False, "after": set(), "before": set()}
+    )
+    change["first_page"] |= position < per_page
+    change["after"].update(entries[max(position - per_page, 0):position])
+    change["before"].update(entries[position + 1:position + 1 + per_page])
+
+
+def _remove(index: dict, post_id: int, changes: dict) -> None:
+    post = index["posts"].pop(post_id, None)
+    if post is None:
+        return
+    for name in [ALL_POSTS] + [tag_list_name(t) for t in post["tags"]]:
+        entries = index["lists"].get(name, [])
+        position = bisect.bisect_left(entries, post["key"])
+        if position < len(entries) and entries[position] == post["key"]:
+            _record(changes, name, entries, position)
+            # Links to the pages next to the removed post stay around
+            changes[name]["after"].add(post["key"])
+            changes[name]["before"].add(post["key"])
+            del entries[position]
+        if not entries and name != ALL_POSTS:
+            index["lists"].pop(name, None)
+            changes[TAGS_CHANGED] = True
+
+
+def _insert(index: dict, post_id: int, key: tuple, tags, changes) -> None:
+    index["posts"][post_id] = {"key": key, "tags": list(tags)}
+    for name in [ALL_POSTS] + [tag_list_name(t) for t in tags]:
+        if name not in index["lists"]:
+            changes[TAGS_CHANGED] = True
+        entries = index["lists"].setdefault(name, [])
+        position = bisect.bisect_left(entries, key)
+        entries.insert(position, key)
+        _record(changes, name, entries, position)
+
+
+def _save(home_id: int, index: dict, post_id: int, changes: dict) -> None:
+    index["modified"] = timezone.now()
+    cache.set(WALL_CACHE_KEY.format(home_id=home_id), index, WALL_TIMEOUT)
+    _save_changes(post_id, changes)
+
+
+def _save_changes(post_id: int, changes: dict) -> None:
+    if not changes:
+        # Keep what an earlier update recorded, e.g. the unpublish that
+        # Wagtail sends right before deleting a live page.
+        return
+    cache.set(
+        WALL_CHANGES_KEY.format(post_id=post_id), changes, WALL_CHANGES_TIMEOUT
+    )
+
+
+@contextmanager
+def _locked(home_id: int):
+    """Holds the lock on a wall index across the processes sharing the
+    cache, e.g. the web workers and the job worker. Yields whether it was
+    taken."""
+    key = WALL_LOCK_KEY.format(home_id=home_id)
+    deadline = time.monotonic() + WALL_LOCK_WAIT
+    while not cache.add(key, True, WALL_LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            yield False
+            return
+        time.sleep(0.01)
+    try:
+        yield True
+    finally:
+        cache.delete(key)
+
+
+def update_post(page) -> dict:
+    """Moves a published BlogPage into its place on the wall.
+
+    Returns a mapping of wall list name to the pages that changed, see
+    ``pop_changes``.
+    """
+    home_id = page.get_parent().pk
+    with _locked(home_id) as locked:
+        if not locked:
+            invalidate(home_id)
+            return _unknown_changes(page)
+        index = cache.get(WALL_CACHE_KEY.format(home_id=home_id))
+        if index is None:
+            # A rebuild would already have the post in its new place, where
+            # it was before is unknown
+            return _unknown_changes(page)
+        changes = {}
+        _remove(index, page.pk, changes)
+        _insert(index, page.pk, sort_key(page.pk, page.top, page.date),
+                page.tag_names, changes)
+        _save(home_id, index, page.pk, changes)
+    logger.debug(f"Updated wall {home_id} for post {page.pk}: {changes}")
+    return changes
+
+
+def remove_post(page) -> dict:
+    """Removes an unpublished or deleted BlogPage from the wall.
+
+    Returns a mapping of wall list name to the pages that changed, see
+    ``pop_changes``.
+    """
+    home_id = page.get_parent().pk
+    with _locked(home_id) as locked:
+        if not locked:
+            invalidate(home_id)
+            return _unknown_changes(page)
+        index = cache.get(WALL_CACHE_KEY.format(home_id=home_id))
+        if index is None:
+            # Nothing cached, the next read rebuilds from the database
+            return _unknown_changes(page)
+        changes = {}
+        _remove(index, page.pk, changes)
+        _save(home_id, index, page.pk, changes)
+    logger.debug(f"Removed post {page.pk} from wall {home_id}: {changes}")
+    return changes
+
+
+def _unknown_changes(page) -> dict:
+    """Records every page of the post's lists as changed, for updates made
+    while the index wasn't cached."""
+    names = [ALL_POSTS] + [tag_list_name(t) for t in page.tag_names]
+    changes = {name: {"all": True} for name in names}
+    # The post's earlier tags are unknown as well
+    changes[TAGS_CHANGED] = True
+    _save_changes(page.pk, changes)
+    return changes
+
+
+def pop_changes(post_id: int) -> dict:
+    """Returns and forgets the pages changed by the last update of a post.
+
+    Returns a mapping of wall list name to ``{"first_page": bool, "after":
+    keys, "before": keys}``, the pages by cursor key that changed, or to
+    ``{"all": True}`` when every page of the list may have changed.
+    ``TAGS_CHANGED`` is set when a tag got its first post or lost its last.
+    """
+    key = WALL_CHANGES_KEY.format(post_id=post_id)
+    changes = cache.get(key) or {}
+    cache.delete(key)
+    return changes
+
+
+def invalidate(home_id: int) -> None:
+    """Drops the cached wall, the next read rebuilds it from the database."""
+    cache.delete(WALL_CACHE_KEY.format(home_id=home_id))
@@ -0,0 +1,40 @@
+# Generated by Django 6.1.2 on 2026-10-17 13:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(help_text='With the query string.', max_length=2000)),
+                ('label', models.CharField(help_text='Wagtail page type or view name.', max_length=100)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('duration_ms', models.FloatField(verbose_name='Duration (ms)')),
+                ('trigger', models.CharField(choices=[('slow', 'Slow'), ('sampled', 'Sampled')], max_length=20)),
+                ('kind', models.CharField(choices=[('stacks', 'Stack samples'), ('cprofile', 'cProfile')], max_length=20)),
+                ('queries', models.PositiveIntegerField(default=0)),
+                ('db_ms', models.FloatField(default=0, verbose_name='Database time (ms)')),
+                ('samples', models.PositiveIntegerField(default=0, help_text='Stacks sampled, or calls profiled by cProfile.')),
+                ('summary', models.TextField(blank=True, help_text='Where the time went, the top functions.')),
+                ('stacks', models.TextField(blank=True, help_text="Collapsed stacks, a 'frame;frame;... count' line per stack, for flamegraph.pl, speedscope or inferno.")),
+                ('pstats', models.BinaryField(blank=True, help_text='cProfile stats, as pstats writes them.', null=True)),
+                ('sql', models.TextField(blank=True, verbose_name='SQL')),
+            ],
+            options={
+                'verbose_name': 'request profile',
+                'verbose_name_plural': 'request profiles',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
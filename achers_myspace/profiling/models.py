@@ -0,0 +1,51 @@
+from django.db import models
+
+
+class RequestProfile(models.Model):
+    """A profile of one slow or sampled request, see achers_myspace.profiling."""
+
+    class Trigger(models.TextChoices):
+        SLOW = "slow", "Slow"
+        SAMPLED = "sampled", "Sampled"
+
+    class Kind(models.TextChoices):
+        STACKS = "stacks", "Stack samples"
+        CPROFILE = "cprofile", "cProfile"
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2000, help_text="With the query string.")
+    label = models.CharField(
+        max_length=100, help_text="Wagtail page type or view name."
+    )
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField("Duration (ms)")
+    trigger = models.CharField(max_length=20, choices=Trigger.choices)
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    queries = models.PositiveIntegerField(default=0)
+    db_ms = models.FloatField("Database time (ms)", default=0)
+    samples = models.PositiveIntegerField(
+        default=0, help_text="Stacks sampled, or calls profiled by cProfile."
+    )
+    summary = models.TextField(
+        blank=True, help_text="Where the time went, the top functions."
+    )
+    stacks = models.TextField(
+        blank=True,
+        help_text=(
+            "Collapsed stacks, a 'frame;frame;... count' line per stack, "
+            "for flamegraph.pl, speedscope or inferno."
+        ),
+    )
+    pstats = models.BinaryField(
+        blank=True, null=True, help_text="cProfile stats, as pstats writes them."
+    )
+    sql = models.TextField("SQL", blank=True)
+
+    class Meta:
+        verbose_name = "request profile"
+        verbose_name_plural = "request profiles"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
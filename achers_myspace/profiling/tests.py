@@ -0,0 +1,197 @@
+import cProfile
+import marshal
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.test import override_settings
+
+from achers_myspace import page_cache, profiling
+from home.models import HomePage
+from profiling.models import RequestProfile
+
+from wagtail.models import Page, Site
+from wagtail.test.utils import WagtailPageTestCase
+
+
+class ProfilingTests(WagtailPageTestCase):
+    """
+    Tests for the profiles of slow and sampled requests.
+    """
+
+    def setUp(self):
+        cache.clear()
+        page_cache.purge_all()
+        root_page = Page.get_first_root_node()
+        self.homepage = HomePage(title="Home", body="<p>Welcome</p>")
+        root_page.add_child(instance=self.homepage)
+        Site.objects.create(
+            hostname="testserver",
+            root_page=self.homepage,
+            is_default_site=True
+        )
+
+    @override_settings(PROFILING=False)
+    def test_disabled_middleware_is_not_used(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            profiling.ProfilingMiddleware(lambda request: None)
+
+    @override_settings(PROFILING=True, PROFILE_SAMPLE_RATE=1, PROFILE_SLOW_MS=0,
+                       PROFILE_CPROFILE=False)
+    def test_records_sampled_request(self):
+        response = self.client.get("/")
+
+        profile = RequestProfile.objects.get()
+        self.assertEqual(profile.trigger, RequestProfile.Trigger.SAMPLED)
+        self.assertEqual(profile.kind, RequestProfile.Kind.STACKS)
+        self.assertEqual(profile.path, "/")
+        self.assertEqual(profile.label, "HomePage")
+        self.assertEqual(profile.status_code, 200)
+        self.assertEqual(profile.queries, response.request_stats.queries)
+        self.assertEqual(
+            len(profile.sql.splitlines()), response.request_stats.queries
+        )
+        self.assertIn("SELECT", profile.sql)
+        # Saving the profile isn't counted against the request
+        self.assertIsNone(response.request_stats.sql)
+
+    @override_settings(PROFILING=True, PROFILE_SAMPLE_RATE=0,
+                       PROFILE_SLOW_MS=0.001)
+    def test_records_slow_request(self):
+        self.client.get("/")
+
+        profile = RequestProfile.objects.get()
+        self.assertEqual(profile.trigger, RequestProfile.Trigger.SLOW)
+        self.assertEqual(profile.kind, RequestProfile.Kind.STACKS)
+        self.assertGreater(profile.duration_ms, 0)
+        # Only sampled requests record their SQL
+        self.assertEqual(profile.sql, "")
+
+    @override_settings(PROFILING=True, PROFILE_SAMPLE_RATE=0,
+                       PROFILE_SLOW_MS=60_000)
+    def test_fast_request_is_not_recorded(self):
+        self.client.get("/")
+
+        self.assertFalse(RequestProfile.objects.exists())
+
+    @override_settings(PROFILING=True, PROFILE_SAMPLE_RATE=1, PROFILE_SLOW_MS=0,
+                       PROFILE_CPROFILE=True)
+    def test_records_cprofile_stats(self):
+        self.client.get("/")
+
+        profile = RequestProfile.objects.get()
+        self.assertEqual(profile.kind, RequestProfile.Kind.CPROFILE)
+        self.assertGreater(profile.samples, 0)
+        self.assertIn("cumulative", profile.summary)
+        stats = marshal.loads(bytes(profile.pstats))
+        self.assertTrue(any(
+            function == "serve" for _, _, function in stats
+        ))
+
+    @override_settings(PROFILING=True, PROFILE_SAMPLE_RATE=1, PROFILE_SLOW_MS=0,
+                       PROFILE_CPROFILE=True)
+    def test_overlapping_request_is_sampled(self):
+        # Another request of the worker is running under cProfile
+        other = profiling.start_cprofile()
+        try:
+            response = self.client.get("/")
+        finally:
+            profiling.stop_cprofile(other)
+
+        self.assertEqual(response.status_code, 200)
+        profile = RequestProfile.objects.get()
+        self.assertEqual(profile.kind, RequestProfile.Kind.STACKS)
+
+    @override_settings(PROFILING=True, PROFILE_SAMPLE_RATE=1, PROFILE_SLOW_MS=0,
+                       PROFILE_CPROFILE=True)
+    def test_request_is_sampled_under_another_profiler(self):
+        other = cProfile.Profile()
+        other.enable()
+        try:
+            response = self.client.get("/")
+        finally:
+            other.disable()
+
+        self.assertEqual(response.status_code, 200)
+        profile = RequestProfile.objects.get()
+        self.assertEqual(profile.kind, RequestProfile.Kind.STACKS)
+        # The next request can run under cProfile
+        profiler = profiling.start_cprofile()
+        self.assertIsNotNone(profiler)
+        profiling.stop_cprofile(profiler)
+
+    @override_settings(PROFILING=True, PROFILE_SAMPLE_RATE=1, PROFILE_SLOW_MS=0,
+                       PROFILE_CPROFILE=False, PROFILE_KEEP=2)
+    def test_keeps_newest_profiles(self):
+        for path in ["/", "/?page=1", "/?page=2"]:
+            self.client.get(path)
+
+        self.assertQuerySetEqual(
+            RequestProfile.objects.values_list("path", flat=True),
+            ["/?page=2", "/?page=1"],
+        )
+
+    @override_settings(PROFILE_INTERVAL_MS=1)
+    def test_sampler_captures_stacks(self):
+        def wait_for_samples():
+            deadline = time.monotonic() + 5
+            while not capture.samples and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        capture = profiling.sampler.start()
+        try:
+            wait_for_samples()
+        finally:
+            profiling.sampler.stop(capture)
+
+        self.assertGreater(capture.samples, 0)
+        self.assertIn("wait_for_samples (", capture.collapsed())
+        self.assertEqual(capture.ident, threading.get_ident())
+
+    @override_settings(PROFILE_INTERVAL_MS=1)
+    def test_sampler_waits_for_the_threshold(self):
+        capture = profiling.sampler.start(delay=60)
+        try:
+            time.sleep(0.05)
+        finally:
+            profiling.sampler.stop(capture)
+
+        self.assertEqual(capture.samples, 0)
+
+    @override_settings(PROFILE_INTERVAL_MS=1)
+    def test_sampler_samples_past_the_threshold(self):
+        capture = profiling.sampler.start(delay=0.02)
+        try:
+            deadline = time.monotonic() + 5
+            while not capture.samples and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            profiling.sampler.stop(capture)
+
+        self.assertGreater(capture.samples, 0)
+
+    @override_settings(PROFILING=True, PROFILE_SAMPLE_RATE=1, PROFILE_SLOW_MS=0,
+                       PROFILE_CPROFILE=False)
+    def test_admin_lists_and_exports_profiles(self):
+        self.client.get("/")
+        profile = RequestProfile.objects.get()
+        user = get_user_model().objects.create_superuser(
+            "admin", "admin@example.com", "password"
+        )
+        self.client.force_login(user)
+
+        listing = self.client.get("/admin/snippets/profiling/requestprofile/")
+        inspect = self.client.get(
+            f"/admin/snippets/profiling/requestprofile/inspect/{profile.pk}/"
+        )
+        export = self.client.get(
+            f"/admin/snippets/profiling/requestprofile/export/{profile.pk}/"
+        )
+
+        self.assertContains(listing, "Download flame graph stacks")
+        self.assertContains(inspect, "HomePage")
+        self.assertEqual(export.status_code, 200)
+        self.assertIn("attachment", export["Content-Disposition"])
+        self.assertEqual(export.content.decode(), profile.stacks)
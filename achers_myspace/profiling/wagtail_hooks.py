@@ -0,0 +1,91 @@
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from wagtail.admin.admin_url_finder import quote
+from wagtail.admin.ui.menus import MenuItem
+from wagtail.snippets.models import register_snippet
+from wagtail.snippets.views.snippets import IndexView, SnippetViewSet
+
+from profiling.models import RequestProfile
+
+
+class RequestProfileIndexView(IndexView):
+    export_url_name = None
+
+    def get_list_more_buttons(self, instance):
+        buttons = super().get_list_more_buttons(instance)
+        if instance.kind == RequestProfile.Kind.CPROFILE:
+            label = "Download pstats"
+        else:
+            label = "Download flame graph stacks"
+        buttons.append(MenuItem(
+            label,
+            url=reverse(self.export_url_name, args=(quote(instance.pk),)),
+            icon_name="download",
+            priority=25,
+        ))
+        return buttons
+
+
+class RequestProfileViewSet(SnippetViewSet):
+    """Slow and sampled requests recorded by achers_myspace.profiling."""
+    model = RequestProfile
+    icon = "history"
+    menu_label = "Request profiles"
+    add_to_settings_menu = True
+    inspect_view_enabled = True
+    copy_view_enabled = False
+    index_view_class = RequestProfileIndexView
+    list_display = [
+        "path", "label", "duration_ms", "queries", "trigger", "created_at",
+    ]
+    list_filter = ["trigger", "kind"]
+    inspect_view_fields = [
+        "created_at", "method", "path", "label", "status_code", "duration_ms",
+        "trigger", "kind", "queries", "db_ms", "samples", "summary", "sql",
+    ]
+
+    def get_queryset(self, request):
+        # The listing doesn't show the profiles themselves
+        return RequestProfile.objects.defer("summary", "stacks", "pstats", "sql")
+
+    def get_common_view_kwargs(self, **kwargs):
+        # Profiles are recorded by requests, they aren't added or edited
+        return super().get_common_view_kwargs(
+            add_url_name=None, edit_url_name=None, **kwargs
+        )
+
+    def get_index_view_kwargs(self, **kwargs):
+        return super().get_index_view_kwargs(
+            export_url_name=self.get_url_name("export"), **kwargs
+        )
+
+    def get_urlpatterns(self):
+        return super().get_urlpatterns() + [
+            path("export/<str:pk>/", self.export_view, name="export"),
+        ]
+
+    def export_view(self, request, pk):
+        """Downloads the stacks, for a flame graph, or the cProfile stats."""
+        if not self.permission_policy.user_has_any_permission(
+            request.user, ["view", "change", "delete"]
+        ):
+            raise PermissionDenied
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        if profile.kind == RequestProfile.Kind.CPROFILE:
+            response = HttpResponse(
+                bytes(profile.pstats or b""),
+                content_type="application/octet-stream",
+            )
+            filename = f"profile-{profile.pk}.prof"
+        else:
+            response = HttpResponse(
+                profile.stacks, content_type="text/plain; charset=utf-8"
+            )
+            filename = f"profile-{profile.pk}.folded"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+register_snippet(RequestProfileViewSet)
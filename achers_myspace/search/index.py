@@ -0,0 +1,237 @@
+"""Full-text search over BlogPage titles, bodies and tags.
+
+Live posts are copied into ``PostSearchEntry`` from the publish signals.
+Queries run against PostgreSQL full-text search in production and an FTS5
+table in SQLite development databases; other databases fall back to
+Wagtail's search backend. Result ids are kept in a per-process LRU cache of
+normalized queries, so paging through results doesn't run the search again.
+The time of each search run is recorded in ``search_query_seconds``.
+"""
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from html import unescape
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.utils.html import strip_tags
+from prometheus_client import Histogram
+
+from achers_myspace import instrumentation
+from search.models import PostSearchEntry
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on the results of one query, the rest are never shown
+MAX_RESULTS = 500
+
+RESULTS_CACHE_SIZE = 256
+SEARCH_LATENCY = Histogram(
+    "search_query_seconds",
+    "Time to run a full-text search, results cache misses only.",
+    ["backend"],
+)
+GENERATION_KEY = "search:generation"
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+POSTGRES_QUERY = """
+    SELECT page_id
+    FROM search_postsearchentry, websearch_to_tsquery('english', %s) query
+    WHERE search_vector @@ query
+    ORDER BY ts_rank(search_vector, query) DESC, page_id DESC
+    LIMIT %s
+"""
+
+# Title matches weigh most, then tags, then the body
+SQLITE_QUERY = """
+    SELECT rowid
+    FROM search_postfts
+    WHERE search_postfts MATCH %s
+    ORDER BY bm25(search_postfts, 10.0, 5.0, 1.0), rowid DESC
+    LIMIT %s
+"""
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def body_text(page) -> str:
+    """Returns the plain text of a post body."""
+    return " ".join(unescape(strip_tags(page.body)).split())
+
+
+def update_post(page) -> None:
+    """Adds or refreshes the search entry of a published post."""
+    PostSearchEntry.objects.update_or_create(
+        page_id=page.pk,
+        defaults={
+            "title": page.title,
+            "tags": " ".join(page.tag_names),
+            "body": body_text(page),
+        },
+    )
+    bump_generation()
+
+
+def update_tags(page_ids) -> None:
+    """Refreshes the tags of the search entries of posts whose tag was
+    renamed or deleted, from their stored tag names."""
+    from blog.models import BlogPage
+
+    tags = BlogPage.objects.filter(pk__in=page_ids).values_list(
+        "pk", "tag_names"
+    )
+    for pk, tag_names in tags:
+        PostSearchEntry.objects.filter(page_id=pk).update(
+            tags=" ".join(tag_names)
+        )
+    bump_generation()
+
+
+def remove_post(page) -> None:
+    """Drops the search entry of an unpublished or deleted post."""
+    PostSearchEntry.objects.filter(page_id=page.pk).delete()
+    bump_generation()
+
+
+def rebuild() -> int:
+    """Rebuilds every search entry from the live posts. Returns the count."""
+    from blog.models import BlogPage
+
+    PostSearchEntry.objects.all().delete()
+    count = 0
+    for page in BlogPage.objects.live():
+        update_post(page)
+        count += 1
+    return count
+
+
+def _search_postgres(query: str) -> list[int]:
+    with connection.cursor() as cursor:
+        cursor.execute(POSTGRES_QUERY, [query, MAX_RESULTS])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_sqlite(query: str) -> list[int]:
+    # Quote every word so user input can't use FTS5 syntax, and match
+    # prefixes so partial words still find something
+    terms = TOKEN_PATTERN.findall(query)
+    if not terms:
+        return []
+    match = " ".join(f'"{term}"*' for term in terms)
+    with connection.cursor() as cursor:
+        cursor.execute(SQLITE_QUERY, [match, MAX_RESULTS])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_fallback(query: str) -> list[int]:
+    from blog.models import BlogPage
+
+    results = BlogPage.objects.live().search(query)[:MAX_RESULTS]
+    return [page.pk for page in results]
+
+
+def _run_search(query: str) -> tuple[str, list[int]]:
+    if connection.vendor == "postgresql":
+        return "postgresql", _search_postgres(query)
+    if connection.vendor == "sqlite":
+        try:
+            return "sqlite", _search_sqlite(query)
+        except DatabaseError:
+            logger.warning("FTS5 search failed, using Wagtail search",
+                           exc_info=True)
+    return "fallback", _search_fallback(query)
+
+
+def run_search(query: str) -> list[int]:
+    """Runs a search against the database, returning ranked BlogPage ids."""
+    started = time.perf_counter()
+    backend, ids = _run_search(query)
+    SEARCH_LATENCY.labels(backend=backend).observe(
+        time.perf_counter() - started
+    )
+    return ids
+
+
+class ResultCache:
+    """A thread-safe LRU of normalized query -> result ids.
+
+    Entries are tagged with the index generation and ignored once the index
+    changes, in this or any other process.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, query: str, generation: int):
+        with self._lock:
+            entry = self._entries.get(query)
+            if entry is None or entry[0] != generation:
+                return None
+            self._entries.move_to_end(query)
+            return entry[1]
+
+    def set(self, query: str, generation: int, ids: list[int]):
+        with self._lock:
+            self._entries[query] = (generation, ids)
+            self._entries.move_to_end(query)
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+results_cache = ResultCache(RESULTS_CACHE_SIZE)
+
+
+def get_generation() -> int:
+    return cache.get_or_set(GENERATION_KEY, 0, None)
+
+
+def bump_generation() -> None:
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+
+
+def search_post_ids(query: str) -> list[int]:
+    """Returns the ids of live posts matching ``query``, best match first."""
+    query = normalize_query(query)
+    if not query:
+        return []
+    generation = get_generation()
+    ids = results_cache.get(query, generation)
+    if ids is None:
+        instrumentation.cache_miss("search")
+        ids = run_search(query)
+        results_cache.set(query, generation, ids)
+    else:
+        instrumentation.cache_hit("search")
+    return ids
+
+
+async def asearch_post_ids(query: str) -> list[int]:
+    """Async ``search_post_ids``, for the async search view."""
+    query = normalize_query(query)
+    if not query:
+        return []
+    generation = await cache.aget_or_set(GENERATION_KEY, 0, None)
+    ids = results_cache.get(query, generation)
+    if ids is None:
+        instrumentation.cache_miss("search")
+        # Django has no async cursor, the raw search runs in a thread
+        ids = await sync_to_async(run_search)(query)
+        results_cache.set(query, generation, ids)
+    else:
+        instrumentation.cache_hit("search")
+    return ids
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from search import index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search entries of all live blog posts."
+
+    def handle(self, *args, **options):
+        count = index.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} blog post(s)."))
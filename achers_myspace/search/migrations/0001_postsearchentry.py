@@ -0,0 +1,29 @@
+# Generated by Django 6.1.2 on 2026-10-17 12:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('blog', '0005_backgroundjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostSearchEntry',
+            fields=[
+                ('page', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_entry', serialize=False, to='blog.blogpage')),
+                ('title', models.TextField()),
+                ('tags', models.TextField(blank=True)),
+                ('body', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'post search entry',
+                'verbose_name_plural': 'post search entries',
+            },
+        ),
+    ]
@@ -0,0 +1,116 @@
+from html import unescape
+
+from django.db import migrations
+from django.utils.html import strip_tags
+
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE search_postsearchentry ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(tags, '')), 'B')
+        || setweight(to_tsvector('english', coalesce(body, '')), 'C')
+    ) STORED
+    """,
+    """
+    CREATE INDEX search_postsearchentry_vector_idx
+    ON search_postsearchentry USING GIN (search_vector)
+    """,
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS search_postsearchentry_vector_idx",
+    "ALTER TABLE search_postsearchentry DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE search_postfts USING fts5(
+        title, tags, body,
+        content='search_postsearchentry',
+        content_rowid='page_id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER search_postfts_insert
+    AFTER INSERT ON search_postsearchentry BEGIN
+        INSERT INTO search_postfts(rowid, title, tags, body)
+        VALUES (new.page_id, new.title, new.tags, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER search_postfts_delete
+    AFTER DELETE ON search_postsearchentry BEGIN
+        INSERT INTO search_postfts(search_postfts, rowid, title, tags, body)
+        VALUES ('delete', old.page_id, old.title, old.tags, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER search_postfts_update
+    AFTER UPDATE ON search_postsearchentry BEGIN
+        INSERT INTO search_postfts(search_postfts, rowid, title, tags, body)
+        VALUES ('delete', old.page_id, old.title, old.tags, old.body);
+        INSERT INTO search_postfts(rowid, title, tags, body)
+        VALUES (new.page_id, new.title, new.tags, new.body);
+    END
+    """,
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS search_postfts_update",
+    "DROP TRIGGER IF EXISTS search_postfts_delete",
+    "DROP TRIGGER IF EXISTS search_postfts_insert",
+    "DROP TABLE IF EXISTS search_postfts",
+]
+
+
+def run_statements(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def create_fulltext_index(apps, schema_editor):
+    run_statements(schema_editor, {
+        "postgresql": POSTGRES_FORWARD,
+        "sqlite": SQLITE_FORWARD,
+    })
+
+
+def drop_fulltext_index(apps, schema_editor):
+    run_statements(schema_editor, {
+        "postgresql": POSTGRES_BACKWARD,
+        "sqlite": SQLITE_BACKWARD,
+    })
+
+
+def index_live_posts(apps, schema_editor):
+    BlogPage = apps.get_model("blog", "BlogPage")
+    BlogPageTag = apps.get_model("blog", "BlogPageTag")
+    PostSearchEntry = apps.get_model("search", "PostSearchEntry")
+
+    tags = {}
+    for page_id, name in BlogPageTag.objects.values_list(
+        "content_object_id", "tag__name"
+    ):
+        tags.setdefault(page_id, []).append(name)
+
+    PostSearchEntry.objects.bulk_create([
+        PostSearchEntry(
+            page_id=page.pk,
+            title=page.title,
+            tags=" ".join(tags.get(page.pk, [])),
+            body=" ".join(unescape(strip_tags(page.body)).split()),
+        )
+        for page in BlogPage.objects.filter(live=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0001_postsearchentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(index_live_posts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import models
+
+
+class PostSearchEntry(models.Model):
+    """The searchable text of a live BlogPage.
+
+    The full-text index on top of this table is created by the migrations:
+    a weighted ``search_vector`` column with a GIN index on PostgreSQL, and
+    the ``search_postfts`` FTS5 table kept in sync by triggers on SQLite.
+    """
+    page = models.OneToOneField(
+        "blog.BlogPage",
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name="search_entry",
+    )
+    title = models.TextField()
+    tags = models.TextField(blank=True)
+    body = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = "post search entry"
+        verbose_name_plural = "post search entries"
+
+    def __str__(self):
+        return self.title
@@ -0,0 +1,20 @@
+from django.dispatch import receiver
+from wagtail.signals import page_published, page_unpublished
+
+from blog.models import BlogPage
+from search import index
+
+
+@receiver(page_published, sender=BlogPage)
+def update_search_on_publish(sender, instance, **kwargs):
+    """Index the published version of a post."""
+    index.update_post(instance)
+
+
+@receiver(page_unpublished, sender=BlogPage)
+def update_search_on_unpublish(sender, instance, **kwargs):
+    """Drop an unpublished post from the index.
+
+    Deleted posts lose their entry through the cascade.
+    """
+    index.remove_post(instance)
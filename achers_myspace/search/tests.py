@@ -0,0 +1,211 @@
+import datetime
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import connection
+from wagtail.models import Page, Site
+from wagtail.test.utils import WagtailPageTestCase
+
+from achers_myspace import instrumentation
+from achers_myspace.testing import QueryBudgetMixin, metric_value
+from blog.models import BlogPage, BlogTag
+from home.models import HomePage
+from search import index
+from search.models import PostSearchEntry
+
+
+class PostSearchTests(QueryBudgetMixin, WagtailPageTestCase):
+    """
+    Tests for the full-text search over blog posts.
+    """
+
+    def setUp(self):
+        cache.clear()
+        index.results_cache.clear()
+        root_page = Page.get_first_root_node()
+        self.homepage = HomePage(title="Home", body="<p>Welcome</p>")
+        root_page.add_child(instance=self.homepage)
+        Site.objects.create(
+            hostname="testsite",
+            root_page=self.homepage,
+            is_default_site=True
+        )
+
+    def add_post(self, title, body="", tags=(), day=1):
+        post = BlogPage(
+            title=title,
+            body=body,
+            date=datetime.date(2024, 1, day),
+            live=False,
+        )
+        self.homepage.add_child(instance=post)
+        post.tags.add(*tags)
+        post.save_revision().publish()
+        post.refresh_from_db()
+        return post
+
+    def test_publish_indexes_title_tags_and_body(self):
+        post = self.add_post(
+            "Tour dates", body="<p>Playing <b>Camden</b> &amp; more</p>",
+            tags=["gigs"],
+        )
+
+        entry = PostSearchEntry.objects.get(page=post)
+        self.assertEqual(entry.title, "Tour dates")
+        self.assertEqual(entry.tags, "gigs")
+        self.assertEqual(entry.body, "Playing Camden & more")
+
+    def test_finds_posts_by_title_tag_and_body(self):
+        post = self.add_post(
+            "Tour dates", body="<p>Playing Camden</p>", tags=["gigs"]
+        )
+
+        for query in ("tour", "GIGS", "camden", "  Tour   Dates "):
+            self.assertEqual(index.search_post_ids(query), [post.pk], query)
+        self.assertEqual(index.search_post_ids("bandcamp"), [])
+
+    def test_renamed_tag_is_found(self):
+        post = self.add_post("News", tags=["gigs"])
+        self.assertEqual(index.search_post_ids("gigs"), [post.pk])
+
+        tag = BlogTag.objects.get(name="gigs")
+        tag.name = "shows"
+        tag.save()
+
+        self.assertEqual(index.search_post_ids("shows"), [post.pk])
+        self.assertEqual(index.search_post_ids("gigs"), [])
+
+    def test_title_matches_rank_first(self):
+        body_match = self.add_post("News", body="<p>New single out</p>")
+        title_match = self.add_post("Single", body="<p>Out now</p>")
+
+        self.assertEqual(
+            index.search_post_ids("single"), [title_match.pk, body_match.pk]
+        )
+
+    def test_matches_word_prefixes(self):
+        post = self.add_post("Recording the album")
+
+        self.assertEqual(index.search_post_ids("record"), [post.pk])
+
+    def test_ignores_query_syntax(self):
+        post = self.add_post("Tour dates")
+
+        self.assertEqual(index.search_post_ids('tour" OR (NEAR'), [])
+        self.assertEqual(index.search_post_ids('"tour"'), [post.pk])
+        self.assertEqual(index.search_post_ids("***"), [])
+
+    def test_unpublish_removes_post(self):
+        post = self.add_post("Tour dates")
+        self.assertEqual(index.search_post_ids("tour"), [post.pk])
+
+        post.unpublish()
+
+        self.assertEqual(index.search_post_ids("tour"), [])
+
+    def test_repeated_query_is_served_from_cache(self):
+        self.add_post("Tour dates")
+        index.search_post_ids("tour")
+
+        with self.assertNumQueries(0):
+            index.search_post_ids("Tour")
+
+    def test_records_search_latency(self):
+        self.add_post("Tour dates")
+        searches = metric_value(
+            index.SEARCH_LATENCY, "count", backend="sqlite"
+        )
+
+        index.search_post_ids("tour")
+        index.search_post_ids("tour")
+
+        self.assertEqual(
+            metric_value(index.SEARCH_LATENCY, "count", backend="sqlite"),
+            searches + 1,
+        )
+
+    def test_publish_invalidates_cached_results(self):
+        first = self.add_post("Tour dates", day=1)
+        self.assertEqual(index.search_post_ids("tour"), [first.pk])
+
+        second = self.add_post("Tour again", day=2)
+
+        self.assertCountEqual(
+            index.search_post_ids("tour"), [first.pk, second.pk]
+        )
+
+    def test_rebuild_indexes_live_posts(self):
+        post = self.add_post("Tour dates")
+        PostSearchEntry.objects.all().delete()
+
+        self.assertEqual(index.rebuild(), 1)
+
+        self.assertEqual(index.search_post_ids("tour"), [post.pk])
+
+    def test_view_paginates_results(self):
+        for day in range(1, 13):
+            self.add_post(f"Tour diary {day}", day=day)
+        first = self.client.get("/search/", {"query": "tour"})
+        cursor = first.context["search_results"].next_cursor
+
+        response = self.client.get("/search/", {"query": "tour", "after": cursor})
+
+        self.assertEqual(response.status_code, 200)
+        results = response.context["search_results"]
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results.total, 12)
+        self.assertFalse(results.has_next())
+        self.assertContains(response, "Tour diary")
+        self.assertContains(response, "Results 11&ndash;12 of 12")
+
+    def test_view_stays_within_query_budget(self):
+        for day in range(1, 13):
+            self.add_post(f"Tour diary {day}", tags=["gigs"], day=day)
+
+        self.assertWithinQueryBudget("/search/", {"query": "tour"})
+
+    async def test_async_view_counts_queries_under_asgi(self):
+        await sync_to_async(self.add_post)("Tour diary")
+        # The test database connection was opened before any middleware was
+        # loaded, so connection_created never installed the query wrapper
+        await sync_to_async(instrumentation.install_query_wrapper)(connection)
+
+        response = await self.async_client.get("/search/", {"query": "tour"})
+
+        self.assertContains(response, "Tour diary")
+        stats = response.request_stats
+        self.assertEqual(stats.label, "search")
+        self.assertGreater(stats.queries, 0)
+        self.assertFalse(stats.over_budget)
+
+    def test_cursor_follows_result_when_ranking_changes(self):
+        posts = [self.add_post(f"Tour diary {day}", day=day)
+                 for day in range(1, 13)]
+        first = self.client.get("/search/", {"query": "tour"})
+        last_shown = first.context["search_results"][-1]
+        cursor = first.context["search_results"].next_cursor
+
+        # A new match ranks first and pushes every result down one place
+        self.add_post("Tour", day=20)
+        response = self.client.get("/search/", {"query": "tour", "after": cursor})
+
+        ids = index.search_post_ids("tour")
+        expected = ids[ids.index(last_shown.pk) + 1:]
+        self.assertEqual(
+            [post.pk for post in response.context["search_results"]], expected
+        )
+        self.assertEqual(len(posts) + 1, len(ids))
+
+    def test_old_page_links_redirect_to_cursor(self):
+        for day in range(1, 13):
+            self.add_post(f"Tour diary {day}", day=day)
+        first = self.client.get("/search/", {"query": "tour"})
+
+        response = self.client.get("/search/", {"query": "tour", "page": 2})
+
+        self.assertRedirects(
+            response,
+            "/search/?query=tour&after="
+            + first.context["search_results"].next_cursor,
+            fetch_redirect_response=False,
+        )
@@ -1,7 +1,14 @@
-from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from urllib.parse import urlencode
+
+from django.shortcuts import redirect
 from django.template.response import TemplateResponse
+from django.urls import reverse
+
+from achers_myspace import pagination
+from home import wall
+from search import index
 
-from wagtail.models import Page
+RESULTS_PER_PAGE = 10
 
 # To enable logging of search queries for use with the "Promoted search results" module
 # <https://docs.wagtail.org/en/stable/reference/contrib/searchpromotions.html>
@@ -11,13 +18,28 @@ from wagtail.models import Page
 # from wagtail.contrib.search_promotions.models import Query
 
 
-def search(request):
+def result_keys(result_ids: list[int]) -> list[tuple]:
+    """Returns the ascending keyset keys, ``(rank, id)``, of ranked results."""
+    return list(enumerate(result_ids))
+
+
+def anchor_cursor(key: tuple | None, result_ids: list[int]) -> tuple | None:
+    """Moves a cursor onto its result if the ranking changed since."""
+    if key is None or len(key) != 2:
+        return None
+    try:
+        return (result_ids.index(key[1]), key[1])
+    except ValueError:
+        return key
+
+
+async def search(request):
     search_query = request.GET.get("query", None)
-    page = request.GET.get("page", 1)
 
-    # Search
+    # Search, the ranked ids are cached per normalized query. The view is
+    # async so a slow search doesn't hold a worker thread under ASGI.
     if search_query:
-        search_results = Page.objects.live().search(search_query)
+        result_ids = await index.asearch_post_ids(search_query)
 
         # To log this query for use with the "Promoted search results" module:
 
@@ -25,16 +47,39 @@ def search(request):
         # query.add_hit()
 
     else:
-        search_results = Page.objects.none()
+        result_ids = []
 
-    # Pagination
-    paginator = Paginator(search_results, 10)
-    try:
-        search_results = paginator.page(page)
-    except PageNotAnInteger:
-        search_results = paginator.page(1)
-    except EmptyPage:
-        search_results = paginator.page(paginator.num_pages)
+    keys = result_keys(result_ids)
+
+    # Old ?page=N links go to the cursor of the same position
+    if "page" in request.GET:
+        params = {"query": search_query or ""}
+        cursor = pagination.page_number_cursor(
+            keys, RESULTS_PER_PAGE, request.GET["page"]
+        )
+        if cursor:
+            params["after"] = cursor
+        return redirect(f"{reverse('search')}?{urlencode(params)}")
+
+    # Keyset pagination over the cached ranking, the total is a lower bound
+    # when the search hit MAX_RESULTS
+    search_results = pagination.paginate_keys(
+        keys,
+        RESULTS_PER_PAGE,
+        after=anchor_cursor(
+            pagination.decode_cursor(request.GET.get("after")), result_ids
+        ),
+        before=anchor_cursor(
+            pagination.decode_cursor(request.GET.get("before")), result_ids
+        ),
+        total=len(result_ids),
+        total_is_estimate=len(result_ids) >= index.MAX_RESULTS,
+    )
+
+    # One bulk fetch for the posts on this page of results
+    search_results.object_list = await wall.afetch_posts(
+        [post_id for _, post_id in search_results.object_list]
+    )
 
     return TemplateResponse(
         request,
@@ -44,3 +89,7 @@ def search(request):
             "search_results": search_results,
         },
     )
+
+
+# Queries a search may run, see achers_myspace.testing
+search.query_budget = 4
@@ -0,0 +1,462 @@
+"""Benchmarks of page serving, search and newsletter rendering.
+
+Seeds a database with generated blog posts, then measures requests/sec and
+latency percentiles of the wall, single posts and search through the full
+Django stack (in this process, with the test client), and of rendering and
+converting newsletters, including long ones with 60 players and images.
+Results are written as JSON named after the commit, so two commits can be
+compared:
+
+    python benchmarks/bench.py seed --posts 2000
+    python benchmarks/bench.py run
+    git checkout other-branch && python benchmarks/bench.py run
+    python benchmarks/bench.py compare benchmarks/results/abc1234.json \\
+        benchmarks/results/def5678.json
+
+The benchmarks use ``benchmarks/bench.sqlite3`` unless
+``ACHERS_DATABASE_URL`` is set, e.g. to a local PostgreSQL database. The
+page cache is off so pages are rendered each time (``--page-cache`` to
+measure cache hits), and MailerLite is replaced by
+``blog.testing.FakeMailerClient``.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from loadtest import print_table, summarize
+
+ROOT = Path(__file__).resolve().parent.parent
+BENCH_DIR = ROOT / "benchmarks"
+RESULTS_DIR = BENCH_DIR / "results"
+
+SLUG_PREFIX = "bench-"
+TAGS = [
+    "gigs", "music", "tour", "studio", "albums", "videos", "press",
+    "berlin", "london", "festivals", "interviews", "news",
+]
+WORDS = (
+    "tour album release gig night crowd stage studio record session "
+    "guitar drums bass vocals song single video festival city venue "
+    "ticket support band friends thanks summer winter rehearsal mix "
+    "master vinyl radio interview review setlist encore road van"
+).split()
+VIDEO_IDS = [f"bench{n:06d}" for n in range(20)]
+ALBUM_IDS = [f"benchalbum{n:012d}" for n in range(10)]
+SEARCH_QUERIES = ["tour", "album release", "berlin festival", "vinyl"]
+
+
+def setup_django(page_cache: bool = False) -> None:
+    """Points the settings at the benchmark database and a stubbed mailer."""
+    sys.path.insert(0, str(ROOT / "achers_myspace"))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "achers_myspace.settings.dev")
+    os.environ.setdefault(
+        "ACHERS_DATABASE_URL", f"sqlite:///{BENCH_DIR / 'bench.sqlite3'}"
+    )
+    # Measured as in production, and nothing leaves the machine
+    os.environ["ACHERS_DEBUG"] = "False"
+    os.environ["ACHERS_MAILER_CLIENT_CLASS"] = "blog.testing.FakeMailerClient"
+    os.environ["ACHERS_MAILER_RATE_LIMIT"] = "0"
+    os.environ["ACHERS_STATIC_EXPORT_ROOT"] = ""
+    if not page_cache:
+        os.environ["ACHERS_PAGE_CACHE_URL"] = "dummycache://"
+
+    import django
+
+    django.setup()
+
+
+# Seeding
+
+def embed_html(url: str) -> str:
+    """Returns the iframe an oEmbed provider would give for ``url``."""
+    if "youtube" in url:
+        video_id = url.rsplit("=", 1)[1]
+        return (
+            f'<iframe width="200" height="113" '
+            f'src="https://www.youtube.com/embed/{video_id}?feature=oembed" '
+            f'frameborder="0" allowfullscreen title="Video {video_id}">'
+            f'</iframe>'
+        )
+    album_id = url.rsplit("/", 1)[1]
+    return (
+        f'<iframe style="border-radius: 12px" width="100%" height="152" '
+        f'title="Spotify Embed: Album {album_id}" frameborder="0" '
+        f'src="https://open.spotify.com/embed/album/{album_id}'
+        f'?utm_source=oembed"></iframe>'
+    )
+
+
+def embed_urls() -> list[str]:
+    return [
+        *(f"https://www.youtube.com/watch?v={id}" for id in VIDEO_IDS),
+        *(f"https://open.spotify.com/album/{id}" for id in ALBUM_IDS),
+    ]
+
+
+def create_embeds() -> None:
+    """Stores the embeds the posts use, so rendering never fetches them."""
+    from wagtail.embeds.embeds import get_embed_hash
+    from wagtail.embeds.models import Embed
+
+    for url in embed_urls():
+        Embed.objects.update_or_create(
+            hash=get_embed_hash(url),
+            defaults={
+                "url": url,
+                "type": "video",
+                "html": embed_html(url),
+                "provider_name": "YouTube" if "youtube" in url else "Spotify",
+            },
+        )
+
+
+def make_body(rng: random.Random) -> str:
+    """Returns the rich text of a post, a few paragraphs and players."""
+    blocks = []
+    for _ in range(rng.randint(2, 8)):
+        words = rng.choices(WORDS, k=rng.randint(15, 70))
+        blocks.append(f"<p>{' '.join(words).capitalize()}.</p>")
+    if rng.random() < 0.3:
+        blocks.insert(1, "<p>[more]</p>")
+    if rng.random() < 0.2:
+        blocks.insert(0, f"<h2>{rng.choice(WORDS).capitalize()}</h2>")
+    for url in rng.sample(embed_urls(), rng.choice([0, 0, 1, 1, 2])):
+        blocks.insert(
+            rng.randint(1, len(blocks)),
+            f'<embed embedtype="media" url="{url}"/>',
+        )
+    return "".join(blocks)
+
+
+def make_long_email(
+    number: int, paragraphs: int = 400, players: int = 60
+) -> str:
+    """Returns the HTML of a long newsletter, paragraphs with players and
+    images spread through them."""
+    urls = embed_urls()
+    every = max(paragraphs // players, 1)
+    parts = []
+    for i in range(paragraphs):
+        parts.append(
+            f'<p>Paragraph {i} of email {number} with <a href="/gigs/">a '
+            f'link</a>, <b>bold</b> text &amp; a few more words.</p>'
+        )
+        if i % every == 0 and i // every < players:
+            if i // every % 3 == 2:
+                parts.append(
+                    f'<p><img src="/media/images/photo{i}.jpg" alt=""></p>'
+                )
+            else:
+                parts.append(embed_html(urls[i // every % len(urls)]))
+    return "\n".join(parts)
+
+
+def seed(count: int, reset: bool = False, random_seed: int = 1) -> int:
+    """Adds ``count`` published posts with tags and embeds to the home page."""
+    from django.core.cache import cache
+    from django.core.management import call_command
+    from django.db import transaction
+    from django.utils import timezone
+    from django.utils.text import slugify
+
+    from achers_myspace import page_cache
+    from blog.models import BlogPage, BlogTag
+    from home.models import HomePage
+    from search import index
+
+    call_command("migrate", verbosity=0)
+    home = HomePage.objects.filter(depth=2).order_by("path").first()
+    if reset:
+        BlogPage.objects.filter(slug__startswith=SLUG_PREFIX).delete()
+        home.refresh_from_db()
+    if home.live_revision_id is None:
+        # The sidebar is cached per revision, as on a home page edited in
+        # the admin
+        home.save_revision().publish()
+    create_embeds()
+    tags = [
+        BlogTag.objects.get_or_create(name=name, slug=slugify(name))[0]
+        for name in TAGS
+    ]
+
+    rng = random.Random(random_seed)
+    start = BlogPage.objects.filter(slug__startswith=SLUG_PREFIX).count()
+    now = timezone.now()
+    for number in range(start, start + count):
+        published = now - datetime.timedelta(hours=number * 7)
+        post = BlogPage(
+            title=f"{' '.join(rng.choices(WORDS, k=4)).capitalize()} {number}",
+            slug=f"{SLUG_PREFIX}{number}",
+            date=published.date(),
+            body=make_body(rng),
+            top=number < 2,
+            live=True,
+            first_published_at=published,
+            last_published_at=published,
+        )
+        post.tags.add(*rng.sample(tags, rng.randint(0, 3)))
+        if (number - start) % 500 == 0:
+            print(f"Seeding posts {number - start + 1}...", file=sys.stderr)
+        with transaction.atomic():
+            home.add_child(instance=post)
+
+    # Posts were saved directly, the publish signals didn't run: drop the
+    # wall index and index the posts for search
+    cache.clear()
+    index.rebuild()
+    page_cache.purge_all()
+    return count
+
+
+# Measuring
+
+class QueryCounter:
+    """Counts the queries run, as an execute wrapper of the connection."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(call, items: list, duration: float) -> dict:
+    """Calls ``call(item)`` on each of ``items`` in turn for ``duration``
+    seconds, after a first round to fill the caches. ``call`` returns
+    whether it succeeded."""
+    from django.db import connection
+
+    for item in items:
+        call(item)
+
+    counter = QueryCounter()
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    deadline = started + duration
+    with connection.execute_wrapper(counter):
+        while time.perf_counter() < deadline or not latencies:
+            item = items[(len(latencies) + errors) % len(items)]
+            call_started = time.perf_counter()
+            ok = call(item)
+            if ok:
+                latencies.append(time.perf_counter() - call_started)
+            else:
+                errors += 1
+    elapsed = time.perf_counter() - started
+
+    calls = len(latencies) + errors
+    return {
+        **summarize(latencies, errors, elapsed),
+        "queries": round(counter.count / calls, 1),
+    }
+
+
+def page_scenarios() -> dict:
+    """Returns the paths of each page serving scenario."""
+    from achers_myspace.static_export import wall_queries
+    from blog.models import BlogPage
+    from home import wall
+    from home.models import HomePage
+
+    home = HomePage.objects.filter(depth=2).order_by("path").first()
+    site = home.get_site()
+    home_path = home.relative_url(site)
+    keys = wall.get_post_keys(home.pk)
+    queries = list(wall_queries(keys, home.posts_per_page))
+    tags = sorted(wall.tag_counts(home.pk).items(), key=lambda t: -t[1])
+    posts = BlogPage.objects.live().child_of(home).order_by("?")[:200]
+
+    return {
+        "wall": [home_path],
+        "wall_tag": [f"{home_path}?tag={tag}" for tag, _ in tags[:3]]
+        or [home_path],
+        # A page half way down the wall, as its "Older posts" links go
+        "wall_deep": [f"{home_path}?{queries[len(queries) // 2]}"]
+        if len(queries) > 1 else [home_path],
+        # Old ?page=N links are answered with a redirect
+        "wall_page_redirect": [f"{home_path}?page={n}" for n in (2, 5, 10)],
+        "post": [post.relative_url(site) for post in posts],
+        "search": [f"/search/?query={query}" for query in SEARCH_QUERIES],
+    }
+
+
+def newsletter_scenarios(limit: int = 200) -> dict:
+    """Returns the calls and items of each newsletter scenario."""
+    from blog import newsletter_batch
+    from blog.email import CONVERTED_CACHE_SIZE, convert_embeds_for_email
+    from blog.models import BlogPage
+    from blog.testing import FakeMailerClient
+
+    posts = list(BlogPage.objects.live().order_by("-date")[:limit])
+    emails = [post.render_newsletter_email() for post in posts]
+    long_emails = [
+        make_long_email(number) for number in range(CONVERTED_CACHE_SIZE + 1)
+    ]
+
+    def send_batch(batch):
+        FakeMailerClient.reset()
+        result = newsletter_batch.send_campaigns(
+            newsletter_batch.post_campaigns(batch), {}
+        )
+        return result["failed"] == 0
+
+    # More distinct emails than blog.email keeps converted, each is converted
+    return {
+        "convert_embeds_for_email": (
+            lambda html: bool(convert_embeds_for_email(html)), emails
+        ),
+        "convert_embeds_for_email_long": (
+            lambda html: bool(convert_embeds_for_email(html)), long_emails
+        ),
+        "get_newsletter_html": (
+            lambda post: bool(post.get_newsletter_html()), posts
+        ),
+        "send_campaigns_10": (
+            send_batch, [posts[start:start + 10] for start in range(0, 50, 10)]
+        ),
+    }
+
+
+def git_commit() -> tuple[str, bool]:
+    def git(*args):
+        return subprocess.run(
+            ["git", *args], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+
+    commit = git("rev-parse", "--short", "HEAD") or "unknown"
+    dirty = bool(git("status", "--porcelain", "--untracked-files=no"))
+    return commit, dirty
+
+
+def run(duration: float, only=None, page_cache: bool = False) -> dict:
+    from django import get_version
+    from django.db import connection
+    from django.test import Client
+
+    from blog.models import BlogPage
+
+    if not BlogPage.objects.live().exists():
+        raise SystemExit("No posts to measure, run the seed command first.")
+
+    client = Client(HTTP_HOST="localhost")
+
+    def get(path):
+        return client.get(path).status_code in (200, 301, 302)
+
+    scenarios = {
+        name: (get, paths)
+        for name, paths in page_scenarios().items()
+    }
+    scenarios.update(newsletter_scenarios())
+
+    results = {}
+    for name, (call, items) in scenarios.items():
+        if only and name not in only:
+            continue
+        print(f"Measuring {name}...", file=sys.stderr)
+        results[name] = measure(call, items, duration)
+
+    commit, dirty = git_commit()
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "created_at": datetime.datetime.now(datetime.UTC).isoformat(),
+        "database": connection.vendor,
+        "posts": BlogPage.objects.live().count(),
+        "page_cache": page_cache,
+        "duration_s": duration,
+        "python": platform.python_version(),
+        "django": get_version(),
+        "results": results,
+    }
+
+
+def compare(base: dict, new: dict) -> None:
+    """Prints the results of two runs side by side with the change."""
+    columns = ["rps", "p50_ms", "p99_ms"]
+    names = [name for name in new["results"] if name in base["results"]]
+    width = max((len(name) for name in names), default=0) + 2
+    print(f"{base['commit']} -> {new['commit']}")
+    print("".ljust(width) + "".join(
+        f"{column} (base/new/change)".rjust(30) for column in columns
+    ))
+    for name in names:
+        cells = []
+        for column in columns:
+            old, value = base["results"][name][column], new["results"][name][column]
+            change = f"{(value - old) / old * 100:+.1f}%" if old else "n/a"
+            cells.append(f"{old} / {value} / {change}".rjust(30))
+        print(name.ljust(width) + "".join(cells))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="Add generated posts.")
+    seed_parser.add_argument("--posts", type=int, default=2000)
+    seed_parser.add_argument(
+        "--reset", action="store_true",
+        help="Delete the posts of earlier seeds first.",
+    )
+    seed_parser.add_argument("--random-seed", type=int, default=1)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks.")
+    run_parser.add_argument("--duration", type=float, default=5,
+                            help="Seconds per scenario.")
+    run_parser.add_argument(
+        "--scenario", action="append", metavar="NAME",
+        help="Only run this scenario, repeat for several.",
+    )
+    run_parser.add_argument(
+        "--page-cache", action="store_true",
+        help="Serve pages from the page cache.",
+    )
+    run_parser.add_argument(
+        "--json", metavar="FILE",
+        help="Where to write the results (default: results/<commit>.json).",
+    )
+
+    compare_parser = commands.add_parser(
+        "compare", help="Compare the results of two runs."
+    )
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+
+    options = parser.parse_args(argv)
+
+    if options.command == "compare":
+        with open(options.base) as f, open(options.new) as g:
+            compare(json.load(f), json.load(g))
+        return 0
+
+    setup_django(page_cache=getattr(options, "page_cache", False))
+    if options.command == "seed":
+        count = seed(options.posts, options.reset, options.random_seed)
+        print(f"Seeded {count} post(s).", file=sys.stderr)
+        return 0
+
+    summary = run(options.duration, options.scenario, options.page_cache)
+    print_table(summary["results"])
+    path = options.json
+    if path is None:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        name = summary["commit"] + ("-dirty" if summary["dirty"] else "")
+        suffix = "-page-cache" if options.page_cache else ""
+        path = RESULTS_DIR / f"{name}{suffix}.json"
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Wrote {path}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""Closed-loop HTTP load test for comparing server setups.
+
+Each of ``--concurrency`` clients requests the given paths in turn for
+``--duration`` seconds, keeping one request in flight at a time. Run it
+against each setup with the same data and arguments, e.g. the WSGI and the
+ASGI gunicorn configuration:
+
+    python benchmarks/loadtest.py \\
+        --target wsgi=http://127.0.0.1:8101 \\
+        --target asgi=http://127.0.0.1:8102 \\
+        --path / --path "/search/?query=tour" --concurrency 32
+
+Only uses the standard library, so it runs anywhere the app does.
+"""
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """Returns the nearest-rank percentile of sorted ``values``."""
+    if not values:
+        return 0.0
+    rank = max(int(round(percent / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def fetch(url: str, timeout: float) -> tuple[int, float]:
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = 0
+    return status, time.perf_counter() - started
+
+
+def run_client(base_url, paths, deadline, timeout, results, lock):
+    latencies, errors, count = [], 0, 0
+    while time.perf_counter() < deadline:
+        path = paths[count % len(paths)]
+        status, elapsed = fetch(base_url + path, timeout)
+        count += 1
+        if 200 <= status < 400:
+            latencies.append(elapsed)
+        else:
+            errors += 1
+    with lock:
+        results["latencies"].extend(latencies)
+        results["errors"] += errors
+
+
+def load_test(base_url: str, paths: list[str], concurrency: int,
+              duration: float, timeout: float = 30) -> dict:
+    """Runs the test against one server and returns its summary."""
+    # Fill the caches first, cold starts aren't what is being compared
+    for path in paths:
+        fetch(base_url + path, timeout)
+
+    results = {"latencies": [], "errors": 0}
+    lock = threading.Lock()
+    started = time.perf_counter()
+    deadline = started + duration
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(run_client, base_url, paths, deadline, timeout,
+                        results, lock)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "url": base_url,
+        "paths": paths,
+        "concurrency": concurrency,
+        **summarize(results["latencies"], results["errors"], elapsed),
+    }
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    """Returns the throughput and latency percentiles of a run."""
+    latencies = sorted(latencies)
+    return {
+        "duration_s": round(elapsed, 2),
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p90_ms": round(percentile(latencies, 90) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3)
+        if latencies else 0.0,
+    }
+
+
+def print_table(summaries: dict) -> None:
+    columns = ["rps", "p50_ms", "p90_ms", "p99_ms", "requests", "errors"]
+    width = max(len(name) for name in summaries) + 2
+    print("".ljust(width) + "".join(column.rjust(10) for column in columns))
+    for name, summary in summaries.items():
+        print(name.ljust(width) + "".join(
+            str(summary[column]).rjust(10) for column in columns
+        ))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--target", action="append", required=True, metavar="NAME=URL",
+        help="Server to test, repeat to compare several.",
+    )
+    parser.add_argument(
+        "--path", action="append", metavar="PATH",
+        help="Path to request, repeat for several (default: /).",
+    )
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20,
+                        help="Seconds per target.")
+    parser.add_argument("--json", metavar="FILE",
+                        help="Also write the summaries to FILE as JSON.")
+    options = parser.parse_args(argv)
+
+    summaries = {}
+    for target in options.target:
+        name, separator, url = target.partition("=")
+        if not separator:
+            name = url = target
+        print(f"Testing {name} ({url})...", file=sys.stderr)
+        summaries[name] = load_test(
+            url.rstrip("/"), options.path or ["/"], options.concurrency,
+            options.duration,
+        )
+
+    print_table(summaries)
+    if options.json:
+        with open(options.json, "w") as f:
+            json.dump(summaries, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())